@@ -0,0 +1,447 @@
+"""
+LLMバックエンド
+GeminiClientが使う生成・ストリーミング・トークン計測の呼び出し先を差し替えられるようにする
+（ネットワークやクォータを使わない負荷試験・UIの計測用に決定的な偽のバックエンドを用意）
+"""
+import hashlib
+import json
+from abc import ABC, abstractmethod
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class LLMBackend(ABC):
+    """バックエンドの共通インターフェース"""
+
+    # モデルプールの資格情報の区別に使う名前
+    name = 'base'
+
+    def configure(self, api_key: str):
+        """
+        APIキーの設定
+
+        Args:
+            api_key: APIキー
+        """
+
+    @abstractmethod
+    def create_model(self, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        """
+        モデルの作成（モデルプールから呼ばれる）
+
+        Args:
+            model_name: モデル名
+            generation_config: 生成設定（temperature, max_output_tokens, response_schema など）
+
+        Returns:
+            generate / stream / count_tokens に渡すモデル
+        """
+
+    @abstractmethod
+    def generate(self, model, prompt: str):
+        """
+        コンテンツを生成
+
+        Args:
+            model: create_modelが返したモデル
+            prompt: プロンプト
+
+        Returns:
+            text, candidates, usage_metadata を持つレスポンス
+        """
+
+    @abstractmethod
+    def stream(self, model, prompt: str):
+        """
+        ストリーミングで生成
+
+        Args:
+            model: create_modelが返したモデル
+            prompt: プロンプト
+
+        Returns:
+            textを持つチャンクを順に返し、全チャンク受信後はgenerateと同じ属性を持つレスポンス
+        """
+
+    @abstractmethod
+    def count_tokens(self, model, text: str) -> int:
+        """
+        トークン数を計測（生成は行わない）
+
+        Args:
+            model: create_modelが返したモデル
+            text: 計測するテキスト
+
+        Returns:
+            トークン数
+        """
+
+    def close_stream(self, response):
+        """
+        ストリーミングの打ち切り（最初のチャンクが届く前でも受信を終わらせる、既定はclose/cancelの呼び出し）
+
+        Args:
+            response: streamが返したレスポンス
+        """
+        for name in ('close', 'cancel'):
+            method = getattr(response, name, None)
+            if callable(method):
+                method()
+                return
+
+    def ping(self, model_name: str):
+        """
+        接続確認（生成は行わない、既定はトークン数の計測）
+
+        Args:
+            model_name: モデル名
+
+        Raises:
+            Exception: 接続・認証に失敗した場合
+        """
+        self.count_tokens(self.create_model(model_name, None), "ping")
+
+
+class GeminiBackend(LLMBackend):
+    """google.generativeai によるバックエンド"""
+
+    name = 'gemini'
+
+    def __init__(self, endpoint: str = ""):
+        """
+        初期化
+
+        Args:
+            endpoint: APIの接続先の上書き（例: http://127.0.0.1:8765、空の場合は本番のAPI）
+        """
+        import google.generativeai as genai
+        self.genai = genai
+        self.endpoint = endpoint
+        if endpoint:
+            self.name = f"gemini@{endpoint}"
+
+    def configure(self, api_key: str):
+        if self.endpoint:
+            # ローカルの代替サーバーなどに接続（HTTPで通信するためRESTを使用）
+            self.genai.configure(
+                api_key=api_key,
+                transport='rest',
+                client_options={'api_endpoint': self.endpoint}
+            )
+        else:
+            self.genai.configure(api_key=api_key)
+
+    def create_model(self, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        if not generation_config:
+            return self.genai.GenerativeModel(model_name)
+        return self.genai.GenerativeModel(
+            model_name,
+            generation_config=self.genai.GenerationConfig(**generation_config)
+        )
+
+    def generate(self, model, prompt: str):
+        return model.generate_content(prompt)
+
+    def stream(self, model, prompt: str):
+        return model.generate_content(prompt, stream=True)
+
+    def count_tokens(self, model, text: str) -> int:
+        return model.count_tokens(text).total_tokens
+
+    def close_stream(self, response):
+        # gRPCのストリームはcancel、RESTはレスポンスの反復子をclose
+        iterator = getattr(response, '_iterator', None)
+        for name in ('cancel', 'close'):
+            method = getattr(iterator, name, None)
+            if callable(method):
+                try:
+                    method()
+                except Exception:
+                    pass  # 受信中の反復子は閉じられない場合がある（次のチャンクで打ち切る）
+                return
+
+    def ping(self, model_name: str):
+        # モデル情報の取得（課金されず、APIキーとモデル名の確認になる）
+        name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+        self.genai.get_model(name)
+
+
+# ========== 偽のバックエンド ==========
+
+class FakeBackendError(Exception):
+    """偽のバックエンドが注入するエラー"""
+
+
+class _FakePart:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeContent:
+    def __init__(self, text: str):
+        self.parts = [_FakePart(text)]
+
+
+class _FakeCandidate:
+    def __init__(self, text: str):
+        self.content = _FakeContent(text)
+
+
+class _FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    """偽のレスポンス（google.generativeai のレスポンスと同じ属性を持つ）"""
+
+    def __init__(self, texts: List[str], prompt_tokens: int, output_tokens: Optional[int] = None):
+        self.candidates = [_FakeCandidate(text) for text in texts]
+        if output_tokens is None:
+            output_tokens = sum(FakeBackend.estimate_tokens(t) for t in texts)
+        self.usage_metadata = _FakeUsage(prompt_tokens, output_tokens)
+
+    @property
+    def text(self) -> str:
+        return self.candidates[0].content.parts[0].text if self.candidates else ""
+
+
+class FakeStream(FakeResponse):
+    """偽のストリーミングレスポンス（反復すると最初のトークンまで待ち、一定の速度でチャンクを返す）"""
+
+    def __init__(
+        self,
+        texts: List[str],
+        prompt_tokens: int,
+        chunk_chars: int,
+        chunk_delay: float,
+        first_token_latency: float = 0.0
+    ):
+        super().__init__(texts, prompt_tokens)
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.first_token_latency = first_token_latency
+        self._closed = threading.Event()
+
+    def close(self):
+        """受信の打ち切り（待機中の反復も終わらせる）"""
+        self._closed.set()
+
+    def __iter__(self) -> Iterator[_FakePart]:
+        text = self.text
+        for start in range(0, len(text), self.chunk_chars):
+            if self._closed.wait(self.chunk_delay if start else self.first_token_latency):
+                raise FakeBackendError("Stream closed (fake backend)")
+            yield _FakePart(text[start:start + self.chunk_chars])
+
+
+class FakeModel:
+    """偽のモデル（モデル名と生成設定のみ保持）"""
+
+    def __init__(self, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or {})
+
+
+# 偽の本文の文を組み立てる語句（シードに応じて組み合わせ、同じ文の繰り返しにならないようにする）
+_FAKE_TIMES = ["夜明け前", "昼下がり", "夕暮れ時", "真夜中", "雨の朝", "月の明るい晩", "祭りの翌日", "冬の初め"]
+_FAKE_PLACES = ["古い図書館", "駅の裏通り", "港の倉庫", "丘の上の教会", "市場の片隅", "屋敷の中庭", "川沿いの小道", "時計塔の下"]
+_FAKE_PEOPLE = ["彼女", "彼", "見知らぬ旅人", "年老いた門番", "幼なじみ", "若い騎士", "店の主人", "双子の姉"]
+_FAKE_ACTIONS = [
+    "小さく息を吐いた",
+    "手元の地図に目を落とした",
+    "聞き覚えのある足音に振り返った",
+    "見たことのない紋章に触れた",
+    "封を切らないままの手紙を握りしめた",
+    "懐かしい歌を口ずさんだ",
+    "静かに扉を閉めた",
+    "遠くの鐘の音に耳を澄ませた"
+]
+
+
+class FakeBackend(LLMBackend):
+    """
+    ネットワークを使わない決定的な偽のバックエンド
+    同じモデル・設定・プロンプトには同じ出力を返し、遅延・処理速度・エラーを設定で再現する
+    """
+
+    name = 'fake'
+
+    def __init__(
+        self,
+        first_token_latency: float = 0.5,
+        chars_per_second: float = 400.0,
+        output_chars: int = 800,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: int = 0
+    ):
+        """
+        初期化
+
+        Args:
+            first_token_latency: 最初のトークンまでの時間（秒）
+            chars_per_second: 出力の速度（文字/秒、0以下は待たない）
+            output_chars: テキスト出力の文字数（max_output_tokensで上限）
+            error_rate: 一時的なサーバーエラー（503）を返す割合
+            throttle_rate: レート制限（429）を返す割合
+            seed: 出力とエラー注入の乱数のシード
+        """
+        self.first_token_latency = first_token_latency
+        self.chars_per_second = chars_per_second
+        self.output_chars = output_chars
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+
+        # 同じリクエストの呼び出し回数（エラー注入の乱数に使う）
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """おおよそのトークン数（日本語1文字≒1トークン、英数字4文字≒1トークン）"""
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+    def create_model(self, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        return FakeModel(model_name, generation_config)
+
+    def generate(self, model, prompt: str):
+        texts = self._respond(model, prompt)
+        self._sleep(self.first_token_latency + self._transfer_seconds(texts[0]))
+        return FakeResponse(texts, self.estimate_tokens(prompt))
+
+    def stream(self, model, prompt: str):
+        texts = self._respond(model, prompt)
+        chunk_chars = 40
+        chunk_delay = self._transfer_seconds('x' * chunk_chars)
+        return FakeStream(texts, self.estimate_tokens(prompt), chunk_chars, chunk_delay, self.first_token_latency)
+
+    def count_tokens(self, model, text: str) -> int:
+        return self.estimate_tokens(text)
+
+    def _respond(self, model: FakeModel, prompt: str) -> List[str]:
+        """エラーの注入と出力の作成"""
+        config = model.generation_config
+        request = hashlib.sha256(
+            f"{model.model_name}:{json.dumps(config, sort_keys=True, default=str)}:{prompt}".encode('utf-8')
+        ).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get(request, 0)
+            self._attempts[request] = attempt + 1
+        # リクエストと何回目かで決まるエラー（並列に呼んでも同じリクエストは同じ回で失敗し、再試行で回復する）
+        roll = random.Random(f"{self.seed}:{request}:{attempt}").random()
+        if roll < self.throttle_rate:
+            raise FakeBackendError("429 Resource exhausted (fake backend)")
+        if roll < self.throttle_rate + self.error_rate:
+            raise FakeBackendError("503 Service unavailable (fake backend)")
+
+        count = max(int(config.get('candidate_count', 1) or 1), 1)
+        return [self._output(model, prompt, index) for index in range(count)]
+
+    def _output(self, model: FakeModel, prompt: str, index: int) -> str:
+        """プロンプトと設定から決まる出力"""
+        config = model.generation_config
+        digest = hashlib.sha256(
+            f"{self.seed}:{model.model_name}:{config.get('temperature')}:{index}:{prompt}".encode('utf-8')
+        ).hexdigest()
+        rng = random.Random(digest)
+
+        if config.get('response_mime_type') == 'application/json' or '形式のJSON' in prompt:
+            return self._json_output(config.get('response_schema'), prompt, rng, digest)
+
+        limit = self.output_chars
+        max_tokens = config.get('max_output_tokens')
+        if max_tokens:
+            limit = min(limit, int(max_tokens))
+        sentences = []
+        length = 0
+        while length < limit:
+            sentence = (
+                f"{rng.choice(_FAKE_TIMES)}、{rng.choice(_FAKE_PLACES)}で"
+                f"{rng.choice(_FAKE_PEOPLE)}は{rng.choice(_FAKE_ACTIONS)}。"
+            )
+            sentences.append(sentence)
+            length += len(sentence)
+            if len(sentences) % 4 == 0:
+                sentences.append("\n\n")
+        return ''.join(sentences).strip()
+
+    @staticmethod
+    def _json_output(schema: Optional[Dict[str, Any]], prompt: str, rng: random.Random, digest: str) -> str:
+        """スキーマ（なければプロンプトの例）に沿ったJSON"""
+        def object_for(properties: List[str], number: int) -> Dict[str, str]:
+            return {
+                field: (f"架空の人物{digest[:4]}{number}" if field == 'name' else f"{field}の説明{rng.randint(1, 999)}")
+                for field in properties
+            }
+
+        if not schema:
+            fields = re.findall(r'"(\w+)":\s*"', prompt)
+            schema = {'type': 'object', 'properties': {field: {} for field in dict.fromkeys(fields)}}
+            if re.search(r'JSON配列', prompt):
+                schema = {'type': 'array', 'items': schema}
+
+        # REST経由のスキーマは型名が大文字（ARRAY / OBJECT）
+        if str(schema.get('type', '')).lower() == 'array':
+            match = re.search(r'(\d+)要素', prompt)
+            count = int(match.group(1)) if match else 1
+            properties = list((schema.get('items') or {}).get('properties', {}))
+            return json.dumps([object_for(properties, i) for i in range(count)], ensure_ascii=False)
+        return json.dumps(object_for(list(schema.get('properties', {})), 0), ensure_ascii=False)
+
+    def _transfer_seconds(self, text: str) -> float:
+        """出力にかかる時間"""
+        if self.chars_per_second <= 0:
+            return 0.0
+        return len(text) / self.chars_per_second
+
+    @staticmethod
+    def _sleep(seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+def create_backend(settings: Optional[Dict[str, Any]] = None) -> LLMBackend:
+    """
+    設定からバックエンドを作成
+
+    Args:
+        settings: Config.get_backend_settings() の値
+
+    Returns:
+        バックエンド
+    """
+    settings = settings or {}
+    cassette = settings.get('cassette') or {}
+    if cassette.get('mode') == 'replay' and cassette.get('path'):
+        # 記録したカセットから応答（ネットワーク不要）
+        from app.core.cassette import ReplayBackend  # 循環インポートを避ける
+        return ReplayBackend(cassette['path'], speed=cassette.get('speed', 1.0))
+
+    backend = _create_base_backend(settings)
+    if cassette.get('mode') == 'record' and cassette.get('path'):
+        from app.core.cassette import RecordingBackend  # 循環インポートを避ける
+        return RecordingBackend(backend, cassette['path'])
+    return backend
+
+
+def _create_base_backend(settings: Dict[str, Any]) -> LLMBackend:
+    """記録・再生を除いたバックエンドを作成"""
+    if settings.get('type') == 'fake':
+        fake = settings.get('fake') or {}
+        return FakeBackend(
+            first_token_latency=fake.get('first_token_latency', 0.5),
+            chars_per_second=fake.get('chars_per_second', 400.0),
+            output_chars=fake.get('output_chars', 800),
+            error_rate=fake.get('error_rate', 0.0),
+            throttle_rate=fake.get('throttle_rate', 0.0),
+            seed=fake.get('seed', 0)
+        )
+    return GeminiBackend(endpoint=settings.get('endpoint', ''))
@@ -0,0 +1,360 @@
+"""
+生成の記録・再生（カセット）
+バックエンドへのリクエストと応答を所要時間ごとJSONLファイルに記録し、
+ネットワークなしで同じ応答を記録時の速度（または倍速）で再生する
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.backends import LLMBackend, FakeModel, FakeResponse
+
+
+class CassetteMissError(Exception):
+    """カセットに記録されていないリクエスト"""
+
+
+class CassetteReplayError(Exception):
+    """記録されたエラーの再生（クラス名は記録時の例外に合わせる）"""
+
+
+def request_key(kind: str, model_name: str, generation_config: Optional[Dict[str, Any]], prompt: str) -> str:
+    """
+    リクエストを識別するキー
+
+    Args:
+        kind: generate（ストリーミングを含む）または count_tokens
+        model_name: モデル名
+        generation_config: 生成設定
+        prompt: プロンプト
+
+    Returns:
+        キー（SHA-256）
+    """
+    data = json.dumps(
+        [kind, model_name, generation_config or {}, prompt],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _response_texts(response) -> List[str]:
+    """レスポンスの全候補のテキスト"""
+    texts = []
+    for candidate in getattr(response, 'candidates', None) or []:
+        parts = getattr(getattr(candidate, 'content', None), 'parts', None) or []
+        texts.append(''.join(getattr(part, 'text', '') for part in parts))
+    if not texts:
+        try:
+            texts.append(response.text)
+        except (ValueError, AttributeError):
+            pass
+    return texts
+
+
+def _response_usage(response) -> Dict[str, Optional[int]]:
+    """レスポンスのトークン数"""
+    usage = getattr(response, 'usage_metadata', None)
+    return {
+        'prompt': getattr(usage, 'prompt_token_count', None) if usage else None,
+        'output': getattr(usage, 'candidates_token_count', None) if usage else None
+    }
+
+
+def _chunk_text(chunk) -> str:
+    """チャンクのテキスト（本文を含まないチャンクは空）"""
+    try:
+        return chunk.text or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+def _error_info(error: Exception) -> Dict[str, str]:
+    """例外の記録"""
+    return {'type': type(error).__name__, 'message': str(error)}
+
+
+class _RecordedModel:
+    """記録用にモデル名と生成設定を保持するモデル"""
+
+    def __init__(self, inner, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        self.inner = inner
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or {})
+
+
+class _RecordingStream:
+    """チャンクを受け取った時刻とともに記録するストリーミングレスポンス"""
+
+    def __init__(self, inner, started: float, on_finished):
+        self._inner = inner
+        self._started = started
+        self._on_finished = on_finished
+
+    def __iter__(self) -> Iterator[Any]:
+        chunks = []
+        try:
+            for chunk in self._inner:
+                chunks.append([round(time.monotonic() - self._started, 4), _chunk_text(chunk)])
+                yield chunk
+        except Exception as e:
+            # 途中までのチャンクとエラーを記録（通信切断の再現用）
+            self._on_finished(chunks, None, e)
+            raise
+        self._on_finished(chunks, self._inner, None)
+
+    def __getattr__(self, name: str):
+        return getattr(self._inner, name)
+
+
+class RecordingBackend(LLMBackend):
+    """別のバックエンドへの呼び出しをカセットに記録するバックエンド"""
+
+    def __init__(self, inner: LLMBackend, path: Path):
+        """
+        初期化
+
+        Args:
+            inner: 実際に呼び出すバックエンド
+            path: カセットファイル（JSONL、追記）
+        """
+        self.inner = inner
+        self.name = f"record:{inner.name}"
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def configure(self, api_key: str):
+        self.inner.configure(api_key)
+
+    def create_model(self, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        return _RecordedModel(self.inner.create_model(model_name, generation_config), model_name, generation_config)
+
+    def generate(self, model, prompt: str):
+        started = time.monotonic()
+        try:
+            response = self.inner.generate(model.inner, prompt)
+        except Exception as e:
+            self._write(model, 'generate', prompt, started, error=e)
+            raise
+        self._write(model, 'generate', prompt, started, response=response)
+        return response
+
+    def stream(self, model, prompt: str):
+        started = time.monotonic()
+        try:
+            response = self.inner.stream(model.inner, prompt)
+        except Exception as e:
+            self._write(model, 'generate', prompt, started, error=e)
+            raise
+
+        def on_finished(chunks, finished_response, error):
+            self._write(model, 'generate', prompt, started, response=finished_response, error=error, chunks=chunks)
+
+        return _RecordingStream(response, started, on_finished)
+
+    def close_stream(self, response):
+        self.inner.close_stream(response._inner)
+
+    def count_tokens(self, model, text: str) -> int:
+        started = time.monotonic()
+        try:
+            tokens = self.inner.count_tokens(model.inner, text)
+        except Exception as e:
+            self._write(model, 'count_tokens', text, started, error=e)
+            raise
+        self._write(model, 'count_tokens', text, started, tokens=tokens)
+        return tokens
+
+    def ping(self, model_name: str):
+        self.inner.ping(model_name)
+
+    def _write(
+        self,
+        model: _RecordedModel,
+        kind: str,
+        prompt: str,
+        started: float,
+        response=None,
+        error: Optional[Exception] = None,
+        chunks: Optional[List[List[Any]]] = None,
+        tokens: Optional[int] = None
+    ):
+        """1件の記録をカセットに追記"""
+        entry = {
+            'key': request_key(kind, model.model_name, model.generation_config, prompt),
+            'kind': kind,
+            'model': model.model_name,
+            'generation_config': model.generation_config,
+            'prompt': prompt,
+            'recorded_at': datetime.now().isoformat(),
+            'elapsed': round(time.monotonic() - started, 4)
+        }
+        if chunks is not None:
+            entry['chunks'] = chunks
+        if response is not None:
+            entry['texts'] = _response_texts(response)
+            entry['usage'] = _response_usage(response)
+        elif chunks:
+            entry['texts'] = [''.join(text for _offset, text in chunks)]
+        if tokens is not None:
+            entry['tokens'] = tokens
+        if error is not None:
+            entry['error'] = _error_info(error)
+
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+        except IOError:
+            pass  # 記録の失敗で生成を止めない
+
+
+class ReplayStream(FakeResponse):
+    """記録時のチャンクと時刻を再生するストリーミングレスポンス"""
+
+    def __init__(self, entry: Dict[str, Any], speed: float, started: float):
+        usage = entry.get('usage') or {}
+        super().__init__(entry.get('texts') or [''], usage.get('prompt') or 0, usage.get('output'))
+        self.entry = entry
+        self.speed = speed
+        self.started = started
+        self._closed = threading.Event()
+
+    def close(self):
+        """再生の打ち切り（待機中の反復も終わらせる）"""
+        self._closed.set()
+
+    def __iter__(self) -> Iterator[Any]:
+        chunks = self.entry.get('chunks')
+        if chunks is None:
+            # 非ストリーミングで記録した応答は1チャンクで返す
+            chunks = [[self.entry.get('elapsed', 0), self.text]]
+        for offset, text in chunks:
+            if _wait_until(self.started, offset, self.speed, self._closed):
+                raise CassetteReplayError("ストリーミングの再生を打ち切りました")
+            yield _ReplayChunk(text)
+        if self.entry.get('error'):
+            _wait_until(self.started, self.entry.get('elapsed', 0), self.speed, self._closed)
+            raise _replayed_error(self.entry)
+
+
+class _ReplayChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def _wait_until(started: float, offset: float, speed: float, closed: Optional[threading.Event] = None) -> bool:
+    """
+    記録時の経過時間（速度の倍率で短縮）まで待つ
+
+    Args:
+        started: 呼び出しの開始時刻
+        offset: 記録時の経過時間（秒）
+        speed: 再生速度の倍率
+        closed: 待機を打ち切るイベント
+
+    Returns:
+        打ち切られたかどうか
+    """
+    if speed > 0:
+        remaining = started + offset / speed - time.monotonic()
+        if remaining > 0:
+            if closed is not None:
+                return closed.wait(remaining)
+            time.sleep(remaining)
+    return closed is not None and closed.is_set()
+
+
+def _replayed_error(entry: Dict[str, Any]) -> Exception:
+    """記録されたエラーを同じクラス名の例外として作成（再試行の判定を記録時と揃える）"""
+    error = entry['error']
+    error_class = type(error.get('type') or 'CassetteReplayError', (CassetteReplayError,), {})
+    return error_class(error.get('message', ''))
+
+
+class ReplayBackend(LLMBackend):
+    """カセットの応答を再生するバックエンド（ネットワークを使わない）"""
+
+    name = 'replay'
+
+    def __init__(self, path: Path, speed: float = 1.0):
+        """
+        初期化
+
+        Args:
+            path: カセットファイル
+            speed: 再生速度の倍率（1.0は記録時と同じ、0は待たない）
+        """
+        self.path = Path(path)
+        self.speed = speed
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {'replayed': 0, 'misses': 0}
+        self._load()
+
+    def _load(self):
+        """カセットの読み込み（同じリクエストの記録は記録順に再生）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 記録中に中断された行
+                    self._entries.setdefault(entry['key'], []).append(entry)
+        except IOError as e:
+            raise Exception(f"カセットの読み込みに失敗しました: {e}")
+
+    def create_model(self, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        return FakeModel(model_name, generation_config)
+
+    def _next(self, kind: str, model: FakeModel, prompt: str) -> Dict[str, Any]:
+        """リクエストに対応する次の記録（記録された回数を超えたら最後の記録を繰り返す）"""
+        key = request_key(kind, model.model_name, model.generation_config, prompt)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.stats['misses'] += 1
+                raise CassetteMissError(f"カセットに記録されていないリクエストです（{kind} / {model.model_name}）")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.stats['replayed'] += 1
+            return entries[min(position, len(entries) - 1)]
+
+    def generate(self, model, prompt: str):
+        started = time.monotonic()
+        entry = self._next('generate', model, prompt)
+        _wait_until(started, entry.get('elapsed', 0), self.speed)
+        if entry.get('error'):
+            raise _replayed_error(entry)
+        usage = entry.get('usage') or {}
+        return FakeResponse(entry.get('texts') or [''], usage.get('prompt') or 0, usage.get('output'))
+
+    def stream(self, model, prompt: str):
+        started = time.monotonic()
+        entry = self._next('generate', model, prompt)
+        if entry.get('error') and not entry.get('chunks'):
+            _wait_until(started, entry.get('elapsed', 0), self.speed)
+            raise _replayed_error(entry)
+        return ReplayStream(entry, self.speed, started)
+
+    def count_tokens(self, model, text: str) -> int:
+        started = time.monotonic()
+        entry = self._next('count_tokens', model, text)
+        _wait_until(started, entry.get('elapsed', 0), self.speed)
+        if entry.get('error'):
+            raise _replayed_error(entry)
+        return entry['tokens']
+
+    def ping(self, model_name: str):
+        pass  # 再生はネットワークを使わない
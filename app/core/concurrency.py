@@ -0,0 +1,204 @@
+"""
+適応的な同時実行数の制御
+一括処理のリクエストの同時実行数を、成功時は加算的に増やし、
+スロットリング（429など）や遅延の急増時は乗算的に減らす（AIMD）
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List
+
+from app.core.model_fallback import is_throttling_error
+
+
+class AdaptiveLimiter:
+    """AIMDによる同時実行数の制御（一括処理の機能で共有する）"""
+
+    def __init__(
+        self,
+        initial_limit: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        decrease_factor: float = 0.5,
+        latency_spike_factor: float = 2.5
+    ):
+        """
+        初期化
+
+        Args:
+            initial_limit: 初期の同時実行数
+            min_limit: 同時実行数の下限
+            max_limit: 同時実行数の上限
+            decrease_factor: スロットリング・遅延急増時に同時実行数へ掛ける係数
+            latency_spike_factor: 平均遅延の何倍を遅延の急増とみなすか
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.latency_spikes = 0
+        # ステージ別の平均遅延（EWMA）と標本数（所要時間の異なるステージを混ぜない）
+        self._latency_avg: Dict[str, float] = {}
+        self._latency_samples: Dict[str, int] = {}
+        self._last_decrease = 0.0
+        self._completions: deque = deque(maxlen=1000)
+        self._condition = threading.Condition()
+
+    def configure(self, max_limit: int):
+        """
+        同時実行数の上限を変更
+
+        Args:
+            max_limit: 同時実行数の上限
+        """
+        with self._condition:
+            self.max_limit = max(max_limit, self.min_limit)
+            self.limit = min(self.limit, self.max_limit)
+            self._condition.notify_all()
+
+    def acquire(self):
+        """実行枠を確保（空きがなければ待つ）"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """
+        空きがある場合だけ実行枠を確保（待たない）
+
+        Returns:
+            確保できたかどうか
+        """
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, seconds: float, error: Exception = None, record: bool = True, stage: str = ''):
+        """
+        実行枠を返却し、結果に応じて同時実行数を調整
+
+        Args:
+            seconds: リクエストの所要時間
+            error: 発生した例外（成功時はNone）
+            record: 結果を同時実行数の調整に使うかどうか（途中で中止した呼び出しはFalse）
+            stage: 処理のステージ（遅延の急増はステージごとの平均遅延と比べる）
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if not record:
+                pass
+            elif error is not None and is_throttling_error(error):
+                self._decrease(stage)
+                self.throttled += 1
+            elif error is None:
+                self._on_success(seconds, stage)
+            self._condition.notify_all()
+
+    def record_throttle(self):
+        """
+        スロットリングを記録（フォールバック等で呼び出し自体は成功した場合）
+        """
+        with self._condition:
+            self._decrease()
+            self.throttled += 1
+            self._condition.notify_all()
+
+    def _on_success(self, seconds: float, stage: str):
+        """成功時の調整（ロック取得済みで呼ぶ）"""
+        self.successes += 1
+        self._completions.append(time.monotonic())
+
+        samples = self._latency_samples.get(stage, 0)
+        average = self._latency_avg.get(stage, seconds)
+        spike = samples >= 5 and seconds > average * self.latency_spike_factor
+        self._latency_samples[stage] = samples + 1
+        self._latency_avg[stage] = seconds if samples == 0 else 0.8 * average + 0.2 * seconds
+
+        if spike:
+            self.latency_spikes += 1
+            self._decrease(stage)
+        else:
+            # 同時実行数ぶん成功するごとにおよそ1増やす
+            self.limit = min(self.limit + 1.0 / self.limit, float(self.max_limit))
+
+    def _decrease(self, stage: str = ''):
+        """乗算的に減らす（同じ混雑で何度も減らさないよう、ステージの平均遅延の間は1回まで）"""
+        now = time.monotonic()
+        if now - self._last_decrease < max(self._latency_avg.get(stage, 0.0), 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.limit * self.decrease_factor, float(self.min_limit))
+
+    @contextmanager
+    def slot(self, stage: str = ''):
+        """実行枠を確保して処理を行う（with文で使用、stageは遅延を比べるステージ）"""
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(time.monotonic() - started, e, stage=stage)
+            raise
+        self.release(time.monotonic() - started, stage=stage)
+
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any], stage: str = '') -> List[Any]:
+        """
+        同時実行数の範囲で関数を並列に適用
+
+        Args:
+            func: 各項目に適用する関数（1回のAPI呼び出しを想定）
+            items: 項目
+            stage: 処理のステージ
+
+        Returns:
+            項目と同じ順の結果（失敗があれば、すべて終わった後に最初の例外を送出）
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        def run(item):
+            with self.slot(stage):
+                return func(item)
+
+        # 実際の同時実行数はslotで制限する
+        with ThreadPoolExecutor(max_workers=min(len(items), self.max_limit)) as executor:
+            futures = [executor.submit(run, item) for item in items]
+
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is not None:
+                raise error
+            results.append(future.result())
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        現在の同時実行数と処理量を取得
+
+        Returns:
+            limit（同時実行数）, in_flight（実行中）, throughput_per_min（直近1分の完了数）,
+            successes, throttled, latency_spikes
+        """
+        now = time.monotonic()
+        with self._condition:
+            recent = sum(1 for completed in self._completions if now - completed <= 60)
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'throughput_per_min': recent,
+                'successes': self.successes,
+                'throttled': self.throttled,
+                'latency_spikes': self.latency_spikes
+            }
@@ -0,0 +1,111 @@
+"""
+要約コンテキスト
+キャラクター・世界観の短い要約をプロジェクトに保存し、元の項目が変わった時だけ作り直す
+"""
+from typing import Any, Callable, Dict, List, Optional
+from app.core.prompt_context import content_hash
+
+
+# 要約の元データに含めないキー
+_EXCLUDED_KEYS = ('id', 'condensed')
+
+
+def summary_source_hash(data: Dict[str, Any]) -> str:
+    """
+    要約の元になる項目の内容ハッシュ
+
+    Args:
+        data: キャラクターまたは世界観のデータ
+
+    Returns:
+        ハッシュ値
+    """
+    source = {key: value for key, value in data.items() if key not in _EXCLUDED_KEYS}
+    return content_hash(source)
+
+
+def get_fresh_summary(data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    元の項目と一致する要約を取得
+
+    Args:
+        data: キャラクターまたは世界観のデータ
+
+    Returns:
+        最新の要約、未作成または古い場合はNone
+    """
+    if not data:
+        return None
+
+    condensed = data.get('condensed')
+    if not isinstance(condensed, dict) or not condensed.get('text'):
+        return None
+    if condensed.get('hash') != summary_source_hash(data):
+        return None
+    return condensed['text']
+
+
+def carry_over_summary(old: Optional[Dict[str, Any]], new: Dict[str, Any]):
+    """
+    元の項目が変わっていなければ、古いデータの要約を新しいデータに引き継ぐ
+
+    Args:
+        old: 更新前のデータ
+        new: 更新後のデータ（その場で更新される）
+    """
+    if not old or 'condensed' in new:
+        return
+    condensed = old.get('condensed')
+    if isinstance(condensed, dict) and condensed.get('hash') == summary_source_hash(new):
+        new['condensed'] = condensed
+
+
+def ensure_summaries(
+    project_manager,
+    characters: List[Dict[str, Any]],
+    summarize: Callable[[str, Dict[str, Any]], str],
+    include_world: bool = True,
+    run_batch: Optional[Callable[[Callable, List[Any]], List[Any]]] = None
+) -> int:
+    """
+    要約が未作成・古いものだけを作成してプロジェクトに保存（保存は1回）
+
+    Args:
+        project_manager: ProjectManager
+        characters: 対象のキャラクター
+        summarize: (kind, data) から要約を作る関数（kind: character / world）
+        include_world: 世界観も対象にするかどうか
+        run_batch: (関数, 項目) を並列に実行する関数（Noneの場合は順に実行）
+
+    Returns:
+        作成した要約の数
+    """
+    targets = [
+        ('character', char) for char in characters
+        if char.get('id') and get_fresh_summary(char) is None
+    ]
+    world = project_manager.get_world_settings()
+    if include_world and world and get_fresh_summary(world) is None:
+        targets.append(('world', world))
+
+    def summarize_target(target):
+        return summarize(*target)
+
+    if run_batch:
+        texts = run_batch(summarize_target, targets)
+    else:
+        texts = [summarize_target(target) for target in targets]
+
+    character_summaries: Dict[str, Dict[str, str]] = {}
+    world_summary = None
+    for (kind, data), text in zip(targets, texts):
+        summary = {'hash': summary_source_hash(data), 'text': text}
+        if kind == 'world':
+            world_summary = summary
+        else:
+            character_summaries[data['id']] = summary
+
+    if character_summaries or world_summary:
+        project_manager.set_condensed_summaries(character_summaries, world_summary)
+
+    return len(character_summaries) + (1 if world_summary else 0)
@@ -0,0 +1,150 @@
+"""
+接続状態の監視
+通信できないエラーが起きたらオフラインとし、軽い接続確認（モデル情報の取得など）を
+間隔を空けながら繰り返して、成功したらオンラインに戻す
+"""
+import threading
+import time
+from typing import Callable, List, Optional
+
+from app.core.model_fallback import is_connectivity_error
+
+
+class OfflineError(ConnectionError):
+    """オフラインのため送信しなかった呼び出し"""
+
+
+class ConnectivityMonitor:
+    """オンライン・オフラインの状態と復帰の確認"""
+
+    def __init__(self, min_interval: float = 5.0, max_interval: float = 120.0, recheck_interval: float = 1.0):
+        """
+        初期化
+
+        Args:
+            min_interval: オフラインになった直後の確認間隔（秒）
+            max_interval: 確認間隔の上限（失敗するたびに2倍にする）
+            recheck_interval: オフライン中の呼び出しで改めて接続を確認する最短の間隔（秒）
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.recheck_interval = recheck_interval
+        self.probe: Optional[Callable[[], bool]] = None
+        self._online = True
+        self._listeners: List[Callable[[bool], None]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_probe = 0.0
+
+    @property
+    def online(self) -> bool:
+        """オンラインかどうか"""
+        return self._online
+
+    def set_probe(self, probe: Callable[[], bool]):
+        """
+        接続確認の関数を設定
+
+        Args:
+            probe: 接続できればTrueを返す関数（生成を行わない軽い呼び出し）
+        """
+        self.probe = probe
+
+    def add_listener(self, listener: Callable[[bool], None]):
+        """
+        状態の変化を通知する関数を追加
+
+        Args:
+            listener: オンラインかどうかを受け取る関数（監視スレッドから呼ばれる場合がある）
+        """
+        self._listeners.append(listener)
+
+    def check(self):
+        """
+        オフラインなら呼び出しを送信しない（直前に確認していなければ接続を確認し直す）
+
+        Raises:
+            OfflineError: オフラインの場合
+        """
+        if self._online:
+            return
+        # 一時的な切断の直後の再開（途中の本文の続きなど）は待たずに送信する
+        if time.monotonic() - self._last_probe >= self.recheck_interval and self.probe_now():
+            return
+        if not self._online:
+            raise OfflineError("オフラインのため送信しませんでした（接続が戻ると再開します）")
+
+    def report_failure(self, error: Exception) -> bool:
+        """
+        呼び出しの失敗を記録（通信できないエラーならオフラインにする）
+
+        Args:
+            error: 発生した例外
+
+        Returns:
+            通信できないエラーだったかどうか
+        """
+        if not is_connectivity_error(error):
+            return False
+        self._set_online(False)
+        return True
+
+    def report_success(self):
+        """呼び出しの成功を記録（オンラインに戻す）"""
+        if not self._online:
+            self._set_online(True)
+
+    def _set_online(self, online: bool):
+        """状態の変更と通知"""
+        with self._lock:
+            if self._online == online:
+                return
+            self._online = online
+            if not online:
+                self._start_probing()
+        for listener in list(self._listeners):
+            try:
+                listener(online)
+            except Exception:
+                pass  # 通知先の失敗で監視を止めない
+
+    def _start_probing(self):
+        """接続確認のスレッドを開始（ロック取得済みで呼ぶ、実行中なら何もしない）"""
+        if self._thread is not None:
+            return
+        self._wakeup.clear()
+        self._thread = threading.Thread(target=self._probe_loop, daemon=True)
+        self._thread.start()
+
+    def _probe_loop(self):
+        """オンラインに戻るまで接続確認を繰り返す"""
+        interval = self.min_interval
+        while True:
+            with self._lock:
+                if self._online:
+                    self._thread = None
+                    return
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            if not self._online and not self.probe_now():
+                interval = min(interval * 2, self.max_interval)
+
+    def probe_now(self) -> bool:
+        """
+        すぐに接続を確認（成功したらオンラインに戻す）
+
+        Returns:
+            接続できたかどうか
+        """
+        probe = self.probe
+        if probe is None:
+            return False
+        self._last_probe = time.monotonic()
+        try:
+            reachable = bool(probe())
+        except Exception:
+            reachable = False
+        if reachable:
+            self._set_online(True)
+        return reachable
@@ -2,45 +2,1191 @@
 Gemini APIクライアント
 物語生成、キャラクター生成、世界観生成を管理
 """
-import google.generativeai as genai
-from typing import Dict, List, Optional, Any
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Tuple, Union
+from app.utils.config import GENERATION_STAGES
+from app.utils.json_repair import extract_json_object, extract_json_array, missing_fields
+from app.utils.character_names import normalize_name
+from app.core.model_pool import ModelPool
+from app.core.prompt_context import PromptContextCache, Stopwatch, content_hash
+from app.core.token_budget import TokenEstimator, TokenBudgeter, ContextSection
+from app.core.condensed_context import get_fresh_summary
+from app.core.hedging import RequestHedger
+from app.core.model_fallback import GenerationResult, ModelHealth, is_retryable_error, is_throttling_error
+from app.core.concurrency import AdaptiveLimiter
+from app.core.scheduler import PriorityScheduler, BACKGROUND
+from app.core.spool import SpoolFile
+from app.core.backends import LLMBackend, GeminiBackend
+from app.core.telemetry import TelemetryStore
+from app.core.connectivity import ConnectivityMonitor
+from app.core.repetition import RepetitionDetector, RepetitionError
+from app.core.usage_budget import UsageBudget
+
+
+# プロンプトのテンプレート部分（指示文）のおおよそのトークン数
+PROMPT_OVERHEAD_TOKENS = 400
+
+# 並列リクエストで複数候補を作る際の温度の変化幅（候補ごとに順に適用）
+CANDIDATE_TEMPERATURE_OFFSETS = [0.0, 0.15, -0.15, 0.3, -0.3, 0.45, -0.45, 0.6]
+MAX_CANDIDATES = len(CANDIDATE_TEMPERATURE_OFFSETS)
+
+# スプールした途中の本文から続きを生成する最大回数（1回の生成あたり）
+MAX_SPOOL_RESUMES = 2
+
+# ストリーミングしない呼び出しの遅延を遅延目標と比べる際の出力の文字数の単位
+SLO_OUTPUT_CHARS = 1000
+
+# キャラクター・世界観のJSON項目
+CHARACTER_FIELDS = [
+    'name', 'personality', 'appearance', 'background',
+    'skills', 'speech', 'relationships', 'goals'
+]
+WORLD_FIELDS = [
+    'name', 'era', 'overview', 'geography',
+    'society', 'special_rules', 'culture', 'history'
+]
+
+
+def _object_schema(fields: List[str]) -> Dict[str, Any]:
+    """全項目が文字列のJSONスキーマを作成"""
+    return {
+        'type': 'object',
+        'properties': {field: {'type': 'string'} for field in fields},
+        'required': list(fields)
+    }
 
 
 class GeminiClient:
     """Gemini APIとの通信を管理するクラス"""
 
-    def __init__(self, api_key: str, model: str = 'gemini-2.0-flash'):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = 'gemini-2.0-flash',
+        generation_profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+        model_pool: Optional[ModelPool] = None,
+        backend: Optional[LLMBackend] = None
+    ):
         """
         初期化
 
         Args:
             api_key: Gemini APIキー
             model: 使用するモデル名
+            generation_profiles: ステージ別の生成プロファイル
+            model_pool: モデルインスタンスのプール（クライアント間で共有可能）
+            backend: 生成の呼び出し先（Noneの場合はGemini API）
         """
-        genai.configure(api_key=api_key)
+        self.backend = backend or GeminiBackend()
+        self.backend.configure(api_key)
         self.model_name = model
         self.model = None
+        self.model_pool = model_pool or ModelPool()
+        # バックエンドが変わった場合もプールのモデルを作り直す
+        self.model_pool.bind_credentials(
+            hashlib.sha256(f"{self.backend.name}:{api_key}".encode()).hexdigest()
+        )
+        self.base_generation_config: Optional[Dict[str, Any]] = None
+        self.generation_profiles: Dict[str, Dict[str, Any]] = {}
+
+        # 構造化出力（JSONモード）に対応していないモデル
+        self.structured_unsupported: set = set()
+        # 1リクエストでの複数候補（candidate_count）に対応していないモデル
+        self.candidate_count_unsupported: set = set()
+        # JSON解析の計測（wasted: 解析できず呼び出しが無駄になった回数）
+        self.json_stats = {
+            'calls': 0,
+            'structured': 0,
+            'tolerant_parsed': 0,
+            'repair_requests': 0,
+            'wasted': 0
+        }
+        self._stats_lock = threading.Lock()
+
+        # プロンプトコンテキストのキャッシュ（プロジェクトの変更通知で破棄）と、ステージ別の通信時間
+        self.context_cache = PromptContextCache()
+        # 変更通知の届かない元データ（ジョブの入力など）を使うスレッド（snapshot_contextで指定）
+        self._snapshot_local = threading.local()
+        # キャラクター・世界観を要約に置き換えて送るかどうか
+        self.condensed_context = False
+        self.network_stats: Dict[str, Dict[str, float]] = {}
+
+        # トークン見積もり・予算と、呼び出しごとの見積もり/実測の記録
+        self.token_estimator = TokenEstimator()
+        self.token_budgeter = TokenBudgeter(self.token_estimator)
+        self.token_reports: deque = deque(maxlen=200)
+        self._pending_budget_reports = threading.local()
+
+        # 最初のトークンが遅いリクエストの重複送信（既定では無効）
+        self.hedger = RequestHedger()
+
+        # フォールバックチェーン（ステージのモデルの後に試すモデル）とステージ別の遅延目標（秒）
+        self.fallback_models: List[str] = []
+        self.latency_slo: Dict[str, float] = {}
+        self.model_health = ModelHealth()
+        # 直近の呼び出しで使用したモデル（スレッドごと）
+        self._last_call = threading.local()
+
+        # 一括処理の同時実行数（AIMD、一括処理の機能で共有）
+        self.limiter = AdaptiveLimiter()
+        # API呼び出しの優先度スケジューラ（既定は画面操作の優先度）
+        self.scheduler = PriorityScheduler()
+        # 呼び出しごとの計測記録の保存先（Noneの場合は記録しない）と、記録するプロジェクト
+        self.telemetry: Optional[TelemetryStore] = None
+        self.project_key: Optional[str] = None
+        # トークン・料金の予算（使い切ると一括処理の呼び出しを実行しない）
+        self.usage_budget: Optional[UsageBudget] = None
+        # 接続状態（オフライン中は送信せず、通信できないエラーでオフラインにする）
+        self.connectivity: Optional[ConnectivityMonitor] = None
+        # ストリーミングしたチャンクの書き出し先（スレッドごと、spool_toで指定）
+        self._spool_local = threading.local()
+        # ストリーミング中の繰り返しの検出（n-gramの文字数、判定する直近の文字数、既出の割合）
+        self.repetition_check: Dict[str, Any] = {'enabled': True, 'ngram': 20, 'window': 300, 'ratio': 0.8}
+
         self._initialize_model()
 
+        if generation_profiles:
+            self.set_generation_profiles(generation_profiles)
+
     def _initialize_model(self):
         """モデルの初期化"""
         try:
-            self.model = genai.GenerativeModel(self.model_name)
+            self.model = self.model_pool.get(self.model_name, None, self._create_model)
         except Exception as e:
             raise Exception(f"モデルの初期化に失敗しました: {e}")
 
-    def test_connection(self) -> bool:
+    def _create_model(self, model_name: str, generation_config: Optional[Dict[str, Any]]):
+        """
+        モデルインスタンスの作成（プールから呼ばれる）
+
+        Args:
+            model_name: モデル名
+            generation_config: GenerationConfigに渡す設定
+
+        Returns:
+            バックエンドのモデル
+        """
+        return self.backend.create_model(model_name, generation_config)
+
+    def test_connection(self, model_names: Optional[List[str]] = None) -> bool:
+        """
+        API接続テスト（モデル情報の取得のみで、生成は行わない）
+
+        Args:
+            model_names: 確認するモデル（Noneの場合は各ステージで使用するモデル）
+
+        Returns:
+            すべてのモデルに接続できたかどうか
+        """
+        return not self.unreachable_models(model_names)
+
+    def stage_model_names(self) -> List[str]:
+        """
+        各ステージで使用するモデル（重複なし）
+
+        Returns:
+            モデル名のリスト
+        """
+        names: List[str] = []
+        for stage in GENERATION_STAGES:
+            name = self._get_stage_model_name(stage)
+            if name not in names:
+                names.append(name)
+        return names
+
+    def unreachable_models(self, model_names: Optional[List[str]] = None) -> List[str]:
+        """
+        接続・認証できないモデル（モデル情報の取得で確認）
+
+        Args:
+            model_names: 確認するモデル（Noneの場合は各ステージで使用するモデル）
+
+        Returns:
+            確認に失敗したモデル名のリスト
+        """
+        failed = []
+        for name in model_names or self.stage_model_names():
+            try:
+                self.backend.ping(name)
+            except Exception:
+                failed.append(name)
+        return failed
+
+    def warm_up(self) -> Optional[float]:
+        """
+        通信の事前準備（トークン数の計測で接続を確立し、最初の生成で接続の確立を待たないようにする）
+
+        Returns:
+            所要時間（秒、失敗した場合はNone）
+        """
+        started = time.monotonic()
+        try:
+            self.backend.count_tokens(self.model, "こんにちは")
+        except Exception:
+            return None
+        return time.monotonic() - started
+
+    def set_generation_profiles(self, profiles: Dict[str, Dict[str, Any]]):
+        """
+        ステージ別生成プロファイルの設定
+
+        Args:
+            profiles: ステージ名をキーとしたプロファイル
+                （model, temperature, max_tokens, top_p、Noneの項目は共通の設定を使用）
+        """
+        self.generation_profiles = {
+            stage: dict(profile)
+            for stage, profile in profiles.items()
+            if stage in GENERATION_STAGES
+        }
+
+    def set_fallback_chain(
+        self,
+        fallback_models: List[str],
+        latency_slo: Optional[Dict[str, float]] = None,
+        cooldown: Optional[float] = None
+    ):
+        """
+        フォールバックチェーンの設定
+
+        Args:
+            fallback_models: ステージのモデルが使えない時に順に試すモデル
+            latency_slo: ステージ別の遅延目標（秒、最初のトークンまで・ストリーミングしない場合は出力1000文字あたり、
+                超えたモデルは一定時間後回し）
+            cooldown: エラー・SLO超過のあったモデルを後回しにする時間（秒）
+        """
+        self.fallback_models = [name for name in fallback_models if name]
+        self.latency_slo = dict(latency_slo or {})
+        if cooldown is not None:
+            self.model_health.cooldown = cooldown
+
+    def _model_chain(self, stage: str) -> List[str]:
+        """ステージのモデルとフォールバックモデルを試す順に並べる"""
+        chain = []
+        for name in [self._get_stage_model_name(stage)] + self.fallback_models:
+            if name not in chain:
+                chain.append(name)
+        return self.model_health.order(chain)
+
+    def _get_stage_model_name(self, stage: str) -> str:
+        """ステージで使用するモデル名を取得"""
+        profile = self.generation_profiles.get(stage) or {}
+        return profile.get('model') or self.model_name
+
+    def _get_stage_generation_config(self, stage: str) -> Dict[str, Any]:
+        """ステージの生成設定（共通の設定をプロファイルの指定項目で上書き）"""
+        generation_config = dict(self.base_generation_config or {})
+        profile = self.generation_profiles.get(stage) or {}
+        for key, config_key in (('temperature', 'temperature'), ('max_tokens', 'max_output_tokens'), ('top_p', 'top_p')):
+            if profile.get(key) is not None:
+                generation_config[config_key] = profile[key]
+        return generation_config
+
+    def _get_model(
+        self,
+        stage: str,
+        overrides: Optional[Dict[str, Any]] = None,
+        model_name: Optional[str] = None
+    ):
+        """
+        ステージに対応するモデルを取得
+
+        Args:
+            stage: 生成ステージ
+            overrides: 生成設定の上書き（JSONモードなど）
+            model_name: 使用するモデル名（フォールバック時、Noneの場合はステージのモデル）
+
+        Returns:
+            共通の設定をプロファイルで上書きした設定のモデル
+        """
+        model_name = model_name or self._get_stage_model_name(stage)
+        generation_config = self._get_stage_generation_config(stage)
+        if not overrides and model_name == self.model_name and generation_config == (self.base_generation_config or {}):
+            return self.model
+
+        if overrides:
+            generation_config.update(overrides)
+
+        return self.model_pool.get(model_name, generation_config, self._create_model)
+
+    def _generate(
+        self,
+        stage: str,
+        prompt: str,
+        overrides: Optional[Dict[str, Any]] = None,
+        spool: Optional[SpoolFile] = None,
+        detect_repetition: bool = False
+    ):
+        """
+        ステージのプロファイルでコンテンツを生成
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+            overrides: 生成設定の上書き
+            spool: ストリーミングしたチャンクの書き出し先
+            detect_repetition: スプールなしのストリーミングでも繰り返しを検出するかどうか（本文の生成のみ）
+
+        Returns:
+            APIのレスポンス（使用したモデル名は _last_call.model に記録）
+        """
+        # 複数候補はストリーミングできないためヘッジしない
+        multiple = bool(overrides and 'candidate_count' in overrides)
+        background = self.scheduler.current_priority() >= BACKGROUND
+        if background and self.usage_budget:
+            # 予算を使い切った後は一括処理を実行しない（画面操作の呼び出しは警告のみ）
+            self.usage_budget.check_background()
+        if self.connectivity:
+            self.connectivity.check()
+
+        cache_hits, cache_misses = self.context_cache.take_thread_counts()
+        telemetry = {
+            'project': self.project_key,
+            'stage': stage,
+            'priority': 'background' if background else 'interactive',
+            'prompt_chars': len(prompt),
+            'cache_hits': cache_hits,
+            'cache_misses': cache_misses,
+            'streamed': bool(spool) or (self.hedger.enabled and not multiple)
+        }
+
+        # 優先度順に実行枠を確保（画面操作の呼び出しが一括処理より先）
+        queued_at = time.monotonic()
+        with self.scheduler.slot():
+            started = time.monotonic()
+            telemetry['queue_ms'] = (started - queued_at) * 1000
+            last_error = None
+            retries = 0
+            for model_name in self._model_chain(stage):
+                model = self._get_model(stage, overrides, model_name)
+                spooled_before = spool.size() if spool else 0
+                # ストリーミング時の最初のチャンクの到着時刻
+                first_token: Dict[str, float] = {}
+                attempt_started = time.monotonic()
+                try:
+                    with Stopwatch() as watch:
+                        if spool and self.hedger.enabled:
+                            response = self._hedged_stream(stage, model_name, model, prompt, first_token, telemetry, spool)
+                        elif spool:
+                            response = self._stream_to_spool(model, prompt, spool, first_token)
+                        elif self.hedger.enabled and not multiple:
+                            response = self._hedged_stream(
+                                stage, model_name, model, prompt, first_token, telemetry,
+                                detect_repetition=detect_repetition
+                            )
+                        else:
+                            response = self.backend.generate(model, prompt)
+                except Exception as e:
+                    if isinstance(e, RepetitionError) or (self.connectivity and self.connectivity.report_failure(e)):
+                        # 繰り返しの打ち切り・接続できない場合は別のモデルで最初から生成し直さず、モデルの失敗として数えない
+                        self._record_telemetry(telemetry, started, model_name, retries, error=e)
+                        raise
+                    retryable = is_retryable_error(e)
+                    self.model_health.record_error(model_name, retryable)
+                    if is_throttling_error(e):
+                        self.limiter.record_throttle()
+                    stop = not retryable or (spool and spool.size() > spooled_before)
+                    if stop:
+                        # 途中まで書き出した場合は同じプロンプトで最初から生成し直さず、続きから再開させる
+                        self._record_telemetry(telemetry, started, model_name, retries, error=e)
+                        raise
+                    # 過負荷・タイムアウトは次のモデルで再試行
+                    last_error = e
+                    retries += 1
+                    continue
+
+                self.model_health.record_success(
+                    model_name,
+                    watch.seconds,
+                    self.latency_slo.get(stage, 0),
+                    slo_seconds=self._slo_seconds(watch.seconds, first_token, attempt_started, response)
+                )
+                if self.connectivity:
+                    self.connectivity.report_success()
+                self._last_call.model = model_name
+                self._record_network_time(stage, watch.seconds)
+                self._record_token_report(stage, prompt, response)
+                self._record_usage(prompt, response)
+                if 'at' in first_token:
+                    telemetry['ttft_ms'] = (first_token['at'] - attempt_started) * 1000
+                self._record_telemetry(telemetry, started, model_name, retries, response=response)
+                return response
+
+            self._record_telemetry(telemetry, started, None, retries - 1, error=last_error)
+            raise last_error
+
+    def _slo_seconds(self, seconds: float, first_token: Dict[str, float], attempt_started: float, response) -> float:
+        """
+        遅延目標と比べる時間（長い出力の生成時間でモデルを後回しにしない）
+
+        Args:
+            seconds: 呼び出しの所要時間
+            first_token: 最初のチャンクの到着時刻（ストリーミングした場合は'at'）
+            attempt_started: 呼び出しの開始時刻
+            response: APIのレスポンス
+
+        Returns:
+            ストリーミングした場合は最初のトークンまでの時間、
+            しない場合は出力SLO_OUTPUT_CHARS文字あたりの時間（短い出力はそのままの時間）
+        """
+        if 'at' in first_token:
+            return first_token['at'] - attempt_started
+        try:
+            output_chars = len(response.text)
+        except (ValueError, AttributeError):
+            output_chars = max((len(text) for text in self._candidate_texts(response)), default=0)
+        return seconds / max(output_chars / SLO_OUTPUT_CHARS, 1.0)
+
+    def _record_usage(self, prompt: str, response):
+        """予算の使用量を加算（トークン数が返らない場合は見積もり）"""
+        if not self.usage_budget:
+            return
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) if usage else None
+        output_tokens = getattr(usage, 'candidates_token_count', None) if usage else None
+        if prompt_tokens is None:
+            prompt_tokens = self.token_estimator.estimate(prompt)
+        if output_tokens is None:
+            try:
+                output_tokens = self.token_estimator.estimate(response.text)
+            except (ValueError, AttributeError):
+                output_tokens = 0
+        self.usage_budget.record(prompt_tokens, output_tokens)
+
+    def _record_telemetry(
+        self,
+        telemetry: Dict[str, Any],
+        started: float,
+        model_name: Optional[str],
+        retries: int,
+        response=None,
+        error: Optional[Exception] = None
+    ):
+        """呼び出しの計測記録を保存（記録の失敗で生成を止めない）"""
+        if not self.telemetry:
+            return
+
+        record = dict(telemetry, model=model_name, retries=max(retries, 0))
+        record['latency_ms'] = (time.monotonic() - started) * 1000
+        if error is not None:
+            record['status'] = 'error'
+            record['error'] = f"{type(error).__name__}: {error}"[:500]
+        if response is not None:
+            usage = getattr(response, 'usage_metadata', None)
+            record['prompt_tokens'] = getattr(usage, 'prompt_token_count', None) if usage else None
+            record['output_tokens'] = getattr(usage, 'candidates_token_count', None) if usage else None
+            try:
+                record['output_chars'] = len(response.text)
+            except (ValueError, AttributeError):
+                record['output_chars'] = sum(len(text) for text in self._candidate_texts(response))
+
+        try:
+            self.telemetry.record(**record)
+        except Exception:
+            pass
+
+    def _result(self, text: str, stage: str) -> GenerationResult:
+        """直近の呼び出しで使用したモデル名を付けた生成結果を作成"""
+        return GenerationResult(text, model=getattr(self._last_call, 'model', None), stage=stage)
+
+    def run_batch(self, func, items: List[Any], stage: str = 'summary') -> List[Any]:
+        """
+        一括処理を共有の適応的な同時実行数で並列に実行
+
+        Args:
+            func: 各項目に適用する関数（1回のAPI呼び出しを想定）
+            items: 項目
+            stage: 処理のステージ（既定は要約、遅延の急増の判定に使用）
+
+        Returns:
+            項目と同じ順の結果
+        """
+        # 呼び出し元の優先度をワーカースレッドに引き継ぐ
+        priority = self.scheduler.current_priority()
+
+        def run(item):
+            with self.scheduler.priority(priority):
+                return func(item)
+
+        return self.limiter.map(run, items, stage)
+
+    def background(self):
+        """
+        このスレッドの呼び出しを一括処理（低優先度）として実行する（with文で使用）
+
+        Returns:
+            コンテキストマネージャ
+        """
+        return self.scheduler.priority(BACKGROUND)
+
+    @contextmanager
+    def snapshot_context(self):
+        """
+        このスレッドの生成では、コンテキストの元データを内容で識別してキャッシュする（with文で使用）
+        ジョブの入力など、開いているプロジェクトの変更通知が届かないデータに使う
+        """
+        previous = getattr(self._snapshot_local, 'active', False)
+        self._snapshot_local.active = True
+        try:
+            yield
+        finally:
+            self._snapshot_local.active = previous
+
+    def _context_cache_id(self, data: Any, item_id: str = '') -> str:
+        """
+        コンテキストキャッシュでの元データの識別子
+
+        Args:
+            data: 元データ
+            item_id: 開いているプロジェクトでの識別子（キャラクターID、種類に1つだけの場合は空）
+
+        Returns:
+            識別子（snapshot_context内・IDのない保存前のキャラクターは内容ハッシュ）
+        """
+        if getattr(self._snapshot_local, 'active', False):
+            return content_hash(data)
+        return item_id
+
+    def get_model_stats(self) -> Dict[str, Dict[str, Any]]:
         """
-        API接続テスト
+        モデル別のエラー・遅延の統計を取得
 
         Returns:
-            接続成功かどうか
+            モデル名をキーとした統計
+        """
+        return self.model_health.get_stats()
+
+    def _hedged_stream(
+        self,
+        stage: str,
+        model_name: str,
+        model,
+        prompt: str,
+        first_token: Dict[str, float],
+        telemetry: Dict[str, Any],
+        spool: Optional[SpoolFile] = None,
+        detect_repetition: bool = False
+    ):
         """
+        ストリーミングで生成し、最初のトークンが遅ければ重複リクエストを送る
+
+        Args:
+            stage: 生成ステージ
+            model_name: モデル名
+            model: バックエンドのモデル
+            prompt: プロンプト
+            first_token: 最初のチャンクの到着時刻の記録先（'at'、元・重複リクエストの早い方）
+            telemetry: 計測記録の共通項目（採用しなかった呼び出しの記録に使う）
+            spool: チャンクの書き出し先（先にチャンクが届いた呼び出しだけが書き出し、他方は中止する）
+            detect_repetition: スプールなしの場合も繰り返しを検出するかどうか
+
+        Returns:
+            採用した呼び出しのレスポンス（全チャンク受信済み）
+
+        Raises:
+            RepetitionError: 繰り返しを検出した場合（スプールなしの場合は繰り返しの前までの本文を持つ）
+        """
+        # 呼び出しごとに受信した本文（採用しなかった呼び出しの使用量の見積もりに使う）
+        received: Dict[int, List[str]] = {}
+        priority = self.scheduler.current_priority()
+
+        def call(attempt):
+            chunks = received.setdefault(attempt.index, [])
+            if spool is not None:
+                return self._stream_to_spool(model, prompt, spool, first_token, attempt, chunks)
+            detector = self._repetition_detector() if detect_repetition else None
+            response = self.backend.stream(model, prompt)
+            # 中止されたらストリームを閉じる（最初のトークンの前でも待ち続けない）
+            attempt.on_cancel(lambda: self.backend.close_stream(response))
+            for chunk in response:
+                first_token.setdefault('at', time.monotonic())
+                attempt.first_token()
+                if attempt.cancelled.is_set():
+                    return None
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue  # 本文を含まないチャンク
+                chunks.append(text)
+                if detector and detector.feed(text):
+                    # 残りを受け取らずに打ち切る（他方の呼び出しがあればそちらの完了を待つ）
+                    self.backend.close_stream(response)
+                    clean_length = detector.clean_length()
+                    raise RepetitionError(clean_length, detector.length - clean_length, "".join(chunks)[:clean_length])
+            return response
+
+        # 採用しなかった呼び出しは、採用した呼び出しのプロンプトのトークン数で記録する（同じプロンプトのため）
+        discarded: List[Tuple[Any, Any]] = []
+        accounting = {'done': False, 'prompt_tokens': None}
+        accounting_lock = threading.Lock()
+
+        def record_discarded(attempt, response):
+            self._record_discarded_attempt(
+                telemetry, model_name, prompt, response,
+                "".join(received.get(attempt.index, [])), accounting['prompt_tokens']
+            )
+
+        def discard(attempt, response):
+            with accounting_lock:
+                if not accounting['done']:
+                    discarded.append((attempt, response))
+                    return
+            record_discarded(attempt, response)
+
         try:
-            response = self.model.generate_content("こんにちは")
-            return response.text is not None
+            result = self.hedger.run(stage, call, acquire_extra=lambda: self._acquire_hedge_slot(priority), discard=discard)
+            usage = getattr(result, 'usage_metadata', None)
+            accounting['prompt_tokens'] = getattr(usage, 'prompt_token_count', None) if usage else None
+            return result
+        finally:
+            with accounting_lock:
+                accounting['done'] = True
+                pending, discarded[:] = list(discarded), []
+            for attempt, response in pending:
+                record_discarded(attempt, response)
+
+    def _acquire_hedge_slot(self, priority: int):
+        """
+        重複リクエストの実行枠を確保（スケジューラ、一括処理は同時実行数の枠も使う）
+
+        Args:
+            priority: 元のリクエストの優先度
+
+        Returns:
+            実行枠を返却する関数、空きがない場合はNone
+        """
+        level = self.scheduler.try_acquire(priority)
+        if level is None:
+            return None
+        if priority < BACKGROUND:
+            return lambda: self.scheduler.release(level)
+        if not self.limiter.try_acquire():
+            self.scheduler.release(level)
+            return None
+
+        def release():
+            # 中止した呼び出しの所要時間は同時実行数の調整に使わない
+            self.limiter.release(0.0, record=False)
+            self.scheduler.release(level)
+        return release
+
+    def _record_discarded_attempt(
+        self,
+        telemetry: Dict[str, Any],
+        model_name: str,
+        prompt: str,
+        response,
+        received_text: str,
+        prompt_tokens: Optional[int] = None
+    ):
+        """
+        採用しなかった重複・元のリクエストの使用量を予算と計測記録に加える（中止してもプロンプトは課金される）
+
+        Args:
+            telemetry: 計測記録の共通項目
+            model_name: モデル名
+            prompt: プロンプト
+            response: 完了していればそのレスポンス（中止した場合はNone）
+            received_text: 受信した本文
+            prompt_tokens: 採用した呼び出しのプロンプトのトークン数（レスポンスにない場合に使う）
+        """
+        usage = getattr(response, 'usage_metadata', None) if response is not None else None
+        if getattr(usage, 'prompt_token_count', None) is not None:
+            prompt_tokens = usage.prompt_token_count
+        output_tokens = getattr(usage, 'candidates_token_count', None) if usage else None
+        if prompt_tokens is None:
+            prompt_tokens = self.token_estimator.estimate(prompt)
+        if output_tokens is None:
+            output_tokens = self.token_estimator.estimate(received_text) if received_text else 0
+        if self.usage_budget:
+            self.usage_budget.record(prompt_tokens, output_tokens)
+        if not self.telemetry:
+            return
+        record = dict(
+            telemetry,
+            model=model_name,
+            status='cancelled',
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            output_chars=len(received_text)
+        )
+        try:
+            self.telemetry.record(**record)
         except Exception:
-            return False
+            pass
+
+    def _stream_to_spool(
+        self,
+        model,
+        prompt: str,
+        spool: SpoolFile,
+        first_token: Optional[Dict[str, float]] = None,
+        attempt=None,
+        received: Optional[List[str]] = None
+    ):
+        """
+        ストリーミングで生成し、届いたチャンクを順にスプールへ書き出す
+
+        Args:
+            model: バックエンドのモデル
+            prompt: プロンプト
+            spool: 書き出し先
+            first_token: 最初のチャンクの到着時刻の記録先（'at'）
+            attempt: ヘッジの呼び出し（最初のチャンクで採用を確定できた場合だけ書き出す）
+            received: 受信した本文の記録先
+
+        Returns:
+            APIのレスポンス（全チャンク受信済み、ヘッジで採用されなかった場合はNone）
+
+        Raises:
+            RepetitionError: 同じ本文の繰り返しを検出した場合（スプールは繰り返しの前までに切り詰める）
+        """
+        detector = self._repetition_detector()
+        if detector:
+            # 途中の本文の繰り返しも検出するため、既に書き出した本文から数える
+            detector.feed(spool.read())
+
+        response = self.backend.stream(model, prompt)
+        if attempt is not None:
+            attempt.on_cancel(lambda: self.backend.close_stream(response))
+        for chunk in response:
+            if first_token is not None:
+                first_token.setdefault('at', time.monotonic())
+            try:
+                text = chunk.text
+            except ValueError:
+                text = ""  # 本文を含まないチャンク（終了理由のみなど）
+            if received is not None:
+                received.append(text)
+            if attempt is not None:
+                attempt.first_token()
+                # 先にチャンクが届いた方だけが書き出す（他方は中止され、受信分は捨てる）
+                if not attempt.claim():
+                    return None
+            spool.write(text)
+            if detector and detector.feed(text):
+                # 残りのチャンクを受け取らずに打ち切る
+                clean_length = detector.clean_length()
+                spool.truncate(clean_length)
+                raise RepetitionError(clean_length, detector.length - clean_length)
+        return response
+
+    def _repetition_detector(self) -> Optional[RepetitionDetector]:
+        """設定に沿った繰り返しの検出（無効の場合はNone）"""
+        if not self.repetition_check.get('enabled'):
+            return None
+        return RepetitionDetector(
+            self.repetition_check.get('ngram', 20),
+            self.repetition_check.get('window', 300),
+            self.repetition_check.get('ratio', 0.8)
+        )
+
+    @contextmanager
+    def spool_to(self, spool: SpoolFile):
+        """
+        このスレッドで行うテキスト生成をストリーミングにし、チャンクをスプールへ書き出す（with文で使用）
+        スプールに同じキーの途中の本文があれば、その続きから生成する
+
+        Args:
+            spool: 書き出し先（完了後の削除は呼び出し元で行う）
+        """
+        previous = getattr(self._spool_local, 'spool', None)
+        self._spool_local.spool = spool
+        try:
+            yield spool
+        finally:
+            self._spool_local.spool = previous
+            spool.close()
+
+    def _generate_spooled(self, stage: str, prompt: str, spool: SpoolFile) -> GenerationResult:
+        """
+        スプールに書き出しながらテキストを生成
+        （途中で失敗したら書き出した本文の続きから、繰り返しを検出したら繰り返しの前から再開）
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+            spool: 書き出し先
+
+        Returns:
+            途中の本文と続きをつないだテキスト
+        """
+        for attempt in range(MAX_SPOOL_RESUMES + 1):
+            partial = spool.read()
+            request = self._continuation_prompt(prompt, partial) if partial.strip() else prompt
+            try:
+                self._generate(stage, request, spool=spool)
+                break
+            except RepetitionError:
+                # 繰り返しの前までの本文から続きを生成し直す（回数切れなら繰り返しの前までを結果とする）
+                if attempt >= MAX_SPOOL_RESUMES:
+                    if not spool.read().strip():
+                        raise
+                    break
+            except Exception:
+                # 本文が増えていれば続きから再開できる（増えていない・回数切れならそのまま失敗）
+                if attempt >= MAX_SPOOL_RESUMES or spool.size() <= len(partial):
+                    raise
+        return self._result(spool.read().strip(), stage)
+
+    def _generate_unspooled(self, stage: str, prompt: str) -> GenerationResult:
+        """
+        スプールなしでテキストを生成
+        （ストリーミング中に繰り返しを検出したら、繰り返しの前までの本文から続きを生成し直す）
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+
+        Returns:
+            生成されたテキスト
+        """
+        text = ""
+        for attempt in range(MAX_SPOOL_RESUMES + 1):
+            request = self._continuation_prompt(prompt, text) if text.strip() else prompt
+            try:
+                text += self._generate(stage, request, detect_repetition=True).text
+                break
+            except RepetitionError as e:
+                text += e.text
+                # 回数切れなら繰り返しの前までを結果とする
+                if attempt >= MAX_SPOOL_RESUMES:
+                    if not text.strip():
+                        raise
+                    break
+        return self._result(text.strip(), stage)
+
+    @staticmethod
+    def _continuation_prompt(prompt: str, partial: str) -> str:
+        """
+        途中まで生成された本文の続きを書かせるプロンプト
+
+        Args:
+            prompt: 元のプロンプト
+            partial: 途中までの本文
+
+        Returns:
+            プロンプト
+        """
+        return f"""{prompt}
+
+【途中まで書かれた本文】
+{partial}
+
+上の本文は生成の途中で中断されました。中断された箇所の直後から続きを書いてください。
+既に書かれた部分は繰り返さず、続きの本文のみを出力してください。
+"""
+
+    def _record_token_report(self, stage: str, prompt: str, response):
+        """見積もりトークン数と実際のトークン数を記録し、見積もりを補正"""
+        estimated = self.token_estimator.estimate(prompt)
+        usage = getattr(response, 'usage_metadata', None)
+        actual = getattr(usage, 'prompt_token_count', None) if usage else None
+
+        report = {'stage': stage, 'estimated': estimated, 'actual': actual}
+        budget_report = getattr(self._pending_budget_reports, 'report', None)
+        if budget_report:
+            report.update(budget_report)
+            self._pending_budget_reports.report = None
+
+        with self._stats_lock:
+            self.token_reports.append(report)
+
+        if actual:
+            self.token_estimator.calibrate(prompt, actual)
+
+    def get_token_reports(self) -> List[Dict[str, Any]]:
+        """
+        呼び出しごとのトークン記録を取得
+
+        Returns:
+            stage, estimated（見積もり）, actual（実測、取得できない場合None）,
+            budget, abbreviated, dropped を含む記録のリスト
+        """
+        with self._stats_lock:
+            return list(self.token_reports)
+
+    def _record_network_time(self, stage: str, seconds: float):
+        """ステージ別の通信時間を記録"""
+        with self._stats_lock:
+            stats = self.network_stats.setdefault(stage, {'count': 0, 'seconds': 0.0})
+            stats['count'] += 1
+            stats['seconds'] += seconds
+
+    def get_timing_stats(self) -> Dict[str, Any]:
+        """
+        コンテキスト組み立て時間と通信時間を分けて取得
+
+        Returns:
+            context: コンテキストキャッシュの統計
+            network: ステージ別の呼び出し回数・平均通信時間（ミリ秒）
+            hedging: ヘッジリクエストの統計
+            concurrency: 一括処理の同時実行数と処理量
+            scheduler: 優先度別の待ち時間
+        """
+        with self._stats_lock:
+            network = {
+                stage: {
+                    'count': stats['count'],
+                    'avg_ms': stats['seconds'] / stats['count'] * 1000 if stats['count'] else 0.0
+                }
+                for stage, stats in self.network_stats.items()
+            }
+        return {
+            'context': self.context_cache.get_stats(),
+            'network': network,
+            'hedging': self.hedger.get_stats(),
+            'concurrency': self.limiter.get_stats(),
+            'scheduler': self.scheduler.get_stats()
+        }
+
+    def _count_json_stat(self, key: str):
+        """JSON解析の計測値を加算"""
+        with self._stats_lock:
+            self.json_stats[key] += 1
+
+    def get_json_stats(self) -> Dict[str, Any]:
+        """
+        JSON解析の計測値を取得
+
+        Returns:
+            計測値と、解析失敗で無駄になった呼び出しの割合（wasted_rate）
+        """
+        with self._stats_lock:
+            stats = dict(self.json_stats)
+        stats['wasted_rate'] = stats['wasted'] / stats['calls'] if stats['calls'] else 0.0
+        return stats
+
+    def _generate_text(self, stage: str, prompt: str, candidate_count: int = 1) -> Union[str, List[str]]:
+        """
+        テキストを生成（candidate_countが2以上なら複数候補）
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+            candidate_count: 候補数
+
+        Returns:
+            生成されたテキスト（candidate_countが2以上の場合は候補のリスト）
+        """
+        if candidate_count <= 1:
+            spool = getattr(self._spool_local, 'spool', None)
+            if spool:
+                return self._generate_spooled(stage, prompt, spool)
+            return self._generate_unspooled(stage, prompt)
+        return self._generate_candidates(stage, prompt, min(candidate_count, MAX_CANDIDATES))
+
+    def _generate_candidates(self, stage: str, prompt: str, count: int) -> List[str]:
+        """
+        複数の候補を1回の待ち時間で生成
+        対応モデルでは1リクエストのcandidate_count、未対応なら温度を変えた並列リクエスト
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+            count: 候補数
+
+        Returns:
+            候補のテキスト（生成できた分のみ）
+        """
+        model_name = self._get_stage_model_name(stage)
+        if model_name not in self.candidate_count_unsupported:
+            try:
+                response = self._generate(stage, prompt, {'candidate_count': count})
+                texts = [self._result(text, stage) for text in self._candidate_texts(response)]
+                if len(texts) >= count:
+                    return texts
+                if len(texts) <= 1:
+                    # 候補数の指定が無視された
+                    self.candidate_count_unsupported.add(model_name)
+                # 足りない分だけ並列リクエストで補う
+                return texts + self._generate_parallel_candidates(stage, prompt, count - len(texts), len(texts))
+            except (TypeError, ValueError):
+                self.candidate_count_unsupported.add(model_name)
+            except Exception as e:
+                if 'candidate' not in str(e).lower():
+                    raise
+                self.candidate_count_unsupported.add(model_name)
+
+        return self._generate_parallel_candidates(stage, prompt, count)
+
+    def _generate_parallel_candidates(self, stage: str, prompt: str, count: int, offset_start: int = 0) -> List[str]:
+        """
+        温度を変えた並列リクエストで候補を生成（1件目は呼び出し元のスレッドで実行）
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+            count: 候補数
+            offset_start: 使用する温度の変化幅の開始位置
+
+        Returns:
+            候補のテキスト（失敗した候補は除く、すべて失敗した場合は例外）
+        """
+        if count <= 0:
+            return []
+
+        base_temperature = self._get_stage_generation_config(stage).get('temperature', 0.7)
+        offsets = CANDIDATE_TEMPERATURE_OFFSETS[offset_start:offset_start + count]
+        overrides = [
+            {'temperature': round(min(max(base_temperature + offset, 0.0), 2.0), 2)}
+            for offset in offsets
+        ]
+
+        def generate_one(override: Dict[str, Any]) -> str:
+            return self._result(self._generate(stage, prompt, override).text.strip(), stage)
+
+        texts: List[str] = []
+        errors: List[Exception] = []
+        with ThreadPoolExecutor(max_workers=max(len(overrides) - 1, 1)) as executor:
+            futures = [executor.submit(generate_one, override) for override in overrides[1:]]
+            try:
+                texts.append(generate_one(overrides[0]))
+            except Exception as e:
+                errors.append(e)
+            for future in futures:
+                try:
+                    texts.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+
+        if not texts and errors:
+            raise errors[0]
+        return texts
+
+    @staticmethod
+    def _candidate_texts(response) -> List[str]:
+        """レスポンスの全候補のテキストを取り出す（空の候補は除く）"""
+        texts = []
+        for candidate in getattr(response, 'candidates', None) or []:
+            content = getattr(candidate, 'content', None)
+            parts = getattr(content, 'parts', None) or []
+            text = ''.join(getattr(part, 'text', '') for part in parts).strip()
+            if text:
+                texts.append(text)
+        return texts
+
+    def _generate_json_text(self, stage: str, prompt: str, schema: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        JSONを出力させる生成（対応モデルではスキーマ制約付き）
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+            schema: レスポンスのJSONスキーマ
+
+        Returns:
+            (レスポンスのテキスト, 構造化出力を使用したかどうか)
+        """
+        model_name = self._get_stage_model_name(stage)
+        if model_name not in self.structured_unsupported:
+            try:
+                response = self._generate(stage, prompt, {
+                    'response_mime_type': 'application/json',
+                    'response_schema': schema
+                })
+                self._count_json_stat('structured')
+                return response.text, True
+            except (TypeError, ValueError):
+                # SDKまたはモデルが構造化出力に未対応
+                self.structured_unsupported.add(model_name)
+            except Exception as e:
+                message = str(e).lower()
+                markers = ('response_mime_type', 'response_schema', 'json mode', 'mime type')
+                if not any(marker in message for marker in markers):
+                    raise
+                self.structured_unsupported.add(model_name)
+
+        return self._generate(stage, prompt).text, False
+
+    def _generate_json(
+        self,
+        stage: str,
+        prompt: str,
+        fields: List[str],
+        context: str
+    ) -> Dict[str, str]:
+        """
+        JSONオブジェクトを生成して解析（失敗した項目のみ再リクエストで修復）
+
+        Args:
+            stage: 生成ステージ
+            prompt: プロンプト
+            fields: 必須項目
+            context: 修復リクエストに添える元の依頼内容
+
+        Returns:
+            解析されたデータ
+        """
+        self._count_json_stat('calls')
+        text, structured = self._generate_json_text(stage, prompt, _object_schema(fields))
+
+        try:
+            data = extract_json_object(text)
+        except ValueError:
+            # JSONが読めない場合は出力そのものをJSONに整形し直してもらう
+            self._count_json_stat('repair_requests')
+            repair_prompt = f"""
+以下の文章を、指定された項目を持つJSONオブジェクトに変換してください。
+項目: {', '.join(fields)}
+
+【文章】
+{text}
+"""
+            try:
+                data = extract_json_object(
+                    self._generate_json_text(stage, repair_prompt, _object_schema(fields))[0]
+                )
+            except ValueError:
+                self._count_json_stat('wasted')
+                raise Exception("AIの出力をJSONとして解析できませんでした")
+        else:
+            if not structured:
+                self._count_json_stat('tolerant_parsed')
+
+        # 配列などで返された項目は文字列にそろえる
+        for field in fields:
+            value = data.get(field)
+            if isinstance(value, list):
+                data[field] = '、'.join(str(item) for item in value)
+            elif isinstance(value, dict):
+                data[field] = json.dumps(value, ensure_ascii=False)
+
+        missing = missing_fields(data, fields)
+        if missing:
+            # 欠けた項目だけを再リクエスト
+            self._count_json_stat('repair_requests')
+            repair_prompt = f"""
+以下の依頼に対する出力のうち、次の項目が欠けていました: {', '.join(missing)}
+これらの項目のみを、既存の内容と矛盾しないようにJSONで出力してください。
+
+【元の依頼】
+{context}
+
+【既存の内容】
+{json.dumps({k: v for k, v in data.items() if k not in missing}, ensure_ascii=False)}
+"""
+            try:
+                patch = extract_json_object(
+                    self._generate_json_text(stage, repair_prompt, _object_schema(missing))[0]
+                )
+                for field in missing:
+                    if isinstance(patch.get(field), str):
+                        data[field] = patch[field]
+            except ValueError:
+                pass
+
+        # 残った欠損は空文字で埋める（フォームでユーザーが補える）
+        for field in missing_fields(data, fields):
+            data[field] = ''
+
+        return {field: data[field] for field in fields}
 
     def generate_character(self, concept: str, additional_info: str = "") -> Dict[str, str]:
         """
@@ -85,25 +1231,233 @@ class GeminiClient:
 }}
 """
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-
-            # JSONマーカーの除去
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-            text = text.strip()
-
-            import json
-            character_data = json.loads(text)
-            return character_data
+            return self._generate_json(
+                'character',
+                prompt,
+                CHARACTER_FIELDS,
+                context=f"キャラクター設定の作成（コンセプト: {concept} / 追加情報: {additional_info}）"
+            )
 
         except Exception as e:
             raise Exception(f"キャラクター生成に失敗しました: {e}")
 
+    def generate_characters(
+        self,
+        concepts: Optional[List[str]] = None,
+        ensemble_concept: str = "",
+        count: int = 0,
+        additional_info: str = "",
+        existing_names: Optional[List[str]] = None,
+        batch_size: int = 6
+    ) -> List[Dict[str, str]]:
+        """
+        キャラクター設定の一括生成（1回または数回のリクエストでまとめて生成）
+
+        Args:
+            concepts: キャラクターごとのコンセプト（指定時はこちらを優先）
+            ensemble_concept: 登場人物全体のコンセプト
+            count: ensemble_concept使用時に生成する人数
+            additional_info: 追加情報
+            existing_names: 既存キャラクター名（重複を避ける）
+            batch_size: 1リクエストあたりの最大人数
+
+        Returns:
+            生成されたキャラクター情報のリスト（名前で重複排除済み）
+        """
+        concepts = [c.strip() for c in (concepts or []) if c.strip()]
+        if not concepts:
+            if not ensemble_concept or count <= 0:
+                raise Exception("コンセプトまたは人数が指定されていません")
+            # 全体コンセプトを人数分の枠に展開
+            concepts = [''] * count
+
+        seen = {normalize_name(name) for name in (existing_names or [])}
+        characters: List[Dict[str, str]] = []
+
+        chunks = [concepts[start:start + batch_size] for start in range(0, len(concepts), batch_size)]
+        avoid_names = sorted(seen)
+        try:
+            # バッチは共有の同時実行数で並列に生成し、バッチ間で重なった名前は先のバッチを優先
+            batches = self.run_batch(
+                lambda index: self._generate_character_batch(
+                    chunks[index], ensemble_concept, additional_info, avoid_names, (index + 1, len(chunks))
+                ),
+                list(range(len(chunks))),
+                stage='character'
+            )
+            for generated in batches:
+                for character in generated:
+                    key = normalize_name(character.get('name', ''))
+                    if not key or key in seen:
+                        continue
+                    seen.add(key)
+                    characters.append(character)
+        except Exception as e:
+            raise Exception(f"キャラクター一括生成に失敗しました: {e}")
+
+        return characters
+
+    def _generate_character_batch(
+        self,
+        concepts: List[str],
+        ensemble_concept: str,
+        additional_info: str,
+        avoid_names: List[str],
+        batch: Tuple[int, int] = (1, 1)
+    ) -> List[Dict[str, str]]:
+        """
+        1リクエスト分のキャラクターをJSON配列で生成
+
+        Args:
+            concepts: キャラクターごとのコンセプト（空文字は全体コンセプトから自由に作成）
+            ensemble_concept: 登場人物全体のコンセプト
+            additional_info: 追加情報
+            avoid_names: 使用しない名前
+            batch: (何組目か, 全体の組数)（並列に生成する他の組と重ならないようにする）
+
+        Returns:
+            生成されたキャラクター情報のリスト
+        """
+        concept_lines = "\n".join(
+            f"{i}. {concept or '全体コンセプトに沿って自由に設定'}"
+            for i, concept in enumerate(concepts, 1)
+        )
+        prompt = f"""
+以下の条件に基づいて、{len(concepts)}人分の魅力的なキャラクター設定をまとめて作成してください。
+
+全体コンセプト: {ensemble_concept or 'なし'}
+追加情報: {additional_info}
+
+各キャラクターのコンセプト:
+{concept_lines}
+
+登場人物同士の名前・性格・役割が重ならないようにしてください。
+次の名前は既に使われているため使用しないでください: {'、'.join(avoid_names) or 'なし'}
+{f'登場人物は全{batch[1]}組に分けて作成しています。これは{batch[0]}組目です。他の組と名前・人物像が重ならないようにしてください。' if batch[1] > 1 else ''}
+
+各キャラクターについて、名前（ふりがな付き）、性格、外見、背景・経歴、特技・能力、口調・話し方、人間関係、目標・動機を具体的に記述してください。
+
+出力は以下の形式のJSON配列で、{len(concepts)}要素を返してください（JSON以外の文字は含めないでください）:
+[
+  {{
+    "name": "名前",
+    "personality": "性格の説明",
+    "appearance": "外見の説明",
+    "background": "背景・経歴の説明",
+    "skills": "特技・能力の説明",
+    "speech": "口調・話し方の説明",
+    "relationships": "人間関係の説明",
+    "goals": "目標・動機の説明"
+  }}
+]
+"""
+        self._count_json_stat('calls')
+        schema = {'type': 'array', 'items': _object_schema(CHARACTER_FIELDS)}
+        text, structured = self._generate_json_text('character', prompt, schema)
+
+        try:
+            items = extract_json_array(text)
+        except ValueError:
+            self._count_json_stat('wasted')
+            raise Exception("AIの出力をJSONとして解析できませんでした")
+        if not structured:
+            self._count_json_stat('tolerant_parsed')
+
+        characters = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            character = {}
+            for field in CHARACTER_FIELDS:
+                value = item.get(field, '')
+                if isinstance(value, list):
+                    value = '、'.join(str(v) for v in value)
+                character[field] = value if isinstance(value, str) else str(value)
+            if character['name'].strip():
+                characters.append(character)
+
+        return characters
+
+    def summarize_profile(self, kind: str, data: Dict[str, Any]) -> str:
+        """
+        キャラクター・世界観の要約を生成（要約コンテキスト用）
+
+        Args:
+            kind: character または world
+            data: キャラクターまたは世界観のデータ
+
+        Returns:
+            200文字程度の要約
+        """
+        fields = CHARACTER_FIELDS if kind == 'character' else WORLD_FIELDS
+        label = 'キャラクター' if kind == 'character' else '世界観'
+        source = "\n".join(
+            f"{field}: {data.get(field, '')}" for field in fields if data.get(field)
+        )
+
+        prompt = f"""
+以下の{label}設定を、物語の執筆時に参照するための要約にまとめてください。
+
+{source}
+
+物語の一貫性に必要な情報（性格・口調・関係・ルールなど）を優先し、200文字程度で簡潔にまとめてください。
+要約の本文のみを出力してください。
+"""
+        try:
+            response = self._generate('summary', prompt)
+            return response.text.strip()
+        except Exception as e:
+            raise Exception(f"{label}の要約に失敗しました: {e}")
+
+    def summarize_scene(self, scene: Dict[str, Any]) -> str:
+        """
+        シーンの要約を生成（これまでのあらすじ用）
+
+        Args:
+            scene: シーン情報
+
+        Returns:
+            150文字程度の要約
+        """
+        prompt = f"""
+以下のシーンで起きた出来事を、後続のシーンを書くための記録として150文字程度で要約してください。
+登場人物の行動・関係の変化・判明した事実を優先してください。要約の本文のみを出力してください。
+
+【シーンタイトル】
+{scene.get('title', '')}
+
+【本文】
+{scene.get('content', '')}
+"""
+        try:
+            response = self._generate('summary', prompt)
+            return response.text.strip()
+        except Exception as e:
+            raise Exception(f"シーンの要約に失敗しました: {e}")
+
+    def summarize_story_group(self, summaries: List[str]) -> str:
+        """
+        連続する要約を1つにまとめる（これまでのあらすじの上位要約）
+
+        Args:
+            summaries: 物語順の要約
+
+        Returns:
+            200文字程度の要約
+        """
+        joined = "\n".join(f"- {summary}" for summary in summaries)
+        prompt = f"""
+以下は物語の連続する部分の要約です。流れと重要な出来事が分かるように200文字程度にまとめてください。
+要約の本文のみを出力してください。
+
+{joined}
+"""
+        try:
+            response = self._generate('summary', prompt)
+            return response.text.strip()
+        except Exception as e:
+            raise Exception(f"あらすじの要約に失敗しました: {e}")
+
     def generate_world(self, genre: str, keywords: str) -> Dict[str, str]:
         """
         世界観設定の生成
@@ -147,21 +1501,12 @@ class GeminiClient:
 }}
 """
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-
-            # JSONマーカーの除去
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-            text = text.strip()
-
-            import json
-            world_data = json.loads(text)
-            return world_data
+            return self._generate_json(
+                'world',
+                prompt,
+                WORLD_FIELDS,
+                context=f"世界観設定の作成（ジャンル: {genre} / キーワード: {keywords}）"
+            )
 
         except Exception as e:
             raise Exception(f"世界観生成に失敗しました: {e}")
@@ -172,8 +1517,11 @@ class GeminiClient:
         overview: str,
         characters: List[Dict[str, Any]],
         world_setting: Dict[str, Any],
-        writing_style: Dict[str, str]
-    ) -> str:
+        writing_style: Dict[str, str],
+        related_passages: Optional[List[str]] = None,
+        story_so_far: str = "",
+        candidate_count: int = 1
+    ) -> Union[str, List[str]]:
         """
         プロット生成（第1段階：500-1000文字）
 
@@ -183,18 +1531,22 @@ class GeminiClient:
             characters: 使用するキャラクター情報
             world_setting: 世界観設定
             writing_style: 文体スタイル
+            related_passages: 関連する過去の場面（一貫性のための参考）
+            story_so_far: これまでのあらすじ
+            candidate_count: 候補数（2以上で複数の候補を返す）
 
         Returns:
-            生成されたプロット
+            生成されたプロット（candidate_countが2以上の場合は候補のリスト）
         """
-        # キャラクター情報の整形
-        character_info = self._format_characters(characters)
-        world_info = self._format_world(world_setting)
-        style_info = self._format_style(writing_style)
+        # コンテキストの整形（キャッシュ済みブロックを再利用）
+        fixed_text = title + overview + story_so_far + ''.join(related_passages or [])
+        character_info, world_info, style_info = self._build_context(
+            'plot', characters, world_setting, writing_style, fixed_text
+        )
 
         prompt = f"""
 以下の情報を基に、物語のプロット（あらすじ）を500〜1000文字で作成してください。
-
+{self._format_story_so_far(story_so_far)}
 【シーン情報】
 タイトル: {title}
 概要: {overview}
@@ -204,7 +1556,7 @@ class GeminiClient:
 
 【世界観設定】
 {world_info}
-
+{self._format_related(related_passages)}
 【文体スタイル】
 {style_info}
 
@@ -217,8 +1569,7 @@ class GeminiClient:
 500〜1000文字で、簡潔かつ魅力的なプロットを作成してください。
 """
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._generate_text('plot', prompt, candidate_count)
         except Exception as e:
             raise Exception(f"プロット生成に失敗しました: {e}")
 
@@ -228,8 +1579,10 @@ class GeminiClient:
         title: str,
         characters: List[Dict[str, Any]],
         world_setting: Dict[str, Any],
-        writing_style: Dict[str, str]
-    ) -> str:
+        writing_style: Dict[str, str],
+        related_passages: Optional[List[str]] = None,
+        candidate_count: int = 1
+    ) -> Union[str, List[str]]:
         """
         中編化（第2段階：2000-3000文字）
 
@@ -239,13 +1592,16 @@ class GeminiClient:
             characters: キャラクター情報
             world_setting: 世界観設定
             writing_style: 文体スタイル
+            related_passages: 関連する過去の場面（一貫性のための参考）
+            candidate_count: 候補数（2以上で複数の候補を返す）
 
         Returns:
-            拡張された中編
+            拡張された中編（candidate_countが2以上の場合は候補のリスト）
         """
-        character_info = self._format_characters(characters)
-        world_info = self._format_world(world_setting)
-        style_info = self._format_style(writing_style)
+        fixed_text = plot + title + ''.join(related_passages or [])
+        character_info, world_info, style_info = self._build_context(
+            'medium', characters, world_setting, writing_style, fixed_text
+        )
 
         prompt = f"""
 以下のプロットを2000〜3000文字の中編に拡張してください。
@@ -261,7 +1617,7 @@ class GeminiClient:
 
 【世界観設定】
 {world_info}
-
+{self._format_related(related_passages)}
 【文体スタイル】
 {style_info}
 
@@ -275,8 +1631,7 @@ class GeminiClient:
 2000〜3000文字で、読者を引き込む豊かな描写の物語を作成してください。
 """
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._generate_text('medium', prompt, candidate_count)
         except Exception as e:
             raise Exception(f"中編化に失敗しました: {e}")
 
@@ -286,8 +1641,10 @@ class GeminiClient:
         title: str,
         characters: List[Dict[str, Any]],
         world_setting: Dict[str, Any],
-        writing_style: Dict[str, str]
-    ) -> str:
+        writing_style: Dict[str, str],
+        related_passages: Optional[List[str]] = None,
+        candidate_count: int = 1
+    ) -> Union[str, List[str]]:
         """
         長編化（第3段階：5000文字以上）
 
@@ -297,13 +1654,16 @@ class GeminiClient:
             characters: キャラクター情報
             world_setting: 世界観設定
             writing_style: 文体スタイル
+            related_passages: 関連する過去の場面（一貫性のための参考）
+            candidate_count: 候補数（2以上で複数の候補を返す）
 
         Returns:
-            拡張された長編
+            拡張された長編（candidate_countが2以上の場合は候補のリスト）
         """
-        character_info = self._format_characters(characters)
-        world_info = self._format_world(world_setting)
-        style_info = self._format_style(writing_style)
+        fixed_text = medium_story + title + ''.join(related_passages or [])
+        character_info, world_info, style_info = self._build_context(
+            'long', characters, world_setting, writing_style, fixed_text
+        )
 
         prompt = f"""
 以下の中編を5000文字以上の長編に拡張してください。
@@ -319,7 +1679,7 @@ class GeminiClient:
 
 【世界観設定】
 {world_info}
-
+{self._format_related(related_passages)}
 【文体スタイル】
 {style_info}
 
@@ -335,28 +1695,163 @@ class GeminiClient:
 文学的で完成度の高い作品に仕上げてください。
 """
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._generate_text('long', prompt, candidate_count)
         except Exception as e:
             raise Exception(f"長編化に失敗しました: {e}")
 
+    def _build_context(
+        self,
+        stage: str,
+        characters: List[Dict[str, Any]],
+        world_setting: Dict[str, Any],
+        writing_style: Dict[str, str],
+        fixed_text: str = ""
+    ) -> Tuple[str, str, str]:
+        """
+        プロンプト用のコンテキストブロックを組み立て（所要時間を記録）
+        ステージに入力トークン上限があれば優先度の低いものから短縮・削除する
+
+        Args:
+            stage: 生成ステージ
+            characters: キャラクター情報
+            world_setting: 世界観設定
+            writing_style: 文体スタイル
+            fixed_text: 削れないプロンプト本文（元のプロット等）
+
+        Returns:
+            (キャラクター情報, 世界観情報, 文体情報)
+        """
+        self._pending_budget_reports.report = None
+        with Stopwatch() as watch:
+            budget = (self.generation_profiles.get(stage) or {}).get('input_budget', 0)
+            if budget and budget > 0:
+                blocks = self._fit_context(
+                    budget, characters, world_setting, writing_style, fixed_text
+                )
+            else:
+                blocks = (
+                    self._format_characters(characters),
+                    self._format_world(world_setting),
+                    self._format_style(writing_style)
+                )
+        self.context_cache.record_assembly(watch.seconds)
+        return blocks
+
+    def _fit_context(
+        self,
+        budget: int,
+        characters: List[Dict[str, Any]],
+        world_setting: Dict[str, Any],
+        writing_style: Dict[str, str],
+        fixed_text: str
+    ) -> Tuple[str, str, str]:
+        """
+        コンテキストを入力トークン上限に収める
+
+        選択順が後ろのキャラクターほど優先度が低い。
+        まず全体を短縮版に置き換え、それでも超える場合に削除する。
+
+        Args:
+            budget: 入力トークン上限
+            characters: キャラクター情報
+            world_setting: 世界観設定
+            writing_style: 文体スタイル
+            fixed_text: 削れないプロンプト本文
+
+        Returns:
+            (キャラクター情報, 世界観情報, 文体情報)
+        """
+        style_info = self._format_style(writing_style)
+
+        character_sections = []
+        for i, char in enumerate(characters):
+            character_sections.append(ContextSection(
+                f"character:{char.get('name', i)}",
+                self._character_block(char),
+                priority=100 - i * 2,
+                abbreviated=f"名前: {char.get('name', '不明')}\n性格: {char.get('personality', '不明')[:40]}"
+            ))
+
+        world_info = self._format_world(world_setting)
+        world_section = ContextSection(
+            'world',
+            world_info,
+            # 主要キャラクター（先頭3人）より低く、それ以外より高い
+            priority=101 - min(len(characters), 3) * 2,
+            abbreviated=(
+                f"世界観: {world_setting.get('name', '不明')}\n"
+                f"概要: {world_setting.get('overview', '不明')[:80]}"
+            ) if world_setting else None
+        )
+
+        fixed_tokens = (
+            PROMPT_OVERHEAD_TOKENS
+            + self.token_estimator.estimate(fixed_text)
+            + self.token_estimator.estimate(style_info)
+        )
+        result = self.token_budgeter.fit(
+            character_sections + [world_section], budget, fixed_tokens
+        )
+        result['budget'] = budget
+        self._pending_budget_reports.report = result
+
+        kept = [section.current_text for section in character_sections if section.state != 'dropped']
+        dropped_count = len(character_sections) - len(kept)
+        character_info = "\n\n".join(kept) if kept else "なし"
+        if dropped_count:
+            character_info += f"\n\n（他{dropped_count}名は省略）"
+
+        return character_info, world_section.current_text or "特に指定なし", style_info
+
     def _format_characters(self, characters: List[Dict[str, Any]]) -> str:
         """キャラクター情報を整形"""
         if not characters:
             return "なし"
 
-        formatted = []
-        for char in characters:
-            char_text = f"名前: {char.get('name', '不明')}\n"
-            char_text += f"性格: {char.get('personality', '不明')}\n"
-            char_text += f"外見: {char.get('appearance', '不明')}\n"
-            char_text += f"口調: {char.get('speech', '不明')}"
-            formatted.append(char_text)
+        # キャラクター単位でキャッシュし、選択の組み合わせが変わっても再利用する
+        formatted = [self._character_block(char) for char in characters]
 
         return "\n\n".join(formatted)
 
+    def _character_block(self, char: Dict[str, Any]) -> str:
+        """キャラクター1人分のブロックを取得（要約モードでは要約を優先）"""
+        item_id = self._context_cache_id(char, char.get('id') or content_hash(char))
+        if self.condensed_context and get_fresh_summary(char):
+            return self.context_cache.get('character:condensed', char, self._format_condensed_character, item_id)
+        return self.context_cache.get('character', char, self._format_character, item_id)
+
+    @staticmethod
+    def _format_condensed_character(char: Dict[str, Any]) -> str:
+        """キャラクター1人分の要約を整形"""
+        return f"名前: {char.get('name', '不明')}\n要約: {get_fresh_summary(char)}"
+
+    @staticmethod
+    def _format_character(char: Dict[str, Any]) -> str:
+        """キャラクター1人分の情報を整形"""
+        char_text = f"名前: {char.get('name', '不明')}\n"
+        if char.get('aliases'):
+            char_text += f"別名: {char['aliases']}\n"
+        char_text += f"性格: {char.get('personality', '不明')}\n"
+        char_text += f"外見: {char.get('appearance', '不明')}\n"
+        char_text += f"口調: {char.get('speech', '不明')}"
+        return char_text
+
     def _format_world(self, world_setting: Dict[str, Any]) -> str:
         """世界観情報を整形"""
+        if self.condensed_context and get_fresh_summary(world_setting):
+            return self.context_cache.get(
+                'world:condensed', world_setting, self._format_condensed_world, self._context_cache_id(world_setting)
+            )
+        return self.context_cache.get('world', world_setting, self._format_world_block, self._context_cache_id(world_setting))
+
+    @staticmethod
+    def _format_condensed_world(world_setting: Dict[str, Any]) -> str:
+        """世界観の要約を整形"""
+        return f"世界観: {world_setting.get('name', '不明')}\n要約: {get_fresh_summary(world_setting)}"
+
+    @staticmethod
+    def _format_world_block(world_setting: Dict[str, Any]) -> str:
+        """世界観ブロックを作成"""
         if not world_setting:
             return "特に指定なし"
 
@@ -367,8 +1862,27 @@ class GeminiClient:
 
         return formatted
 
+    @staticmethod
+    def _format_story_so_far(story_so_far: str) -> str:
+        """これまでのあらすじのセクションを整形（なければ空）"""
+        if not story_so_far:
+            return ""
+        return f"\n【これまでのあらすじ】\n{story_so_far}\n"
+
+    @staticmethod
+    def _format_related(related_passages: Optional[List[str]]) -> str:
+        """関連する過去の場面のセクションを整形（なければ空）"""
+        if not related_passages:
+            return ""
+        return "\n【関連する過去の場面（一貫性の参考）】\n" + "\n\n".join(related_passages) + "\n"
+
     def _format_style(self, writing_style: Dict[str, str]) -> str:
         """文体スタイルを整形"""
+        return self.context_cache.get('style', writing_style, self._format_style_block, self._context_cache_id(writing_style))
+
+    @staticmethod
+    def _format_style_block(writing_style: Dict[str, str]) -> str:
+        """文体ブロックを作成"""
         formatted = f"視点: {writing_style.get('perspective', '三人称')}\n"
         formatted += f"時制: {writing_style.get('tense', '過去形')}\n"
         formatted += f"トーン: {writing_style.get('tone', '標準')}\n"
@@ -379,16 +1893,21 @@ class GeminiClient:
 
     def update_generation_config(self, temperature: float, max_tokens: int, top_p: float):
         """
-        生成パラメータの更新
+        共通の生成パラメータの更新
+        （プロファイル未設定のステージと接続テストに使用）
 
         Args:
             temperature: 温度パラメータ
             max_tokens: 最大トークン数
             top_p: Top-pサンプリング
         """
-        generation_config = genai.GenerationConfig(
-            temperature=temperature,
-            max_output_tokens=max_tokens,
-            top_p=top_p
+        self.base_generation_config = {
+            'temperature': temperature,
+            'max_output_tokens': max_tokens,
+            'top_p': top_p
+        }
+        self.model = self.model_pool.get(
+            self.model_name,
+            self.base_generation_config,
+            self._create_model
         )
-        self.model = genai.GenerativeModel(self.model_name, generation_config=generation_config)
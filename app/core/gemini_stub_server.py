@@ -0,0 +1,431 @@
+"""
+Gemini APIのローカル代替サーバー
+generateContent / streamGenerateContent / countTokens とモデル情報の取得に応答し、
+実際のHTTP通信・クライアントの処理を含めた負荷試験をオフラインで行えるようにする
+
+起動方法:
+    python -m app.core.gemini_stub_server --port 8765 --latency lognormal:-0.7,0.5 --throttle-rate 0.05
+（設定ファイルの backend.endpoint に http://127.0.0.1:8765 を指定して接続）
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from app.core.backends import FakeBackend, FakeModel
+
+
+# REST の generationConfig（キャメルケース）-> 偽のモデルの生成設定
+_GENERATION_CONFIG_KEYS = {
+    'temperature': 'temperature',
+    'maxOutputTokens': 'max_output_tokens',
+    'candidateCount': 'candidate_count',
+    'responseMimeType': 'response_mime_type',
+    'responseSchema': 'response_schema'
+}
+
+# スキーマの型（RESTの送信内容では列挙値の番号になる場合がある）
+_SCHEMA_TYPES = {1: 'string', 2: 'number', 3: 'integer', 4: 'boolean', 5: 'array', 6: 'object'}
+
+_PATH_PATTERN = re.compile(r'^/(v1beta|v1)/models/([^/:]+)(?::(\w+))?$')
+
+
+class LatencyDistribution:
+    """最初のトークンまでの時間の分布"""
+
+    def __init__(self, spec: str = "fixed:0.5", seed: int = 0):
+        """
+        初期化
+
+        Args:
+            spec: 分布の指定（秒）
+                fixed:0.5 / uniform:0.2,1.5 / lognormal:-0.7,0.5（対数の平均,標準偏差）/ 0.5
+            seed: 乱数のシード
+        """
+        kind, _, params = spec.partition(':')
+        if not params:
+            kind, params = 'fixed', kind
+        try:
+            self.values = [float(value) for value in params.split(',') if value]
+        except ValueError:
+            raise ValueError(f"遅延の指定が正しくありません: {spec}")
+        if kind not in ('fixed', 'uniform', 'lognormal') or not self.values:
+            raise ValueError(f"遅延の指定が正しくありません: {spec}")
+        if kind != 'fixed' and len(self.values) < 2:
+            raise ValueError(f"遅延の指定が正しくありません: {spec}")
+
+        self.kind = kind
+        self.spec = spec
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """遅延を1つ取り出す（秒）"""
+        with self._lock:
+            if self.kind == 'uniform':
+                return self._random.uniform(self.values[0], self.values[1])
+            if self.kind == 'lognormal':
+                return math.exp(self._random.gauss(self.values[0], self.values[1]))
+            return self.values[0]
+
+
+class StubError(Exception):
+    """HTTPエラーとして返す応答"""
+
+    def __init__(self, code: int, status: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+class StubBehavior:
+    """代替サーバーの応答内容・遅延・エラー注入と統計"""
+
+    def __init__(
+        self,
+        latency: Optional[LatencyDistribution] = None,
+        chars_per_second: float = 400.0,
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        mode: str = 'fake',
+        canned: Optional[List[str]] = None,
+        seed: int = 0
+    ):
+        """
+        初期化
+
+        Args:
+            latency: 最初のトークンまでの時間の分布
+            chars_per_second: 出力の速度（文字/秒、0以下は待たない）
+            throttle_rate: 429（RESOURCE_EXHAUSTED）を返す割合
+            error_rate: 503（UNAVAILABLE）を返す割合
+            mode: fake（偽の本文・JSON）/ echo（プロンプトをそのまま返す）/ canned（用意した応答を順に返す）
+            canned: cannedモードの応答
+            seed: エラー注入と出力の乱数のシード
+        """
+        if mode == 'canned' and not canned:
+            raise ValueError("cannedモードには応答の一覧が必要です")
+        self.latency = latency or LatencyDistribution(seed=seed)
+        self.chars_per_second = chars_per_second
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.mode = mode
+        self.canned = canned or []
+        self.seed = seed
+
+        self._fake = FakeBackend(first_token_latency=0, chars_per_second=0, seed=seed)
+        self._canned_index = itertools.count()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    def begin(self):
+        """リクエストの開始を記録し、注入するエラーを決める"""
+        with self._lock:
+            self.stats['requests'] += 1
+            roll = self._random.random()
+            if roll < self.throttle_rate:
+                self.stats['throttled'] += 1
+                raise StubError(429, 'RESOURCE_EXHAUSTED', 'Resource has been exhausted (stub server)')
+            if roll < self.throttle_rate + self.error_rate:
+                self.stats['errors'] += 1
+                raise StubError(503, 'UNAVAILABLE', 'The service is currently unavailable (stub server)')
+            self.stats['in_flight'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+
+    def end(self):
+        """リクエストの終了を記録"""
+        with self._lock:
+            self.stats['in_flight'] -= 1
+
+    def respond(self, model_name: str, body: Dict[str, Any]) -> Tuple[List[str], int]:
+        """
+        リクエストに対する出力
+
+        Args:
+            model_name: モデル名
+            body: リクエストのJSON
+
+        Returns:
+            (候補のテキスト, プロンプトのトークン数)
+        """
+        prompt = _prompt_text(body)
+        config = {
+            key: body.get('generationConfig', {})[rest_key]
+            for rest_key, key in _GENERATION_CONFIG_KEYS.items()
+            if rest_key in body.get('generationConfig', {})
+        }
+        if config.get('response_schema'):
+            config['response_schema'] = _normalize_schema(config['response_schema'])
+        count = max(int(config.get('candidate_count', 1) or 1), 1)
+
+        if self.mode == 'echo':
+            texts = [prompt] * count
+        elif self.mode == 'canned':
+            texts = [self.canned[next(self._canned_index) % len(self.canned)] for _ in range(count)]
+        else:
+            response = self._fake.generate(FakeModel(model_name, config), prompt)
+            texts = [candidate.content.parts[0].text for candidate in response.candidates]
+        return texts, FakeBackend.estimate_tokens(prompt)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計を取得"""
+        with self._lock:
+            return dict(self.stats, latency=self.latency.spec, mode=self.mode)
+
+
+def _normalize_schema(schema: Any) -> Any:
+    """スキーマの型を小文字の名前に揃える"""
+    if isinstance(schema, list):
+        return [_normalize_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    normalized = {key: _normalize_schema(value) for key, value in schema.items()}
+    if 'type' in schema:
+        type_value = schema['type']
+        normalized['type'] = _SCHEMA_TYPES.get(type_value, str(type_value).lower())
+    return normalized
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    """リクエストのcontentsからテキストを取り出す"""
+    texts = []
+    for content in body.get('contents', []):
+        for part in content.get('parts', []):
+            if 'text' in part:
+                texts.append(part['text'])
+    return "\n".join(texts)
+
+
+def _response_json(texts: List[str], prompt_tokens: int, finished: bool = True) -> Dict[str, Any]:
+    """generateContentのレスポンス形式"""
+    data = {
+        'candidates': [
+            {
+                'content': {'parts': [{'text': text}], 'role': 'model'},
+                'index': index,
+                **({'finishReason': 'STOP'} if finished else {})
+            }
+            for index, text in enumerate(texts)
+        ]
+    }
+    if finished:
+        output_tokens = sum(FakeBackend.estimate_tokens(text) for text in texts)
+        data['usageMetadata'] = {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': output_tokens,
+            'totalTokenCount': prompt_tokens + output_tokens
+        }
+    return data
+
+
+class GeminiStubHandler(BaseHTTPRequestHandler):
+    """Gemini REST APIの一部に応答するハンドラ"""
+
+    server_version = "GeminiStub/1.0"
+    # 出力をチャンクで流すため、接続を閉じてレスポンスの終わりを示す
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        """アクセスログは出力しない"""
+
+    @property
+    def behavior(self) -> StubBehavior:
+        return self.server.behavior
+
+    def _send_json(self, code: int, data: Any):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, error: StubError):
+        self._send_json(error.code, {'error': {'code': error.code, 'message': str(error), 'status': error.status}})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stub/stats':
+            self._send_json(200, self.behavior.get_stats())
+            return
+
+        match = _PATH_PATTERN.match(path)
+        if path.rstrip('/') in ('/v1beta/models', '/v1/models'):
+            self._send_json(200, {'models': [_model_info('gemini-2.0-flash'), _model_info('gemini-2.0-flash-lite')]})
+        elif match and not match.group(3):
+            self._send_json(200, _model_info(match.group(2)))
+        else:
+            self._send_error(StubError(404, 'NOT_FOUND', f'Not found: {path}'))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        match = _PATH_PATTERN.match(url.path)
+        if not match or not match.group(3):
+            self._send_error(StubError(404, 'NOT_FOUND', f'Not found: {url.path}'))
+            return
+
+        model_name, method = match.group(2), match.group(3)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_error(StubError(400, 'INVALID_ARGUMENT', 'Invalid JSON payload'))
+            return
+
+        if method == 'countTokens':
+            request = body.get('generateContentRequest', body)
+            self._send_json(200, {'totalTokens': FakeBackend.estimate_tokens(_prompt_text(request))})
+            return
+        if method not in ('generateContent', 'streamGenerateContent'):
+            self._send_error(StubError(404, 'NOT_FOUND', f'Unsupported method: {method}'))
+            return
+
+        try:
+            self.behavior.begin()
+        except StubError as e:
+            self._send_error(e)
+            return
+
+        try:
+            texts, prompt_tokens = self.behavior.respond(model_name, body)
+            time.sleep(max(self.behavior.latency.sample(), 0.0))
+            if method == 'generateContent':
+                self._sleep_for_output(max(len(text) for text in texts))
+                self._send_json(200, _response_json(texts, prompt_tokens))
+            else:
+                sse = parse_qs(url.query).get('alt', [''])[0] == 'sse'
+                self._stream(texts, prompt_tokens, sse)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # クライアント側の中止（ヘッジの取り消しなど）
+        finally:
+            self.behavior.end()
+
+    def _sleep_for_output(self, chars: int):
+        """出力の文字数に応じた時間だけ待つ"""
+        if self.behavior.chars_per_second > 0:
+            time.sleep(chars / self.behavior.chars_per_second)
+
+    def _stream(self, texts: List[str], prompt_tokens: int, sse: bool, chunk_chars: int = 40):
+        """streamGenerateContentの応答（SSEまたはJSON配列）を一定の速度で送る"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream' if sse else 'application/json; charset=UTF-8')
+        self.end_headers()
+
+        length = max(len(text) for text in texts)
+        starts = list(range(0, length, chunk_chars)) or [0]
+        if not sse:
+            self.wfile.write(b'[')
+        for i, start in enumerate(starts):
+            if i:
+                self._sleep_for_output(chunk_chars)
+            finished = i == len(starts) - 1
+            chunk = _response_json(
+                [text[start:start + chunk_chars] for text in texts], prompt_tokens, finished
+            )
+            data = json.dumps(chunk, ensure_ascii=False)
+            if sse:
+                self.wfile.write(f"data: {data}\r\n\r\n".encode('utf-8'))
+            else:
+                self.wfile.write(((',\r\n' if i else '') + data).encode('utf-8'))
+            self.wfile.flush()
+        if not sse:
+            self.wfile.write(b']')
+
+
+def _model_info(model_name: str) -> Dict[str, Any]:
+    """モデル情報（models.get の応答）"""
+    return {
+        'name': f'models/{model_name}',
+        'baseModelId': model_name,
+        'version': 'stub',
+        'displayName': f'{model_name} (stub)',
+        'inputTokenLimit': 1048576,
+        'outputTokenLimit': 8192,
+        'supportedGenerationMethods': ['generateContent', 'countTokens']
+    }
+
+
+class GeminiStubServer(ThreadingHTTPServer):
+    """Gemini APIのローカル代替サーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, behavior: StubBehavior, host: str = '127.0.0.1', port: int = 8765):
+        """
+        初期化
+
+        Args:
+            behavior: 応答内容・遅延・エラー注入
+            host: 待ち受けるアドレス
+            port: 待ち受けるポート（0は空いているポート）
+        """
+        super().__init__((host, port), GeminiStubHandler)
+        self.behavior = behavior
+
+    @property
+    def endpoint(self) -> str:
+        """クライアントに指定する接続先（backend.endpoint の値）"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_background(self) -> threading.Thread:
+        """
+        別スレッドで待ち受けを開始（負荷試験のスクリプトから使用）
+
+        Returns:
+            待ち受けのスレッド（停止は shutdown()）
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main(argv: Optional[List[str]] = None):
+    """コマンドラインから起動"""
+    parser = argparse.ArgumentParser(description="Gemini APIのローカル代替サーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='fixed:0.5',
+                        help="最初のトークンまでの時間（fixed:秒 / uniform:最小,最大 / lognormal:mu,sigma）")
+    parser.add_argument('--chars-per-second', type=float, default=400.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="429を返す割合")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="503を返す割合")
+    parser.add_argument('--mode', choices=['fake', 'echo', 'canned'], default='fake')
+    parser.add_argument('--canned', help="cannedモードの応答（文字列のJSON配列のファイル）")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    canned = None
+    if args.canned:
+        with open(args.canned, 'r', encoding='utf-8') as f:
+            canned = json.load(f)
+
+    behavior = StubBehavior(
+        latency=LatencyDistribution(args.latency, args.seed),
+        chars_per_second=args.chars_per_second,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        mode=args.mode,
+        canned=canned,
+        seed=args.seed
+    )
+    server = GeminiStubServer(behavior, args.host, args.port)
+    print(f"Gemini代替サーバーを起動しました: {server.endpoint}（Ctrl+Cで停止）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+ヘッジリクエスト
+最初のトークンが最近の遅延の指定パーセンタイルを過ぎても届かない場合に、同じリクエストを重複して送り、
+先に完了した方を採用する（重複リクエストの割合には上限を設け、採用しなかった方はストリームを閉じて中止する）
+"""
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+class LatencyTracker:
+    """ステージ別の最近の遅延（最初のトークンまで）の記録"""
+
+    def __init__(self, window: int = 50):
+        """
+        初期化
+
+        Args:
+            window: ステージごとに保持する件数
+        """
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        """遅延を記録"""
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, stage: str) -> int:
+        """記録件数"""
+        with self._lock:
+            return len(self._samples.get(stage, ()))
+
+    def percentile(self, stage: str, percentile: float) -> Optional[float]:
+        """
+        遅延のパーセンタイルを計算
+
+        Args:
+            stage: 生成ステージ
+            percentile: パーセンタイル（0〜100）
+
+        Returns:
+            遅延（秒）、記録がない場合はNone
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if not samples:
+            return None
+        index = min(int(round(percentile / 100 * (len(samples) - 1))), len(samples) - 1)
+        return samples[index]
+
+
+class HedgeAttempt:
+    """元のリクエスト・重複リクエストの1回分（最初のトークンの通知、採用の確定と中止）"""
+
+    def __init__(self, index: int, on_first_token: Callable[[], None], claim: Callable[[], bool]):
+        """
+        初期化
+
+        Args:
+            index: 0は元のリクエスト、1は重複リクエスト
+            on_first_token: 最初のトークンの到着を記録する関数
+            claim: この呼び出しを採用に確定する関数
+        """
+        self.index = index
+        self.cancelled = threading.Event()
+        self._on_first_token = on_first_token
+        self._claim = claim
+        self._cancel_callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def first_token(self):
+        """最初のトークンの到着を通知"""
+        self._on_first_token()
+
+    def claim(self) -> bool:
+        """
+        この呼び出しを採用に確定（他方は中止する）
+        完了前に確定すると、書き出しなど片方だけが行うべき処理を始められる
+
+        Returns:
+            採用されたかどうか（他方が先に確定していればFalse）
+        """
+        return self._claim()
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """
+        中止時に呼ぶ関数を登録（ストリームを閉じるなど、中止済みならすぐ呼ぶ）
+
+        Args:
+            callback: 引数なしの関数
+        """
+        with self._lock:
+            if not self.cancelled.is_set():
+                self._cancel_callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def cancel(self):
+        """中止（登録された関数を呼び、最初のトークンの前でも受信を終わらせる）"""
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            callbacks, self._cancel_callbacks = self._cancel_callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+
+    @staticmethod
+    def _call(callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception:
+            pass  # 中止の失敗で採用した側を止めない
+
+
+class RequestHedger:
+    """ヘッジリクエストの実行と、重複リクエストの割合の管理"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        percentile: float = 95,
+        max_extra_ratio: float = 0.1,
+        min_samples: int = 10,
+        min_delay: float = 1.0
+    ):
+        """
+        初期化
+
+        Args:
+            enabled: ヘッジを行うかどうか
+            percentile: 重複リクエストを送るまでの待ち時間に使うパーセンタイル
+            max_extra_ratio: 全リクエストに対する重複リクエストの割合の上限
+            min_samples: ヘッジを始めるのに必要な遅延の記録件数
+            min_delay: 待ち時間の下限（秒）
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_extra_ratio = max_extra_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latency = LatencyTracker()
+
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0, 'capacity_denied': 0}
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """
+        設定の更新
+
+        Args:
+            settings: enabled, percentile, max_extra_ratio, min_samples, min_delay
+        """
+        for key, value in settings.items():
+            if hasattr(self, key) and key not in ('latency', 'stats'):
+                setattr(self, key, value)
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        """
+        重複リクエストを送るまでの待ち時間
+
+        Args:
+            stage: 生成ステージ
+
+        Returns:
+            待ち時間（秒）、記録が足りない場合はNone
+        """
+        if self.latency.count(stage) < self.min_samples:
+            return None
+        delay = self.latency.percentile(stage, self.percentile)
+        return max(delay, self.min_delay) if delay is not None else None
+
+    def _try_acquire_hedge(self) -> bool:
+        """重複リクエストの割合が上限内なら枠を確保"""
+        with self._lock:
+            if self.stats['hedged'] + 1 > self.max_extra_ratio * self.stats['requests']:
+                self.stats['budget_denied'] += 1
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def run(
+        self,
+        stage: str,
+        call: Callable[['HedgeAttempt'], Any],
+        acquire_extra: Optional[Callable[[], Optional[Callable[[], None]]]] = None,
+        discard: Optional[Callable[['HedgeAttempt', Any], None]] = None
+    ) -> Any:
+        """
+        リクエストを実行（必要に応じて重複リクエストを送る）
+
+        Args:
+            stage: 生成ステージ
+            call: HedgeAttempt を受け取りレスポンスを返す関数
+                  中止されたら途中で打ち切ってよい（on_cancelでストリームを閉じる）
+            acquire_extra: 重複リクエストの実行枠を確保し、返却する関数を返す関数（空きがなければNone）
+            discard: 採用しなかった呼び出しの (HedgeAttempt, レスポンスまたはNone) を受け取る関数（使用量の記録など）
+
+        Returns:
+            採用したリクエストのレスポンス（先に完了した方、claimした場合はその呼び出し）
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+
+        results: queue.Queue = queue.Queue()
+        progressed = threading.Event()
+        attempts: List[HedgeAttempt] = []
+        state = {'winner': None}
+        state_lock = threading.Lock()
+
+        def claim(index: int) -> bool:
+            with state_lock:
+                if state['winner'] is None:
+                    state['winner'] = index
+                won = state['winner'] == index
+                others = [attempt for attempt in attempts if attempt.index != index] if won else []
+            for other in others:
+                other.cancel()
+            return won
+
+        def lost(index: int) -> bool:
+            with state_lock:
+                return state['winner'] not in (None, index)
+
+        def start(index: int, release: Optional[Callable[[], None]] = None):
+            started = time.perf_counter()
+            first_token = []
+
+            def on_first_token():
+                if not first_token:
+                    first_token.append(True)
+                    self.latency.record(stage, time.perf_counter() - started)
+                    progressed.set()
+
+            attempt = HedgeAttempt(index, on_first_token, lambda: claim(index))
+            with state_lock:
+                attempts.append(attempt)
+            if lost(index):
+                attempt.cancel()
+
+            def run_attempt():
+                response, error = None, None
+                try:
+                    if not attempt.cancelled.is_set():
+                        response = call(attempt)
+                except Exception as e:
+                    error = e
+                finally:
+                    if release is not None:
+                        release()
+                    progressed.set()
+                if error is None and not attempt.cancelled.is_set():
+                    attempt.claim()
+                if lost(index) and discard is not None:
+                    try:
+                        discard(attempt, response)
+                    except Exception:
+                        pass  # 記録の失敗で採用した側を止めない
+                results.put((index, response, error))
+
+            threading.Thread(target=run_attempt, daemon=True).start()
+
+        start(0)
+        pending = 1
+
+        delay = self.hedge_delay(stage)
+        if delay is not None and not progressed.wait(delay):
+            # 実行枠に空きがない（混雑している）場合は重複させない
+            release = acquire_extra() if acquire_extra is not None else (lambda: None)
+            if release is None:
+                with self._lock:
+                    self.stats['capacity_denied'] += 1
+            elif self._try_acquire_hedge():
+                start(1, release)
+                pending += 1
+            else:
+                release()
+
+        error = None
+        while pending:
+            index, response, exc = results.get()
+            pending -= 1
+            with state_lock:
+                winner = state['winner']
+            if winner == index:
+                if exc is not None:
+                    raise exc
+                if index > 0:
+                    with self._lock:
+                        self.stats['hedge_wins'] += 1
+                return response
+            if winner is None:
+                error = error or exc
+
+        raise error
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        ヘッジの統計を取得
+
+        Returns:
+            リクエスト数、重複リクエスト数、重複側が先に完了した回数、上限・実行枠の不足で見送った回数、重複の割合
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats['extra_ratio'] = stats['hedged'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
@@ -0,0 +1,370 @@
+"""
+永続ジョブキュー
+時間のかかる一括生成のジョブを入力ごとSQLiteに保存し、アプリの終了・異常終了後も再開できるようにする
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.concurrency import AdaptiveLimiter
+
+
+# ジョブの状態
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """SQLiteによる永続ジョブキュー"""
+
+    def __init__(self, db_path: Path, max_attempts: int = 3):
+        """
+        初期化（前回実行中だったジョブは待機に戻す）
+
+        Args:
+            db_path: データベースファイルのパス
+            max_attempts: 失敗時に再試行する最大回数
+        """
+        self.db_path = Path(db_path)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+        self.requeue_running()
+
+    def _create_tables(self):
+        """テーブルの作成"""
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    project_path TEXT,
+                    target_id TEXT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    applied INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            self._conn.commit()
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        """行をジョブの辞書に変換"""
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['applied'] = bool(job['applied'])
+        return job
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        project_path: Optional[str] = None,
+        target_id: Optional[str] = None
+    ) -> str:
+        """
+        ジョブを登録
+
+        Args:
+            kind: ジョブの種類
+            payload: 実行に必要な入力（JSONシリアライズ可能なもの）
+            project_path: 結果を反映するプロジェクトのパス
+            target_id: 結果を反映する対象のID（シーンIDなど）
+
+        Returns:
+            ジョブID
+        """
+        job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, project_path, target_id, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, project_path, target_id, json.dumps(payload, ensure_ascii=False), PENDING, now, now)
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        最も古い待機中のジョブを実行中にして取得
+
+        Returns:
+            ジョブ（待機中のジョブがなければNone）
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, datetime.now().isoformat(), row['id'])
+            )
+            self._conn.commit()
+
+        job = self._row_to_job(row)
+        job['status'] = RUNNING
+        job['attempts'] += 1
+        return job
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        """
+        ジョブを完了にして結果を保存
+
+        Args:
+            job_id: ジョブID
+            result: 結果（JSONシリアライズ可能なもの）
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), datetime.now().isoformat(), job_id)
+            )
+            self._conn.commit()
+
+    def fail(self, job_id: str, error: str):
+        """
+        ジョブの失敗を記録（再試行回数が残っていれば待機に戻す）
+
+        Args:
+            job_id: ジョブID
+            error: エラー内容
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            status = PENDING if row and row['attempts'] < self.max_attempts else FAILED
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, datetime.now().isoformat(), job_id)
+            )
+            self._conn.commit()
+
+    def release(self, job_id: str):
+        """
+        実行中のジョブを試行回数に数えずに待機に戻す（一時停止時）
+
+        Args:
+            job_id: ジョブID
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), updated_at = ? WHERE id = ?",
+                (PENDING, datetime.now().isoformat(), job_id)
+            )
+            self._conn.commit()
+
+    def requeue_running(self) -> int:
+        """
+        実行中のまま残ったジョブ（前回の終了・異常終了時）を待機に戻す
+
+        Returns:
+            戻したジョブの数
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (PENDING, datetime.now().isoformat(), RUNNING)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        """
+        失敗したジョブを再試行回数をリセットして待機に戻す
+
+        Returns:
+            戻したジョブの数
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, updated_at = ? WHERE status = ?",
+                (PENDING, datetime.now().isoformat(), FAILED)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def unapplied_results(self, project_path: str) -> List[Dict[str, Any]]:
+        """
+        プロジェクトに未反映の完了ジョブを取得
+
+        Args:
+            project_path: プロジェクトのパス
+
+        Returns:
+            完了順のジョブ
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND applied = 0 AND project_path = ? ORDER BY updated_at",
+                (DONE, project_path)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def mark_applied(self, job_id: str):
+        """
+        結果をプロジェクトに反映済みにする
+
+        Args:
+            job_id: ジョブID
+        """
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET applied = 1 WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        ジョブを取得
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            ジョブ（存在しなければNone）
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """
+        状態別のジョブ数を取得
+
+        Returns:
+            pending, running, done, failed の件数
+        """
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        with self._lock:
+            for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+                counts[row['status']] = row['n']
+        return counts
+
+    def clear_finished(self) -> int:
+        """
+        反映済みの完了ジョブを削除
+
+        Returns:
+            削除したジョブの数
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE status = ? AND applied = 1", (DONE,))
+            self._conn.commit()
+            return cursor.rowcount
+
+
+class JobRunner:
+    """ジョブキューを処理するワーカー"""
+
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]],
+        on_finished: Optional[Callable[[Dict[str, Any]], None]] = None,
+        workers: int = 2,
+        poll_interval: float = 2.0,
+        paused: Optional[Callable[[], bool]] = None,
+        limiter: Optional[AdaptiveLimiter] = None
+    ):
+        """
+        初期化
+
+        Args:
+            job_queue: ジョブキュー
+            handlers: ジョブの種類 -> 入力から結果を作る関数
+            on_finished: ジョブの完了・失敗時に呼ぶ関数（ワーカースレッドから呼ばれる）
+            workers: ワーカー数（limiter指定時はその同時実行数の上限）
+            poll_interval: ジョブがない時の待ち時間（秒）
+            paused: Trueを返す間はジョブを取得しない関数（予算切れなど）
+            limiter: 同時実行数の制御（指定時は実行枠を確保してからジョブを取得）
+        """
+        self.job_queue = job_queue
+        self.handlers = handlers
+        self.on_finished = on_finished
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.paused = paused
+        self.limiter = limiter
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """ワーカーを開始（開始済みなら、同時実行数の上限の引き上げで足りない分だけ追加）"""
+        # 同時に実行するジョブ数はlimiterの実行枠で制限する
+        workers = self.limiter.max_limit if self.limiter else self.workers
+        while len(self._threads) < workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """ワーカーを停止（実行中のジョブは次回起動時に再開）"""
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """ジョブの登録を通知"""
+        self._wakeup.set()
+
+    def _work(self):
+        """ワーカーのループ"""
+        while not self._stop.is_set():
+            if self.paused and self.paused():
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            if self.limiter:
+                self.limiter.acquire()
+            job = self.job_queue.claim()
+            if job is None:
+                if self.limiter:
+                    self.limiter.release(0.0, record=False)
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            started = time.monotonic()
+            error = None
+            handler = self.handlers.get(job['kind'])
+            try:
+                if handler is None:
+                    raise Exception(f"未対応のジョブです: {job['kind']}")
+                self.job_queue.complete(job['id'], handler(job['payload']))
+            except Exception as e:
+                error = e
+                if self.paused and self.paused():
+                    # 実行中に一時停止した場合は失敗に数えず、再開後に実行
+                    self.job_queue.release(job['id'])
+                else:
+                    self.job_queue.fail(job['id'], str(e))
+            finally:
+                if self.limiter:
+                    # 遅延はステージ（中編・長編など）ごとに比べる
+                    stage = job['payload'].get('stage', job['kind'])
+                    self.limiter.release(time.monotonic() - started, error, stage=stage)
+
+            if self.on_finished:
+                try:
+                    self.on_finished(job)
+                except Exception:
+                    pass  # 通知先の失敗でワーカーを止めない
@@ -0,0 +1,229 @@
+"""
+モデルのフォールバック
+再試行可能なエラーや遅延目標（SLO）の超過が起きたモデルを一定時間後回しにし、
+フォールバックチェーンの次のモデルで生成する
+"""
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+# 再試行可能なエラー（google.api_core.exceptions のクラス名）
+_RETRYABLE_ERROR_TYPES = (
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+    'DeadlineExceeded', 'InternalServerError', 'GatewayTimeout', 'Aborted'
+)
+# 再試行可能なHTTPステータス
+_RETRYABLE_STATUS_CODES = (429, 500, 503, 504)
+_THROTTLING_STATUS_CODES = (429,)
+# 例外の種類・ステータスで判定できない場合のメッセージ（数字は単独のステータスコードのみ一致させる）
+_RETRYABLE_MESSAGE_PATTERN = re.compile(
+    r'\b(?:429|500|503|504)\b|resource exhausted|\bquota\b|overloaded|\bunavailable\b|'
+    r'deadline exceeded|timed out|\b(?:read|connect|request|gateway|socket) timeout\b'
+)
+_THROTTLING_MESSAGE_PATTERN = re.compile(r'\b429\b|resource exhausted|\bquota\b|rate limit')
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """
+    例外のHTTPステータス（google.api_core の code、requests の response.status_code）
+
+    Args:
+        error: 発生した例外
+
+    Returns:
+        ステータスコード、取得できない場合はNone
+    """
+    code = getattr(error, 'code', None)
+    if code is None:
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if callable(code):
+        return None  # gRPCのcode()はHTTPステータスではない
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    別のモデルで再試行すべきエラーかどうか
+
+    Args:
+        error: 発生した例外
+
+    Returns:
+        過負荷・タイムアウト・一時的なサーバーエラーならTrue
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in _RETRYABLE_ERROR_TYPES:
+        return True
+    code = _status_code(error)
+    if code is not None:
+        return code in _RETRYABLE_STATUS_CODES
+    return bool(_RETRYABLE_MESSAGE_PATTERN.search(str(error).lower()))
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    レート制限・クォータ超過によるエラーかどうか
+
+    Args:
+        error: 発生した例外
+
+    Returns:
+        スロットリングならTrue
+    """
+    if type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    code = _status_code(error)
+    if code is not None:
+        return code in _THROTTLING_STATUS_CODES
+    return bool(_THROTTLING_MESSAGE_PATTERN.search(str(error).lower()))
+
+
+# 通信できないことを示すエラー（例外のクラス名）
+_CONNECTIVITY_ERROR_TYPES = (
+    'ConnectionError', 'ConnectError', 'ConnectTimeout', 'ConnectTimeoutError',
+    'NewConnectionError', 'NameResolutionError', 'ProxyError', 'OfflineError'
+)
+# gRPCなどで接続失敗がサーバーエラーとして返る場合のメッセージ
+_CONNECTIVITY_MESSAGES = (
+    'failed to connect', 'connection refused', 'connection reset', 'network is unreachable',
+    'name resolution', 'dns resolution failed', 'temporary failure in name resolution',
+    'no route to host', 'getaddrinfo failed', 'max retries exceeded'
+)
+
+
+def is_connectivity_error(error: Exception) -> bool:
+    """
+    ネットワークに接続できないことによるエラーかどうか（サーバーの過負荷は含まない）
+
+    Args:
+        error: 発生した例外
+
+    Returns:
+        接続できない・名前解決できない場合はTrue
+    """
+    if isinstance(error, ConnectionError):
+        return True
+    if any(cls.__name__ in _CONNECTIVITY_ERROR_TYPES for cls in type(error).__mro__):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _CONNECTIVITY_MESSAGES)
+
+
+class GenerationResult(str):
+    """生成したモデル名を保持する生成結果（文字列として扱える）"""
+
+    def __new__(cls, text: str, model: Optional[str] = None, stage: Optional[str] = None):
+        result = super().__new__(cls, text)
+        result.model = model
+        result.stage = stage
+        return result
+
+
+class ModelHealth:
+    """モデル別のエラー・遅延の統計と、後回しにするモデルの管理"""
+
+    def __init__(self, cooldown: float = 300):
+        """
+        初期化
+
+        Args:
+            cooldown: エラー・SLO超過のあったモデルを後回しにする時間（秒）
+        """
+        self.cooldown = cooldown
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._demoted_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model_name: str) -> Dict[str, Any]:
+        """モデルの統計（ロック取得済みで呼ぶ）"""
+        return self._stats.setdefault(model_name, {
+            'calls': 0,
+            'errors': 0,
+            'retryable_errors': 0,
+            'slo_violations': 0,
+            'seconds': 0.0,
+            'max_seconds': 0.0
+        })
+
+    def record_success(self, model_name: str, seconds: float, slo: float = 0, slo_seconds: Optional[float] = None):
+        """
+        成功した呼び出しを記録（SLOを超えていれば後回しにする）
+
+        Args:
+            model_name: モデル名
+            seconds: 所要時間（秒）
+            slo: ステージの遅延目標（秒、0以下は目標なし）
+            slo_seconds: 遅延目標と比べる時間（最初のトークンまでなど、Noneの場合は所要時間）
+        """
+        if slo_seconds is None:
+            slo_seconds = seconds
+        with self._lock:
+            stats = self._model_stats(model_name)
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if slo and slo > 0 and slo_seconds > slo:
+                stats['slo_violations'] += 1
+                self._demoted_until[model_name] = time.monotonic() + self.cooldown
+            else:
+                self._demoted_until.pop(model_name, None)
+
+    def record_error(self, model_name: str, retryable: bool):
+        """
+        失敗した呼び出しを記録（再試行可能なエラーなら後回しにする）
+
+        Args:
+            model_name: モデル名
+            retryable: 再試行可能なエラーかどうか
+        """
+        with self._lock:
+            stats = self._model_stats(model_name)
+            stats['calls'] += 1
+            stats['errors'] += 1
+            if retryable:
+                stats['retryable_errors'] += 1
+                self._demoted_until[model_name] = time.monotonic() + self.cooldown
+
+    def order(self, chain: List[str]) -> List[str]:
+        """
+        チェーンを試す順に並べる（後回し中のモデルは末尾へ、順序は維持）
+
+        Args:
+            chain: フォールバックチェーン
+
+        Returns:
+            試す順のモデル名
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = [name for name in chain if self._demoted_until.get(name, 0) <= now]
+        return healthy + [name for name in chain if name not in healthy]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        モデル別の統計を取得
+
+        Returns:
+            モデル名 -> 呼び出し数、エラー数、エラー率、SLO超過数、平均・最大時間（ミリ秒）、後回し中かどうか
+        """
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                successes = stats['calls'] - stats['errors']
+                result[name] = {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'error_rate': stats['errors'] / stats['calls'] if stats['calls'] else 0.0,
+                    'slo_violations': stats['slo_violations'],
+                    'avg_ms': stats['seconds'] / successes * 1000 if successes else 0.0,
+                    'max_ms': stats['max_seconds'] * 1000,
+                    'demoted': self._demoted_until.get(name, 0) > now
+                }
+            return result
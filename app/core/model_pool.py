@@ -0,0 +1,121 @@
+"""
+モデルプール
+(モデル名, 生成設定) ごとのモデルインスタンスを再利用する
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ModelPool:
+    """モデルインスタンスのキー付きプール（LRU、スレッドセーフ）"""
+
+    def __init__(self, max_size: int = 16, idle_timeout: float = 1800.0):
+        """
+        初期化
+
+        Args:
+            max_size: 保持する最大インスタンス数
+            idle_timeout: 未使用のまま破棄するまでの秒数
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._credential_token: Optional[str] = None
+
+    @staticmethod
+    def make_key(model_name: str, generation_config: Optional[Dict[str, Any]]) -> Tuple:
+        """
+        プールのキーを作成
+
+        Args:
+            model_name: モデル名
+            generation_config: 生成設定
+
+        Returns:
+            ハッシュ可能なキー
+        """
+        items = tuple(sorted((generation_config or {}).items(), key=lambda item: item[0]))
+        return (model_name, repr(items))
+
+    def get(
+        self,
+        model_name: str,
+        generation_config: Optional[Dict[str, Any]],
+        factory: Callable[[str, Optional[Dict[str, Any]]], Any]
+    ) -> Any:
+        """
+        モデルを取得（なければ作成してプールに追加）
+
+        Args:
+            model_name: モデル名
+            generation_config: 生成設定
+            factory: モデルを作成する関数 (model_name, generation_config) -> model
+
+        Returns:
+            モデルインスタンス
+        """
+        key = self.make_key(model_name, generation_config)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], now)
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # 作成はロックの外で行う（同時作成時は先に登録されたものを使う）
+        model = factory(model_name, generation_config)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                model = entry[0]
+            self._entries[key] = (model, now)
+            self._entries.move_to_end(key)
+            self._evict(now)
+
+        return model
+
+    def _evict(self, now: float):
+        """未使用のエントリと上限超過分を破棄（ロック取得済みで呼ぶ）"""
+        expired = [
+            key for key, (_, last_used) in self._entries.items()
+            if now - last_used > self.idle_timeout
+        ]
+        for key in expired:
+            del self._entries[key]
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def bind_credentials(self, token: str):
+        """
+        認証情報の切り替えを通知（変わった場合はプールを破棄）
+
+        モデルは作成時のクライアント（APIキー）を保持するため、
+        APIキーが変わったら古いインスタンスは使えない。
+
+        Args:
+            token: 認証情報を識別する値（APIキーのハッシュなど）
+        """
+        with self._lock:
+            if self._credential_token != token:
+                self._entries.clear()
+                self._credential_token = token
+
+    def clear(self):
+        """プールを空にする"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
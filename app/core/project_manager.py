@@ -3,9 +3,11 @@
 プロジェクトの作成、保存、読み込みを管理
 """
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 from datetime import datetime
 from app.utils.json_handler import JSONHandler
+from app.utils.character_names import normalize_name
+from app.core.condensed_context import carry_over_summary
 
 
 class ProjectManager:
@@ -15,6 +17,27 @@ class ProjectManager:
         self.current_project: Optional[Dict[str, Any]] = None
         self.current_project_path: Optional[str] = None
         self.json_handler = JSONHandler()
+        # 変更通知のリスナー（kind, item_id）
+        self.change_listeners: List[Callable[[str, Optional[str]], None]] = []
+
+    def add_change_listener(self, listener: Callable[[str, Optional[str]], None]):
+        """
+        変更通知のリスナーを登録
+
+        Args:
+            listener: (kind, item_id) を受け取る関数
+                kind: character / world / style / scene / budget / project
+        """
+        if listener not in self.change_listeners:
+            self.change_listeners.append(listener)
+
+    def _notify_change(self, kind: str, item_id: Optional[str] = None):
+        """リスナーに変更を通知"""
+        for listener in list(self.change_listeners):
+            try:
+                listener(kind, item_id)
+            except Exception:
+                pass  # 通知先の失敗で保存処理を止めない
 
     def create_new_project(self, name: str, save_path: str) -> Dict[str, Any]:
         """
@@ -33,6 +56,7 @@ class ProjectManager:
 
         # プロジェクトを保存
         self.save_project()
+        self._notify_change('project')
 
         return project_data
 
@@ -78,6 +102,7 @@ class ProjectManager:
 
         self.current_project = project_data
         self.current_project_path = file_path
+        self._notify_change('project')
 
         return project_data
 
@@ -85,6 +110,7 @@ class ProjectManager:
         """プロジェクトを閉じる"""
         self.current_project = None
         self.current_project_path = None
+        self._notify_change('project')
 
     def add_character(self, character_data: Dict[str, str]) -> None:
         """
@@ -102,6 +128,37 @@ class ProjectManager:
 
         self.current_project['characters'].append(character_data)
         self.save_project()
+        self._notify_change('character', character_id)
+
+    def add_characters(self, characters: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        複数のキャラクターをまとめて追加（保存は1回）
+
+        Args:
+            characters: キャラクター情報のリスト
+
+        Returns:
+            追加されたキャラクター（名前が既存・重複のものは除外）
+        """
+        if not self.current_project:
+            raise Exception("プロジェクトが開かれていません")
+
+        seen = {normalize_name(char.get('name', '')) for char in self.current_project['characters']}
+        added = []
+        for character_data in characters:
+            key = normalize_name(character_data.get('name', ''))
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            character_data['id'] = self._generate_id()
+            added.append(character_data)
+
+        if added:
+            self.current_project['characters'].extend(added)
+            self.save_project()
+            self._notify_change('character')
+
+        return added
 
     def update_character(self, character_id: str, character_data: Dict[str, str]) -> None:
         """
@@ -117,8 +174,11 @@ class ProjectManager:
         for i, char in enumerate(self.current_project['characters']):
             if char.get('id') == character_id:
                 character_data['id'] = character_id
+                # 内容が変わっていなければ要約を引き継ぐ
+                carry_over_summary(char, character_data)
                 self.current_project['characters'][i] = character_data
                 self.save_project()
+                self._notify_change('character', character_id)
                 return
 
         raise Exception("指定されたキャラクターが見つかりません")
@@ -138,6 +198,7 @@ class ProjectManager:
             if char.get('id') != character_id
         ]
         self.save_project()
+        self._notify_change('character', character_id)
 
     def get_characters(self) -> List[Dict[str, str]]:
         """
@@ -180,8 +241,40 @@ class ProjectManager:
         if not self.current_project:
             raise Exception("プロジェクトが開かれていません")
 
+        carry_over_summary(self.current_project.get('world_settings'), world_data)
         self.current_project['world_settings'] = world_data
         self.save_project()
+        self._notify_change('world')
+
+    def set_condensed_summaries(
+        self,
+        character_summaries: Dict[str, Dict[str, str]],
+        world_summary: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        キャラクター・世界観の要約をまとめて保存
+
+        Args:
+            character_summaries: キャラクターIDをキーとした要約（hash, text）
+            world_summary: 世界観の要約（hash, text）
+        """
+        if not self.current_project:
+            raise Exception("プロジェクトが開かれていません")
+
+        for char in self.current_project['characters']:
+            summary = character_summaries.get(char.get('id'))
+            if summary:
+                char['condensed'] = summary
+
+        if world_summary and self.current_project['world_settings']:
+            self.current_project['world_settings']['condensed'] = world_summary
+
+        self.save_project()
+        # 要約を使うプロンプト用ブロックを作り直させる
+        if character_summaries:
+            self._notify_change('character')
+        if world_summary:
+            self._notify_change('world')
 
     def get_world_settings(self) -> Dict[str, str]:
         """
@@ -212,6 +305,7 @@ class ProjectManager:
 
         self.current_project['scenes'].append(scene_data)
         self.save_project()
+        self._notify_change('scene', scene_id)
 
     def update_scene(self, scene_id: str, scene_data: Dict[str, Any]) -> None:
         """
@@ -231,10 +325,80 @@ class ProjectManager:
                 scene_data['updated_at'] = datetime.now().isoformat()
                 self.current_project['scenes'][i] = scene_data
                 self.save_project()
+                self._notify_change('scene', scene_id)
                 return
 
         raise Exception("指定されたシーンが見つかりません")
 
+    def add_scene_history(self, scene_id: str, entries: List[Dict[str, Any]]) -> None:
+        """
+        シーンの履歴（採用しなかった生成候補など）に追加
+
+        Args:
+            scene_id: シーンID
+            entries: 履歴の項目（stage, text, created_at）
+        """
+        if not self.current_project:
+            raise Exception("プロジェクトが開かれていません")
+
+        scene = self.get_scene_by_id(scene_id)
+        if not scene:
+            raise Exception("指定されたシーンが見つかりません")
+
+        scene.setdefault('history', []).extend(entries)
+        self.save_project()
+
+    def apply_generated_content(
+        self,
+        scene_id: str,
+        content: str,
+        job_id: str,
+        stage: str,
+        model: Optional[str] = None
+    ) -> bool:
+        """
+        一括生成ジョブの結果をシーンの本文に反映（同じジョブは一度だけ反映）
+        元の本文はジョブIDを付けてシーンの履歴に残す
+
+        Args:
+            scene_id: シーンID
+            content: 生成された本文
+            job_id: ジョブID
+            stage: 生成ステージ
+            model: 生成したモデル
+
+        Returns:
+            反映したかどうか（シーンがない・反映済みの場合はFalse）
+        """
+        if not self.current_project:
+            raise Exception("プロジェクトが開かれていません")
+
+        scene = self.get_scene_by_id(scene_id)
+        if not scene:
+            return False
+
+        history = scene.setdefault('history', [])
+        if any(entry.get('job_id') == job_id for entry in history):
+            return False
+
+        now = datetime.now().isoformat()
+        history.append({
+            'stage': 'previous',
+            'text': scene.get('content', ''),
+            'model': scene.get('model'),
+            'job_id': job_id,
+            'replaced_by': stage,
+            'created_at': now
+        })
+        scene['content'] = content
+        scene['updated_at'] = now
+        if model:
+            scene['model'] = model
+
+        self.save_project()
+        self._notify_change('scene', scene_id)
+        return True
+
     def delete_scene(self, scene_id: str) -> None:
         """
         シーンを削除
@@ -250,6 +414,7 @@ class ProjectManager:
             if scene.get('id') != scene_id
         ]
         self.save_project()
+        self._notify_change('scene', scene_id)
 
     def reorder_scenes(self, scene_ids: List[str]) -> None:
         """
@@ -273,6 +438,7 @@ class ProjectManager:
         # シーンリストを更新
         self.current_project['scenes'] = new_scenes
         self.save_project()
+        self._notify_change('scene')
 
     def get_scenes(self) -> List[Dict[str, Any]]:
         """
@@ -305,6 +471,31 @@ class ProjectManager:
 
         return None
 
+    def get_story_summary(self) -> Optional[Dict[str, Any]]:
+        """
+        これまでのあらすじの要約データを取得
+
+        Returns:
+            要約データ（未作成の場合はNone）
+        """
+        if not self.current_project:
+            return None
+
+        return self.current_project.get('story_summary')
+
+    def set_story_summary(self, summary_data: Dict[str, Any]) -> None:
+        """
+        これまでのあらすじの要約データを保存
+
+        Args:
+            summary_data: 要約データ
+        """
+        if not self.current_project:
+            raise Exception("プロジェクトが開かれていません")
+
+        self.current_project['story_summary'] = summary_data
+        self.save_project()
+
     def set_writing_style(self, style_data: Dict[str, str]) -> None:
         """
         文体スタイルを設定
@@ -317,6 +508,7 @@ class ProjectManager:
 
         self.current_project['writing_style'] = style_data
         self.save_project()
+        self._notify_change('style')
 
     def get_writing_style(self) -> Dict[str, str]:
         """
@@ -336,6 +528,33 @@ class ProjectManager:
 
         return self.current_project['writing_style']
 
+    def get_budget(self) -> Dict[str, Any]:
+        """
+        プロジェクトの予算を取得
+
+        Returns:
+            token_limit（トークン数の上限）, cost_limit（料金の上限、米ドル）（0は無制限）
+        """
+        budget = {'token_limit': 0, 'cost_limit': 0.0}
+        if self.current_project:
+            budget.update(self.current_project.get('budget') or {})
+        return budget
+
+    def set_budget(self, token_limit: int, cost_limit: float) -> None:
+        """
+        プロジェクトの予算を設定
+
+        Args:
+            token_limit: トークン数の上限（0は無制限）
+            cost_limit: 料金の上限（米ドル、0は無制限）
+        """
+        if not self.current_project:
+            raise Exception("プロジェクトが開かれていません")
+
+        self.current_project['budget'] = {'token_limit': token_limit, 'cost_limit': cost_limit}
+        self.save_project()
+        self._notify_change('budget')
+
     def get_project_name(self) -> str:
         """
         プロジェクト名を取得
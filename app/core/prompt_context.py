@@ -0,0 +1,162 @@
+"""
+プロンプトコンテキストキャッシュ
+キャラクター・世界観・文体のプロンプト用ブロックを、種類ごとの版（プロジェクトの変更で更新）が変わるまで再利用する
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def content_hash(data: Any) -> str:
+    """
+    データの内容ハッシュを計算
+
+    Args:
+        data: JSONシリアライズ可能なデータ
+
+    Returns:
+        SHA-1の16進文字列
+    """
+    serialized = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class PromptContextCache:
+    """整形済みコンテキストブロックのキャッシュ"""
+
+    def __init__(self, max_entries: int = 512):
+        """
+        初期化
+
+        Args:
+            max_entries: 保持する最大ブロック数
+        """
+        self.max_entries = max_entries
+        # (種類, 識別子) -> (作成時の版, ブロック)
+        self._blocks: Dict[Tuple[str, str], Tuple[Tuple[int, int], str]] = {}
+        # 種類ごとの版（破棄のたびに進める）と、すべて破棄した回数
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # スレッドごとのヒット・ミス数（呼び出しごとの計測用）
+        self._thread_counts = threading.local()
+        # コンテキスト組み立てに要した累計時間（秒）
+        self.assembly_seconds = 0.0
+        self.assembly_count = 0
+
+    def get(self, kind: str, data: Any, builder: Callable[[Any], str], item_id: str = '') -> str:
+        """
+        ブロックを取得（種類の版が変わっていなければキャッシュを返す）
+        元データの変更はinvalidateで通知する（取得のたびに内容を比べない）
+
+        Args:
+            kind: ブロックの種類（character, world, style など）
+            data: ブロックの元データ
+            builder: ブロックを作成する関数
+            item_id: 同じ種類の中での識別子（キャラクターIDなど、種類に1つだけの場合は空）
+
+        Returns:
+            整形済みのブロック
+        """
+        key = (kind, item_id)
+
+        with self._lock:
+            version = self._version(kind)
+            cached = self._blocks.get(key)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                self._count_thread('hits')
+                return cached[1]
+            self.misses += 1
+            self._count_thread('misses')
+
+        block = builder(data)
+
+        with self._lock:
+            if len(self._blocks) >= self.max_entries:
+                self._blocks.clear()
+            # 作成中に破棄された場合は古い版のまま保存し、次の取得で作り直す
+            self._blocks[key] = (version, block)
+
+        return block
+
+    def _version(self, kind: str) -> Tuple[int, int]:
+        """種類の現在の版（"character:condensed" は "character" の版、ロック取得済みで呼ぶ）"""
+        return self._epoch, self._versions.get(kind.split(':')[0], 0)
+
+    def _count_thread(self, key: str):
+        """このスレッドのヒット・ミス数を加算"""
+        setattr(self._thread_counts, key, getattr(self._thread_counts, key, 0) + 1)
+
+    def take_thread_counts(self) -> Tuple[int, int]:
+        """
+        このスレッドで前回の取得以降に発生したヒット・ミス数を取得してリセット
+
+        Returns:
+            (ヒット数, ミス数)
+        """
+        counts = (getattr(self._thread_counts, 'hits', 0), getattr(self._thread_counts, 'misses', 0))
+        self._thread_counts.hits = 0
+        self._thread_counts.misses = 0
+        return counts
+
+    def record_assembly(self, seconds: float):
+        """コンテキスト組み立て時間を記録"""
+        with self._lock:
+            self.assembly_seconds += seconds
+            self.assembly_count += 1
+
+    def invalidate(self, kind: Optional[str] = None):
+        """
+        キャッシュの破棄
+
+        Args:
+            kind: 破棄する種類（Noneの場合はすべて、"character" は "character:condensed" も含む）
+        """
+        with self._lock:
+            if kind is None:
+                self._epoch += 1
+                self._blocks.clear()
+            else:
+                self._versions[kind] = self._versions.get(kind, 0) + 1
+                self._blocks = {
+                    key: block for key, block in self._blocks.items()
+                    if key[0] != kind and not key[0].startswith(kind + ':')
+                }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        キャッシュの統計を取得
+
+        Returns:
+            ヒット数、ミス数、組み立て時間の合計と平均（ミリ秒）
+        """
+        with self._lock:
+            average = self.assembly_seconds / self.assembly_count if self.assembly_count else 0.0
+            return {
+                'entries': len(self._blocks),
+                'hits': self.hits,
+                'misses': self.misses,
+                'assembly_ms_total': self.assembly_seconds * 1000,
+                'assembly_ms_avg': average * 1000
+            }
+
+
+class Stopwatch:
+    """経過時間の計測（with文で使用）"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        return False
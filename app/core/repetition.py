@@ -0,0 +1,126 @@
+"""
+生成の繰り返しの検出
+ストリーミング中の本文の文字n-gramをローリングハッシュで記録し、
+直近の本文のほとんどが既出のn-gramになったら（同じ段落のループなど）生成を打ち切る
+日本語は単語の区切りがないため、文字単位のn-gramで判定する
+"""
+from collections import deque
+from typing import Dict, List
+
+
+# ローリングハッシュの法と基数
+_HASH_MOD = (1 << 61) - 1
+_HASH_BASE = 1_000_003
+
+# 打ち切り位置を文の区切りまで戻す際の区切り文字
+_SENTENCE_ENDS = "。！？!?」』\n"
+
+
+class RepetitionError(Exception):
+    """繰り返しを検出して打ち切った生成"""
+
+    def __init__(self, clean_length: int, repeated_chars: int, text: str = ""):
+        """
+        初期化
+
+        Args:
+            clean_length: 繰り返しが始まる前までの本文の文字数
+            repeated_chars: 打ち切った繰り返し部分の文字数
+            text: 繰り返しが始まる前までの本文（スプールに書き出さない生成の場合）
+        """
+        super().__init__(f"生成の繰り返しを検出したため打ち切りました（{repeated_chars}文字）")
+        self.clean_length = clean_length
+        self.repeated_chars = repeated_chars
+        self.text = text
+
+
+class RepetitionDetector:
+    """文字n-gramのローリングハッシュによる繰り返しの検出"""
+
+    def __init__(self, ngram: int = 20, window: int = 300, ratio: float = 0.8):
+        """
+        初期化
+
+        Args:
+            ngram: n-gramの文字数（短い決まり文句の繰り返しは検出しない長さ）
+            window: 判定する直近の文字数
+            ratio: 直近の文字のうち既出のn-gramの割合がこれ以上なら繰り返しとみなす
+        """
+        self.ngram = ngram
+        self.window = window
+        self.ratio = ratio
+        self.length = 0
+        self._high_power = pow(_HASH_BASE, ngram - 1, _HASH_MOD)
+        self._hash = 0
+        self._chars: deque = deque()
+        # n-gramのハッシュ -> 最初に現れた終端位置
+        self._seen: Dict[int, int] = {}
+        # 各文字が既出のn-gramの終端かどうかと、直近window文字のうちの既出の数
+        self._flags: List[bool] = []
+        self._repeated = 0
+        self._text: List[str] = []
+
+    def feed(self, text: str) -> bool:
+        """
+        本文を追加
+
+        Args:
+            text: 追加する本文（ストリーミングのチャンク）
+
+        Returns:
+            繰り返しを検出したかどうか
+        """
+        detected = False
+        for char in text:
+            self._text.append(char)
+            if len(self._chars) == self.ngram:
+                oldest = self._chars.popleft()
+                self._hash = (self._hash - ord(oldest) * self._high_power) % _HASH_MOD
+            self._chars.append(char)
+            self._hash = (self._hash * _HASH_BASE + ord(char)) % _HASH_MOD
+
+            repeated = False
+            if len(self._chars) == self.ngram:
+                first = self._seen.setdefault(self._hash, self.length)
+                repeated = first != self.length
+            self.length += 1
+
+            self._flags.append(repeated)
+            self._repeated += repeated
+            if len(self._flags) > self.window:
+                self._repeated -= self._flags[-self.window - 1]
+            if len(self._flags) >= self.window and self._repeated >= self.window * self.ratio:
+                detected = True
+        return detected
+
+    def clean_length(self) -> int:
+        """
+        繰り返しが始まる前までの文字数（直前の文の区切りまで戻す）
+
+        Returns:
+            文字数
+        """
+        # 末尾から、既出でないn-gramがn文字続く所まで戻った位置を繰り返しの始まりとする
+        run_start = None
+        fresh = 0
+        for position in range(len(self._flags) - 1, -1, -1):
+            if self._flags[position]:
+                run_start = position
+                fresh = 0
+            else:
+                fresh += 1
+                if fresh >= self.ngram:
+                    break
+        if run_start is None:
+            return self.length
+
+        # 最初に既出になったn-gramの先頭が繰り返しの始まり
+        # （直前の文字が偶然一致して数文字早まるため、すぐ後の文の区切りを優先する）
+        cut = max(run_start - self.ngram + 1, 0)
+        for position in range(max(cut, 1), min(cut + self.ngram // 4, self.length) + 1):
+            if self._text[position - 1] in _SENTENCE_ENDS:
+                return position
+        for position in range(cut, 0, -1):
+            if self._text[position - 1] in _SENTENCE_ENDS:
+                return position
+        return cut
@@ -0,0 +1,252 @@
+"""
+シーン検索インデックス
+プロジェクトのシーン本文から、関連する過去の場面を文字n-gramのTF-IDFで検索する
+"""
+import re
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+
+class SceneIndex:
+    """文字n-gram（ハッシュ化）TF-IDFによるシーン本文の検索インデックス"""
+
+    def __init__(self, dim: int = 2 ** 18, ngram_sizes: Iterable[int] = (2, 3), passage_chars: int = 400):
+        """
+        初期化
+
+        Args:
+            dim: n-gramをハッシュする次元数
+            ngram_sizes: 使用する文字n-gramの長さ
+            passage_chars: 1パッセージの目安の文字数
+        """
+        self.dim = dim
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.passage_chars = passage_chars
+
+        # パッセージ: scene_id -> [{'text', 'indices', 'weights'}]
+        self._passages: Dict[str, List[Dict[str, Any]]] = {}
+        self._titles: Dict[str, str] = {}
+        self._hashes: Dict[str, int] = {}
+        self._df = np.zeros(dim, dtype=np.float32)
+        self._lock = threading.RLock()
+
+        # 検索用に連結した配列（更新時に遅延再構築）
+        self._packed: Optional[Dict[str, Any]] = None
+
+    # ========== 構築・更新 ==========
+
+    def rebuild(self, scenes: List[Dict[str, Any]]):
+        """
+        全シーンからインデックスを作り直す
+
+        Args:
+            scenes: シーンのリスト
+        """
+        with self._lock:
+            self._passages.clear()
+            self._titles.clear()
+            self._hashes.clear()
+            self._df[:] = 0
+            self._packed = None
+            for scene in scenes:
+                self.update_scene(scene)
+
+    def update_scene(self, scene: Dict[str, Any]):
+        """
+        シーンを追加・更新（本文が変わっていなければ何もしない）
+
+        Args:
+            scene: シーン情報
+        """
+        scene_id = scene.get('id')
+        if not scene_id:
+            return
+
+        content = scene.get('content', '') or ''
+        content_crc = zlib.crc32(content.encode('utf-8'))
+
+        with self._lock:
+            self._titles[scene_id] = scene.get('title', '')
+            if self._hashes.get(scene_id) == content_crc:
+                return
+
+            self._remove_passages(scene_id)
+            passages = []
+            for text in self._split_passages(content):
+                indices, weights = self._vectorize(text)
+                if len(indices) == 0:
+                    continue
+                self._df[indices] += 1
+                passages.append({'text': text, 'indices': indices, 'weights': weights})
+
+            self._passages[scene_id] = passages
+            self._hashes[scene_id] = content_crc
+            self._packed = None
+
+    def remove_scene(self, scene_id: str):
+        """
+        シーンをインデックスから削除
+
+        Args:
+            scene_id: シーンID
+        """
+        with self._lock:
+            self._remove_passages(scene_id)
+            self._titles.pop(scene_id, None)
+            self._hashes.pop(scene_id, None)
+            self._packed = None
+
+    def _remove_passages(self, scene_id: str):
+        """シーンのパッセージを文書頻度ごと取り除く"""
+        for passage in self._passages.pop(scene_id, []):
+            self._df[passage['indices']] -= 1
+
+    def _split_passages(self, content: str) -> List[str]:
+        """本文を段落単位でおよそpassage_chars文字ずつに分割"""
+        paragraphs = [p.strip() for p in re.split(r'\n\s*\n|\n', content) if p.strip()]
+        passages = []
+        current = ''
+        for paragraph in paragraphs:
+            if current and len(current) + len(paragraph) > self.passage_chars:
+                passages.append(current)
+                current = ''
+            current = f"{current}\n{paragraph}" if current else paragraph
+            # 長すぎる段落はそのまま区切る
+            while len(current) > self.passage_chars * 2:
+                passages.append(current[:self.passage_chars])
+                current = current[self.passage_chars:]
+        if current:
+            passages.append(current)
+        return passages
+
+    def _vectorize(self, text: str):
+        """
+        テキストをハッシュ化n-gramの (インデックス, 対数TF) に変換
+
+        Returns:
+            (ソート済みインデックス配列, 重み配列)
+        """
+        normalized = re.sub(r'\s+', '', text)
+        hashes = []
+        for n in self.ngram_sizes:
+            for i in range(len(normalized) - n + 1):
+                hashes.append(zlib.crc32(normalized[i:i + n].encode('utf-8')) % self.dim)
+
+        if not hashes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        indices, counts = np.unique(np.asarray(hashes, dtype=np.int64), return_counts=True)
+        return indices, (1.0 + np.log(counts)).astype(np.float32)
+
+    def _pack(self) -> Dict[str, Any]:
+        """全パッセージを連結した配列を作成（ロック取得済みで呼ぶ）"""
+        if self._packed is not None:
+            return self._packed
+
+        refs = []
+        index_parts = []
+        weight_parts = []
+        offsets = []
+        position = 0
+        for scene_id, passages in self._passages.items():
+            for passage in passages:
+                refs.append((scene_id, passage['text']))
+                index_parts.append(passage['indices'])
+                weight_parts.append(passage['weights'])
+                offsets.append(position)
+                position += len(passage['indices'])
+
+        self._packed = {
+            'refs': refs,
+            'indices': np.concatenate(index_parts) if index_parts else np.zeros(0, dtype=np.int64),
+            'weights': np.concatenate(weight_parts) if weight_parts else np.zeros(0, dtype=np.float32),
+            'offsets': np.asarray(offsets, dtype=np.int64)
+        }
+        return self._packed
+
+    # ========== 検索 ==========
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        scene_ids: Optional[Set[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        クエリに関連するパッセージを検索
+
+        Args:
+            query: 検索クエリ（シーンのタイトル・概要など）
+            top_k: 返す件数
+            scene_ids: 検索対象のシーンID（Noneの場合はすべて）
+
+        Returns:
+            scene_id, title, text, score を含む結果（スコア降順）
+        """
+        with self._lock:
+            packed = self._pack()
+            refs = packed['refs']
+            if not refs:
+                return []
+
+            query_indices, query_weights = self._vectorize(query)
+            if len(query_indices) == 0:
+                return []
+
+            passage_count = len(refs)
+            idf = np.log((passage_count + 1) / (self._df + 1)).astype(np.float32) + 1.0
+
+            query_vector = np.zeros(self.dim, dtype=np.float32)
+            query_vector[query_indices] = query_weights * idf[query_indices]
+            query_vector /= np.linalg.norm(query_vector) or 1.0
+
+            doc_values = packed['weights'] * idf[packed['indices']]
+            offsets = packed['offsets']
+            dots = np.add.reduceat(query_vector[packed['indices']] * doc_values, offsets)
+            norms = np.sqrt(np.add.reduceat(doc_values * doc_values, offsets))
+            scores = dots / np.maximum(norms, 1e-9)
+
+            if scene_ids is not None:
+                mask = np.array([ref[0] in scene_ids for ref in refs])
+                scores = np.where(mask, scores, -1.0)
+
+            order = np.argsort(-scores)[:top_k]
+            results = []
+            for i in order:
+                if scores[i] <= 0:
+                    break
+                scene_id, text = refs[i]
+                results.append({
+                    'scene_id': scene_id,
+                    'title': self._titles.get(scene_id, ''),
+                    'text': text,
+                    'score': float(scores[i])
+                })
+            return results
+
+
+def select_within_budget(results: List[Dict[str, Any]], estimator, budget: int) -> List[str]:
+    """
+    検索結果をトークン予算内で上位から選び、プロンプト用に整形
+
+    Args:
+        results: SceneIndex.search の結果
+        estimator: TokenEstimator
+        budget: 使用できるトークン数
+
+    Returns:
+        整形済みのパッセージ（「タイトル」本文）
+    """
+    passages = []
+    used = 0
+    for result in results:
+        text = f"「{result['title']}」より\n{result['text']}"
+        cost = estimator.estimate(text)
+        if used + cost > budget:
+            continue
+        passages.append(text)
+        used += cost
+    return passages
@@ -0,0 +1,198 @@
+"""
+優先度スケジューラ
+API呼び出しの実行枠を優先度順に割り当てる（画面操作の呼び出しを一括処理より先に実行し、
+待ち時間に応じて優先度を上げることで一括処理も止まらないようにする）
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+# 優先度（小さいほど優先）
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+class PriorityScheduler:
+    """優先度付きの同時実行枠の割り当て"""
+
+    def __init__(self, max_concurrent: int = 6, reserved_interactive: int = 2, aging_seconds: float = 15.0):
+        """
+        初期化
+
+        Args:
+            max_concurrent: 同時に実行するAPI呼び出しの上限
+            reserved_interactive: 一括処理が使えない（画面操作用に残す）枠の数
+            aging_seconds: 待ち時間がこの秒数増えるごとに優先度を1上げる
+        """
+        self.max_concurrent = max_concurrent
+        self.reserved_interactive = reserved_interactive
+        self.aging_seconds = aging_seconds
+
+        self._waiting: List[Dict[str, Any]] = []
+        self._running = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+        self.stats = {
+            'granted': {INTERACTIVE: 0, BACKGROUND: 0},
+            'wait_seconds': {INTERACTIVE: 0.0, BACKGROUND: 0.0},
+            'aged_grants': 0
+        }
+
+    def configure(self, max_concurrent: int):
+        """
+        同時実行数の上限を変更
+
+        Args:
+            max_concurrent: 同時に実行するAPI呼び出しの上限
+        """
+        with self._condition:
+            self.max_concurrent = max(max_concurrent, 1)
+            self._condition.notify_all()
+
+    # ========== 優先度の指定 ==========
+
+    @contextmanager
+    def priority(self, level: int):
+        """
+        このスレッドで行う呼び出しの優先度を指定（with文で使用）
+
+        Args:
+            level: INTERACTIVE または BACKGROUND
+        """
+        previous = self.current_priority()
+        self._local.level = level
+        try:
+            yield
+        finally:
+            self._local.level = previous
+
+    def current_priority(self) -> int:
+        """このスレッドの優先度（指定がなければ画面操作）"""
+        return getattr(self._local, 'level', INTERACTIVE)
+
+    # ========== 実行枠 ==========
+
+    @contextmanager
+    def slot(self):
+        """現在の優先度で実行枠を確保して処理を行う（with文で使用）"""
+        level = self.acquire(self.current_priority())
+        try:
+            yield
+        finally:
+            self.release(level)
+
+    def acquire(self, priority: int) -> int:
+        """
+        実行枠を確保（順番が来るまで待つ）
+
+        Args:
+            priority: 優先度
+
+        Returns:
+            実行枠の種類（releaseに渡す）
+        """
+        level = INTERACTIVE if priority <= INTERACTIVE else BACKGROUND
+        ticket = {'priority': priority, 'enqueued': time.monotonic(), 'sequence': next(self._sequence)}
+
+        with self._condition:
+            self._waiting.append(ticket)
+            while not self._can_run(ticket):
+                # 待ち時間による優先度の変化を反映するため定期的に再評価
+                self._condition.wait(timeout=max(self.aging_seconds / 2, 0.1))
+            self._waiting.remove(ticket)
+            self._running[level] += 1
+            # 次の待機者も空き枠があれば続けて実行できるように通知
+            self._condition.notify_all()
+
+            waited = time.monotonic() - ticket['enqueued']
+            self.stats['granted'][level] += 1
+            self.stats['wait_seconds'][level] += waited
+            if level == BACKGROUND and self._effective_priority(ticket, time.monotonic()) <= INTERACTIVE:
+                self.stats['aged_grants'] += 1
+        return level
+
+    def try_acquire(self, priority: int) -> Optional[int]:
+        """
+        すぐに実行できる場合だけ実行枠を確保（待っている呼び出しがあれば確保しない）
+
+        Args:
+            priority: 優先度
+
+        Returns:
+            実行枠の種類（releaseに渡す）、確保できない場合はNone
+        """
+        level = INTERACTIVE if priority <= INTERACTIVE else BACKGROUND
+        ticket = {'priority': priority, 'enqueued': time.monotonic(), 'sequence': next(self._sequence)}
+
+        with self._condition:
+            self._waiting.append(ticket)
+            can_run = self._can_run(ticket)
+            self._waiting.remove(ticket)
+            if not can_run:
+                return None
+            self._running[level] += 1
+            self.stats['granted'][level] += 1
+        return level
+
+    def release(self, level: int):
+        """
+        実行枠を返却
+
+        Args:
+            level: acquireが返した実行枠の種類
+        """
+        with self._condition:
+            self._running[level] -= 1
+            self._condition.notify_all()
+
+    def _effective_priority(self, ticket: Dict[str, Any], now: float) -> float:
+        """待ち時間を考慮した優先度"""
+        return ticket['priority'] - (now - ticket['enqueued']) / self.aging_seconds
+
+    def _can_run(self, ticket: Dict[str, Any]) -> bool:
+        """チケットが実行できるか（ロック取得済みで呼ぶ）"""
+        running = self._running[INTERACTIVE] + self._running[BACKGROUND]
+        if running >= self.max_concurrent:
+            return False
+
+        now = time.monotonic()
+        first = min(self._waiting, key=lambda t: (self._effective_priority(t, now), t['sequence']))
+        if first is not ticket:
+            return False
+
+        if ticket['priority'] > INTERACTIVE:
+            # 十分待った一括処理は画面操作用の枠も使える（飢餓の防止）
+            aged = self._effective_priority(ticket, now) <= INTERACTIVE
+            background_limit = max(self.max_concurrent - self.reserved_interactive, 1)
+            if not aged and self._running[BACKGROUND] >= background_limit:
+                return False
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        スケジューラの統計を取得
+
+        Returns:
+            実行中・待機中の数、優先度別の割り当て数と平均待ち時間（ミリ秒）、待ち時間で優先された一括処理の数
+        """
+        with self._condition:
+            result = {
+                'running': {
+                    'interactive': self._running[INTERACTIVE],
+                    'background': self._running[BACKGROUND]
+                },
+                'waiting': len(self._waiting),
+                'aged_grants': self.stats['aged_grants']
+            }
+            for level, name in ((INTERACTIVE, 'interactive'), (BACKGROUND, 'background')):
+                granted = self.stats['granted'][level]
+                result[name] = {
+                    'granted': granted,
+                    'avg_wait_ms': self.stats['wait_seconds'][level] / granted * 1000 if granted else 0.0
+                }
+            return result
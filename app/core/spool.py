@@ -0,0 +1,216 @@
+"""
+生成途中の本文のスプール
+ストリーミングで届いたチャンクを逐次ファイルに書き出し、異常終了・通信切断後も途中の本文を復元できるようにする
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def read_spool(path: Path) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    スプールファイルを読み込む
+
+    Args:
+        path: スプールファイルのパス
+
+    Returns:
+        (ヘッダー, 本文)、ファイルがない・壊れている場合は (None, "")
+    """
+    path = Path(path)
+    if not path.exists():
+        return None, ""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            header_line = f.readline()
+            text = f.read()
+        return json.loads(header_line), text
+    except (IOError, ValueError):
+        return None, ""
+
+
+class SpoolFile:
+    """1つの生成の途中経過を書き出すファイル（1行目はヘッダー、以降は本文）"""
+
+    def __init__(self, path: Path, key: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        初期化
+
+        Args:
+            path: スプールファイルのパス
+            key: 生成の入力を識別するキー（一致する場合のみ途中の本文を再利用）
+            metadata: ヘッダーに保存する情報（ステージ、タイトルなど）
+        """
+        self.path = Path(path)
+        self.key = key
+        self.metadata = metadata or {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def read(self) -> str:
+        """
+        このキーの途中の本文を取得
+
+        Returns:
+            途中の本文（ない・キーが違う場合は空）
+        """
+        with self._lock:
+            if self._file:
+                self._file.flush()
+            header, text = read_spool(self.path)
+        if not header or header.get('key') != self.key:
+            return ""
+        return text
+
+    def size(self) -> int:
+        """途中の本文の文字数"""
+        return len(self.read())
+
+    def _open(self):
+        """追記用に開く（キーが違う・ない場合は作り直す、ロック取得済みで呼ぶ）"""
+        if self._file:
+            return
+        header, _text = read_spool(self.path)
+        if header and header.get('key') == self.key:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = dict(self.metadata, key=self.key, created_at=datetime.now().isoformat())
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._file.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+    def write(self, text: str):
+        """
+        チャンクを追記してディスクに書き出す
+
+        Args:
+            text: チャンクのテキスト
+        """
+        if not text:
+            return
+        with self._lock:
+            self._open()
+            self._file.write(text)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def truncate(self, length: int):
+        """
+        途中の本文を先頭から指定の文字数までに切り詰める（繰り返しを検出した場合など）
+
+        Args:
+            length: 残す文字数
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            header, text = read_spool(self.path)
+            if not header or header.get('key') != self.key or len(text) <= length:
+                return
+            temp_path = self.path.with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(header, ensure_ascii=False) + "\n")
+                f.write(text[:length])
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+
+    def close(self):
+        """ファイルを閉じる（内容は残す）"""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """スプールファイルを削除"""
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SpoolDirectory:
+    """スプールファイルの置き場所"""
+
+    def __init__(self, root: Path):
+        """
+        初期化
+
+        Args:
+            root: スプールファイルを置くディレクトリ
+        """
+        self.root = Path(root)
+
+    def path_for(self, name: str) -> Path:
+        """
+        スプールファイルのパス
+
+        Args:
+            name: ジョブIDなどの名前
+
+        Returns:
+            パス
+        """
+        return self.root / f"{name}.spool"
+
+    def open(self, name: str, key: str, metadata: Optional[Dict[str, Any]] = None) -> SpoolFile:
+        """
+        スプールファイルを開く
+
+        Args:
+            name: ジョブIDなどの名前
+            key: 生成の入力を識別するキー
+            metadata: ヘッダーに保存する情報
+
+        Returns:
+            SpoolFile
+        """
+        return SpoolFile(self.path_for(name), key, metadata)
+
+    def discard(self, name: str):
+        """
+        スプールファイルを削除
+
+        Args:
+            name: ジョブIDなどの名前
+        """
+        SpoolFile(self.path_for(name), '').discard()
+
+    def rename(self, name: str, new_name: str):
+        """
+        スプールファイルの名前を変更（別の名前のファイルがあれば置き換える）
+
+        Args:
+            name: 現在の名前
+            new_name: 新しい名前
+        """
+        try:
+            os.replace(self.path_for(name), self.path_for(new_name))
+        except FileNotFoundError:
+            pass
+
+    def recoverable(self, prefix: str = "") -> List[Dict[str, Any]]:
+        """
+        途中の本文が残っているスプールを列挙
+
+        Args:
+            prefix: 名前の接頭辞で絞り込む
+
+        Returns:
+            name, header, text を含む辞書のリスト
+        """
+        if not self.root.exists():
+            return []
+        spools = []
+        for path in sorted(self.root.glob(f"{prefix}*.spool")):
+            header, text = read_spool(path)
+            if header and text.strip():
+                spools.append({'name': path.stem, 'header': header, 'text': text})
+        return spools
@@ -0,0 +1,218 @@
+"""
+物語の要約（これまでのあらすじ）
+シーンごとの要約と、それを束ねた階層的な要約をプロジェクトに保持し、
+変更されたシーンとその祖先だけを作り直す
+ブロックの区切りは位置ではなくシーンIDで決めるため、シーンの挿入・削除で後ろのブロックがずれない
+"""
+from typing import Any, Callable, Dict, List, Optional
+from app.core.prompt_context import content_hash
+
+
+class StorySummary:
+    """シーン要約を葉とする階層的な要約（各ノードは子の要約を平均fan_out個程度束ねる）"""
+
+    def __init__(self, fan_out: int = 5):
+        """
+        初期化
+
+        Args:
+            fan_out: 1つの上位要約が束ねる子の平均的な数（最大でその2倍）
+        """
+        self.fan_out = fan_out
+        # 直近のupdateで作り直した要約の数
+        self.last_recomputed = 0
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        """保存データの初期値"""
+        # scenes: scene_id -> {'hash', 'text'}、nodes: 子ハッシュ列のハッシュ -> 要約
+        return {'scenes': {}, 'nodes': {}}
+
+    def _leaves(self, data: Dict[str, Any], scenes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """本文のあるシーンの葉（ハッシュと要約、未作成ならNone）を順に列挙"""
+        leaves = []
+        for scene in scenes:
+            content = scene.get('content', '')
+            if not scene.get('id') or not content:
+                continue
+            leaf_hash = content_hash([scene.get('title', ''), content])
+            stored = data['scenes'].get(scene['id'])
+            text = stored['text'] if stored and stored.get('hash') == leaf_hash else None
+            leaves.append({
+                'id': scene['id'], 'key': scene['id'], 'hash': leaf_hash, 'text': text, 'scene': scene,
+                'start': len(leaves), 'end': len(leaves) + 1
+            })
+        return leaves
+
+    def _is_boundary(self, key: str, level: int) -> bool:
+        """子の後ろでブロックを閉じるか（階層ごとに異なる、およそfan_out個に1つ）"""
+        return int(content_hash([level, key])[:8], 16) % self.fan_out == 0
+
+    def _group(self, items: List[Dict[str, Any]], level: int) -> List[Dict[str, Any]]:
+        """
+        1階層分の子をブロックに分ける
+
+        Args:
+            items: 子（hash, key, start, end）の列
+            level: 作成するブロックの階層（1が葉の1つ上）
+
+        Returns:
+            区切りで閉じたブロック（hash, key, group, start, end）の列（末尾の閉じていない子は含まない）
+        """
+        parents = []
+        group: List[Dict[str, Any]] = []
+        for item in items:
+            group.append(item)
+            # 子1つだけのブロックは作らない、長く区切りがない場合は上限で閉じる
+            closed = len(group) >= 2 and self._is_boundary(item['key'], level)
+            if closed or len(group) >= self.fan_out * 2:
+                parents.append({
+                    'hash': content_hash([child['hash'] for child in group]),
+                    'key': item['key'],
+                    'group': group,
+                    'start': group[0]['start'],
+                    'end': group[-1]['end']
+                })
+                group = []
+        return parents
+
+    def update(
+        self,
+        data: Optional[Dict[str, Any]],
+        scenes: List[Dict[str, Any]],
+        summarize_scene: Callable[[Dict[str, Any]], str],
+        summarize_group: Callable[[List[str]], str],
+        run_batch: Optional[Callable[[Callable, List[Any]], List[Any]]] = None,
+        before_scene_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        変更のあった要約だけを作り直す
+
+        Args:
+            data: 保存済みの要約データ（Noneの場合は新規）
+            scenes: シーン（物語順）
+            summarize_scene: シーンから要約を作る関数
+            summarize_group: 子の要約の列から上位の要約を作る関数
+            run_batch: (関数, 項目) を並列に実行する関数（Noneの場合は順に実行）
+            before_scene_id: このシーンより前だけを作り直す（以降の古い要約は作り直さず残す）
+
+        Returns:
+            更新後の要約データ
+        """
+        data = data or self._empty()
+        data.setdefault('scenes', {})
+        data.setdefault('nodes', {})
+        run_batch = run_batch or (lambda func, targets: [func(target) for target in targets])
+        recomputed = 0
+
+        # 葉: シーン要約（作り直しが必要なものをまとめて要約）
+        leaves = self._leaves(data, scenes)
+        target_ids = [scene.get('id') for scene in scenes]
+        if before_scene_id in target_ids:
+            target_ids = target_ids[:target_ids.index(before_scene_id)]
+        target_ids = set(target_ids)
+        stale = [leaf for leaf in leaves if leaf['text'] is None and leaf['id'] in target_ids]
+        for leaf, text in zip(stale, run_batch(lambda leaf: summarize_scene(leaf['scene']), stale)):
+            leaf['text'] = text
+        recomputed += len(stale)
+
+        for leaf in leaves:
+            if leaf['text'] is not None:
+                data['scenes'][leaf['id']] = {'hash': leaf['hash'], 'text': leaf['text']}
+        items = leaves
+
+        live_scene_ids = {scene.get('id') for scene in scenes}
+        data['scenes'] = {
+            scene_id: entry for scene_id, entry in data['scenes'].items()
+            if scene_id in live_scene_ids
+        }
+
+        # 上位ノード: 区切りで閉じたブロックごとに要約（子が変わらなければ再利用）
+        live_nodes = {}
+        level = 0
+        while len(items) >= 2:
+            level += 1
+            parents = self._group(items, level)
+            if not parents:
+                break
+            for parent in parents:
+                parent['text'] = data['nodes'].get(parent['hash'])
+
+            # 同じ階層の作り直しはまとめて要約（要約のない子を含むブロックは作らない）
+            stale = [
+                parent for parent in parents
+                if parent['text'] is None and all(item['text'] is not None for item in parent['group'])
+            ]
+            texts = run_batch(lambda parent: summarize_group([item['text'] for item in parent['group']]), stale)
+            for parent, text in zip(stale, texts):
+                parent['text'] = text
+            recomputed += len(stale)
+
+            for parent in parents:
+                if parent['text'] is not None:
+                    live_nodes[parent['hash']] = parent['text']
+            items = parents
+
+        data['nodes'] = live_nodes
+        self.last_recomputed = recomputed
+        return data
+
+    def compose(
+        self,
+        data: Optional[Dict[str, Any]],
+        scenes: List[Dict[str, Any]],
+        before_scene_id: Optional[str] = None
+    ) -> str:
+        """
+        指定シーンより前の「これまでのあらすじ」を組み立てる
+        （閉じたブロックは上位の要約を使うため、長さは物語の長さにほぼ依存しない）
+
+        Args:
+            data: 要約データ
+            scenes: シーン（物語順）
+            before_scene_id: このシーンより前を対象にする（Noneの場合はすべて）
+
+        Returns:
+            あらすじ（要約が未作成の部分は含まれない）
+        """
+        if not data:
+            return ""
+
+        # 対象範囲のシーンの葉
+        leaves = []
+        for scene in scenes:
+            if scene.get('id') == before_scene_id:
+                break
+            stored = data.get('scenes', {}).get(scene.get('id'))
+            if stored:
+                leaves.append({
+                    'key': scene['id'], 'hash': stored['hash'], 'text': stored['text'],
+                    'start': len(leaves), 'end': len(leaves) + 1
+                })
+
+        # 各階層のブロックを、葉の開始位置から引けるように作成（updateと同じ区切り）
+        levels = [{leaf['start']: leaf for leaf in leaves}]
+        nodes = data.get('nodes', {})
+        items = leaves
+        while len(items) >= 2:
+            items = self._group(items, len(levels))
+            if not items:
+                break
+            for item in items:
+                item['text'] = nodes.get(item['hash'])
+            levels.append({item['start']: item for item in items})
+
+        # 先頭から、その位置で始まり要約のある最上位のブロックを貪欲に選ぶ
+        parts = []
+        position = 0
+        while position < len(leaves):
+            for level in range(len(levels) - 1, -1, -1):
+                block = levels[level].get(position)
+                if block and block['text']:
+                    parts.append(block['text'])
+                    position = block['end']
+                    break
+            else:
+                position += 1
+
+        return "\n".join(parts)
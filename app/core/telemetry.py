@@ -0,0 +1,220 @@
+"""
+生成の計測記録
+API呼び出しごとの所要時間・トークン数・失敗をSQLiteに保存し、ステージ別の分布や日別の使用量を集計する
+"""
+import math
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+# 記録する項目（列名）
+TELEMETRY_FIELDS = [
+    'project', 'stage', 'model', 'status', 'error', 'priority',
+    'prompt_chars', 'output_chars', 'prompt_tokens', 'output_tokens',
+    'queue_ms', 'ttft_ms', 'latency_ms', 'retries', 'cache_hits', 'cache_misses', 'streamed'
+]
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """
+    パーセンタイル（最近傍順位法）
+
+    Args:
+        values: 値
+        percent: パーセント（0〜100）
+
+    Returns:
+        パーセンタイル値（値がなければNone）
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class TelemetryStore:
+    """API呼び出しの計測記録"""
+
+    def __init__(self, db_path: Path, retention_days: int = 90):
+        """
+        初期化（保存期間を過ぎた記録は削除）
+
+        Args:
+            db_path: データベースファイルのパス
+            retention_days: 記録の保存期間（日）
+        """
+        self.db_path = Path(db_path)
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+        self.prune()
+
+    def _create_tables(self):
+        """テーブルの作成"""
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    project TEXT,
+                    stage TEXT,
+                    model TEXT,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    priority TEXT,
+                    prompt_chars INTEGER,
+                    output_chars INTEGER,
+                    prompt_tokens INTEGER,
+                    output_tokens INTEGER,
+                    queue_ms REAL,
+                    ttft_ms REAL,
+                    latency_ms REAL,
+                    retries INTEGER NOT NULL DEFAULT 0,
+                    cache_hits INTEGER NOT NULL DEFAULT 0,
+                    cache_misses INTEGER NOT NULL DEFAULT 0,
+                    streamed INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # 以前のバージョンで作成したテーブルに列を追加
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(calls)")}
+            if 'project' not in columns:
+                self._conn.execute("ALTER TABLE calls ADD COLUMN project TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_day ON calls (day, stage)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_project ON calls (project)")
+            self._conn.commit()
+
+    def record(self, **fields):
+        """
+        1回の呼び出しを記録
+
+        Args:
+            fields: TELEMETRY_FIELDS の項目（stage, model, status, latency_ms など）
+        """
+        now = datetime.now()
+        values = {field: fields.get(field) for field in TELEMETRY_FIELDS}
+        for field in ('retries', 'cache_hits', 'cache_misses'):
+            values[field] = values[field] or 0
+        values['streamed'] = int(bool(values['streamed']))
+        values['status'] = values['status'] or 'ok'
+
+        columns = ['created_at', 'day'] + TELEMETRY_FIELDS
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO calls ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [now.isoformat(), now.strftime('%Y-%m-%d')] + [values[field] for field in TELEMETRY_FIELDS]
+            )
+            self._conn.commit()
+
+    def prune(self) -> int:
+        """
+        保存期間を過ぎた記録を削除
+
+        Returns:
+            削除した件数
+        """
+        since = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM calls WHERE day < ?", (since,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _since(self, days: int) -> str:
+        """集計対象の最初の日"""
+        return (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+    def stage_summary(self, days: int = 7) -> Dict[str, Dict[str, Any]]:
+        """
+        ステージ別の所要時間の分布
+
+        Args:
+            days: 集計する日数（今日を含む）
+
+        Returns:
+            ステージ -> count, errors, retries, p50_ms, p95_ms, ttft_p50_ms, ttft_p95_ms, cache_hit_rate
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, status, latency_ms, ttft_ms, retries, cache_hits, cache_misses "
+                "FROM calls WHERE day >= ?",
+                (self._since(days),)
+            ).fetchall()
+
+        grouped: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            grouped.setdefault(row['stage'] or '', []).append(row)
+
+        summary = {}
+        for stage, stage_rows in grouped.items():
+            succeeded = [row for row in stage_rows if row['status'] == 'ok']
+            latencies = [row['latency_ms'] for row in succeeded if row['latency_ms'] is not None]
+            ttfts = [row['ttft_ms'] for row in succeeded if row['ttft_ms'] is not None]
+            hits = sum(row['cache_hits'] for row in stage_rows)
+            lookups = hits + sum(row['cache_misses'] for row in stage_rows)
+            summary[stage] = {
+                'count': len(stage_rows),
+                'errors': sum(1 for row in stage_rows if row['status'] == 'error'),
+                'retries': sum(row['retries'] for row in stage_rows),
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'ttft_p50_ms': percentile(ttfts, 50),
+                'ttft_p95_ms': percentile(ttfts, 95),
+                'cache_hit_rate': hits / lookups if lookups else None
+            }
+        return summary
+
+    def daily_tokens(self, days: int = 14) -> List[Dict[str, Any]]:
+        """
+        日別のトークン使用量
+
+        Args:
+            days: 集計する日数（今日を含む）
+
+        Returns:
+            日付順の day, calls, errors, prompt_tokens, output_tokens
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, COUNT(*) AS calls, "
+                "SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END) AS errors, "
+                "COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens, "
+                "COALESCE(SUM(output_tokens), 0) AS output_tokens "
+                "FROM calls WHERE day >= ? GROUP BY day ORDER BY day",
+                (self._since(days),)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def usage(self, project: Optional[str] = None, day: Optional[str] = None) -> Dict[str, int]:
+        """
+        トークンの使用量の合計（予算の計算用、保存期間内の記録のみ）
+
+        Args:
+            project: プロジェクトのパスで絞り込む
+            day: 日付（YYYY-MM-DD）で絞り込む
+
+        Returns:
+            prompt_tokens, output_tokens
+        """
+        conditions, params = [], []
+        if project is not None:
+            conditions.append("project = ?")
+            params.append(project)
+        if day is not None:
+            conditions.append("day = ?")
+            params.append(day)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens, "
+                "COALESCE(SUM(output_tokens), 0) AS output_tokens FROM calls" + where,
+                params
+            ).fetchone()
+        return dict(row)
@@ -0,0 +1,175 @@
+"""
+トークン見積もりと予算管理
+プロンプトのコンテキストをステージごとの入力トークン上限に収める
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+
+# ひらがな・カタカナ・漢字・全角記号
+_CJK_PATTERN = re.compile(r'[　-ヿ㐀-䶿一-鿿＀-￯]')
+
+
+class TokenEstimator:
+    """ローカルのヒューリスティックによるトークン数見積もり（実測値で補正可能）"""
+
+    # 日本語は1文字あたり約1トークン、英数字は約4文字で1トークン
+    CJK_TOKENS_PER_CHAR = 1.0
+    OTHER_CHARS_PER_TOKEN = 4.0
+
+    def __init__(self, smoothing: float = 0.2):
+        """
+        初期化
+
+        Args:
+            smoothing: 補正係数の更新に使う指数移動平均の重み
+        """
+        self.smoothing = smoothing
+        self.scale = 1.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def raw_estimate(self, text: str) -> float:
+        """補正前の見積もり"""
+        if not text:
+            return 0.0
+        cjk = len(_CJK_PATTERN.findall(text))
+        other = len(text) - cjk
+        return cjk * self.CJK_TOKENS_PER_CHAR + other / self.OTHER_CHARS_PER_TOKEN
+
+    def estimate(self, text: str) -> int:
+        """
+        トークン数の見積もり
+
+        Args:
+            text: 対象テキスト
+
+        Returns:
+            見積もりトークン数
+        """
+        return int(round(self.raw_estimate(text) * self.scale))
+
+    def calibrate(self, text: str, actual_tokens: int):
+        """
+        実測値で補正係数を更新
+
+        Args:
+            text: 計測したテキスト
+            actual_tokens: APIが返した実際のトークン数
+        """
+        raw = self.raw_estimate(text)
+        if raw <= 0 or actual_tokens <= 0:
+            return
+
+        ratio = actual_tokens / raw
+        with self._lock:
+            if self.samples == 0:
+                self.scale = ratio
+            else:
+                self.scale = (1 - self.smoothing) * self.scale + self.smoothing * ratio
+            self.samples += 1
+
+
+class ContextSection:
+    """予算調整の対象となるコンテキストの1区画"""
+
+    def __init__(
+        self,
+        name: str,
+        text: str,
+        priority: int,
+        abbreviated: Optional[str] = None,
+        required: bool = False
+    ):
+        """
+        初期化
+
+        Args:
+            name: 区画名
+            text: 本文
+            priority: 優先度（小さいものから削られる）
+            abbreviated: 短縮版の本文（Noneの場合は短縮せずに削除）
+            required: 削除・短縮しないかどうか
+        """
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.abbreviated = abbreviated
+        self.required = required
+        self.state = 'full'  # full / abbreviated / dropped
+
+    @property
+    def current_text(self) -> str:
+        """現在の状態の本文"""
+        if self.state == 'dropped':
+            return ''
+        if self.state == 'abbreviated':
+            return self.abbreviated or ''
+        return self.text
+
+
+class TokenBudgeter:
+    """入力トークン上限に合わせてコンテキストを短縮・削除する"""
+
+    def __init__(self, estimator: TokenEstimator):
+        """
+        初期化
+
+        Args:
+            estimator: トークン見積もり
+        """
+        self.estimator = estimator
+
+    def fit(
+        self,
+        sections: List[ContextSection],
+        budget: int,
+        fixed_tokens: int = 0
+    ) -> Dict[str, Any]:
+        """
+        区画を予算内に収める（優先度の低いものから、まず短縮、次に削除）
+
+        Args:
+            sections: コンテキストの区画（状態はその場で更新される）
+            budget: 入力トークン上限（0以下は無制限）
+            fixed_tokens: 区画以外のプロンプト部分のトークン数
+
+        Returns:
+            estimated: 調整後の見積もりトークン数
+            abbreviated / dropped: 短縮・削除された区画名
+        """
+        costs = {id(section): self.estimator.estimate(section.text) for section in sections}
+        total = fixed_tokens + sum(costs.values())
+
+        if budget > 0 and total > budget:
+            candidates = sorted(
+                (section for section in sections if not section.required),
+                key=lambda section: section.priority
+            )
+
+            # 1巡目: 短縮
+            for section in candidates:
+                if total <= budget:
+                    break
+                if section.abbreviated is None:
+                    continue
+                short_cost = self.estimator.estimate(section.abbreviated)
+                if short_cost < costs[id(section)]:
+                    total -= costs[id(section)] - short_cost
+                    costs[id(section)] = short_cost
+                    section.state = 'abbreviated'
+
+            # 2巡目: 削除
+            for section in candidates:
+                if total <= budget:
+                    break
+                total -= costs[id(section)]
+                costs[id(section)] = 0
+                section.state = 'dropped'
+
+        return {
+            'estimated': total,
+            'abbreviated': [s.name for s in sections if s.state == 'abbreviated'],
+            'dropped': [s.name for s in sections if s.state == 'dropped']
+        }
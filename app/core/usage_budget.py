@@ -0,0 +1,194 @@
+"""
+トークン・料金の予算
+プロジェクト単位と1日単位の使用量を予算と照らし合わせ、しきい値で警告し、
+使い切った後は一括処理（低優先度の呼び出し）を止める
+"""
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class BudgetExceededError(Exception):
+    """予算を使い切ったため実行しない呼び出し"""
+
+
+class UsageBudget:
+    """トークン・料金の予算と使用量"""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, on_warning: Optional[Callable[[str], None]] = None):
+        """
+        初期化
+
+        Args:
+            settings: Config.get_budget_settings() の値
+            on_warning: しきい値を超えた時に呼ぶ関数（生成スレッドから呼ばれる）
+        """
+        self.on_warning = on_warning
+        self.settings: Dict[str, Any] = {}
+        self.project: Optional[str] = None
+        # 開いているプロジェクトの上限（プロジェクトのファイルに保存、0は無制限）
+        self.project_limits: Dict[str, Any] = {'token_limit': 0, 'cost_limit': 0.0}
+        self._day = datetime.now().strftime('%Y-%m-%d')
+        self._usage = {
+            'daily': {'prompt_tokens': 0, 'output_tokens': 0},
+            'project': {'prompt_tokens': 0, 'output_tokens': 0}
+        }
+        # 警告済みのしきい値（範囲ごと、日付・プロジェクトが変わるとリセット）
+        self._warned: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.configure(settings or {})
+
+    def configure(self, settings: Dict[str, Any]):
+        """
+        予算の設定を変更
+
+        Args:
+            settings: daily_token_limit, daily_cost_limit,
+                input_price_per_million, output_price_per_million, warn_ratios（0の上限は無制限）
+        """
+        with self._lock:
+            self.settings = dict(settings)
+            self._warned = {}
+
+    def set_project_limits(self, limits: Dict[str, Any]):
+        """
+        開いているプロジェクトの上限を変更
+
+        Args:
+            limits: token_limit, cost_limit（ProjectManager.get_budget() の値、0は無制限）
+        """
+        with self._lock:
+            self.project_limits = dict(limits)
+            self._warned = {key: ratio for key, ratio in self._warned.items() if not key.startswith('project')}
+
+    def load(self, project: Optional[str], telemetry=None, limits: Optional[Dict[str, Any]] = None):
+        """
+        プロジェクトの切り替え（これまでの使用量を計測記録から読み込む）
+
+        Args:
+            project: プロジェクトのパス（Noneは未選択）
+            telemetry: TelemetryStore（Noneの場合は0から数える）
+            limits: プロジェクトの上限（token_limit, cost_limit、Noneは無制限）
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        daily = telemetry.usage(day=today) if telemetry else None
+        project_usage = telemetry.usage(project=project) if telemetry and project else None
+        with self._lock:
+            self.project = project
+            self.project_limits = dict(limits or {'token_limit': 0, 'cost_limit': 0.0})
+            self._day = today
+            self._usage['daily'] = daily or {'prompt_tokens': 0, 'output_tokens': 0}
+            self._usage['project'] = project_usage or {'prompt_tokens': 0, 'output_tokens': 0}
+            self._warned = {}
+
+    def _roll_day(self):
+        """日付が変わっていれば1日の使用量をリセット（ロック取得済みで呼ぶ）"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if today != self._day:
+            self._day = today
+            self._usage['daily'] = {'prompt_tokens': 0, 'output_tokens': 0}
+            self._warned = {key: ratio for key, ratio in self._warned.items() if not key.startswith('daily')}
+
+    def _cost(self, usage: Dict[str, int]) -> float:
+        """使用量の料金"""
+        return (
+            usage['prompt_tokens'] * self.settings.get('input_price_per_million', 0.0)
+            + usage['output_tokens'] * self.settings.get('output_price_per_million', 0.0)
+        ) / 1_000_000
+
+    def _limits(self, scope: str) -> Tuple[float, float]:
+        """範囲の (トークン上限, 料金上限)（1日はアプリの設定、プロジェクトはプロジェクトごと）"""
+        if scope == 'project':
+            return self.project_limits.get('token_limit', 0), self.project_limits.get('cost_limit', 0.0)
+        return self.settings.get('daily_token_limit', 0), self.settings.get('daily_cost_limit', 0.0)
+
+    def _ratios(self) -> Dict[str, float]:
+        """上限が設定された範囲ごとの使用率（ロック取得済みで呼ぶ）"""
+        ratios = {}
+        for scope in ('daily', 'project'):
+            if scope == 'project' and not self.project:
+                continue
+            usage = self._usage[scope]
+            token_limit, cost_limit = self._limits(scope)
+            if token_limit and token_limit > 0:
+                ratios[f'{scope}_tokens'] = (usage['prompt_tokens'] + usage['output_tokens']) / token_limit
+            if cost_limit and cost_limit > 0:
+                ratios[f'{scope}_cost'] = self._cost(usage) / cost_limit
+        return ratios
+
+    def record(self, prompt_tokens: int, output_tokens: int):
+        """
+        使用量を加算し、しきい値を超えていれば警告
+
+        Args:
+            prompt_tokens: 入力トークン数
+            output_tokens: 出力トークン数
+        """
+        messages: List[str] = []
+        with self._lock:
+            self._roll_day()
+            for scope in ('daily', 'project'):
+                self._usage[scope]['prompt_tokens'] += prompt_tokens or 0
+                self._usage[scope]['output_tokens'] += output_tokens or 0
+
+            for key, ratio in self._ratios().items():
+                crossed = [
+                    threshold for threshold in sorted(self.settings.get('warn_ratios', [0.8, 0.95]) + [1.0])
+                    if ratio >= threshold > self._warned.get(key, 0)
+                ]
+                if crossed:
+                    self._warned[key] = crossed[-1]
+                    messages.append(self._warning_message(key, ratio))
+
+        if self.on_warning:
+            for message in messages:
+                self.on_warning(message)
+
+    @staticmethod
+    def _warning_message(key: str, ratio: float) -> str:
+        """警告の文言"""
+        scope, kind = key.split('_')
+        label = f"{'本日' if scope == 'daily' else 'プロジェクト'}の{'トークン' if kind == 'tokens' else '料金'}予算"
+        if ratio >= 1.0:
+            return f"{label}を使い切りました。一括処理を停止しています"
+        return f"{label}の{int(ratio * 100)}%を使用しました"
+
+    def exhausted(self) -> bool:
+        """いずれかの予算を使い切ったか"""
+        with self._lock:
+            self._roll_day()
+            return any(ratio >= 1.0 for ratio in self._ratios().values())
+
+    def check_background(self):
+        """
+        一括処理の呼び出しを実行してよいか確認
+
+        Raises:
+            BudgetExceededError: 予算を使い切っている場合
+        """
+        if self.exhausted():
+            raise BudgetExceededError("予算を使い切ったため一括処理を実行しません（予算の設定を見直してください）")
+
+    def remaining(self) -> Dict[str, Dict[str, Any]]:
+        """
+        範囲ごとの残りの予算
+
+        Returns:
+            daily / project -> tokens（残りトークン、上限なしはNone）, cost（残り料金、上限なしはNone）
+        """
+        with self._lock:
+            self._roll_day()
+            result = {}
+            for scope in ('daily', 'project'):
+                if scope == 'project' and not self.project:
+                    continue
+                usage = self._usage[scope]
+                token_limit, cost_limit = self._limits(scope)
+                result[scope] = {
+                    'tokens': max(token_limit - usage['prompt_tokens'] - usage['output_tokens'], 0)
+                    if token_limit and token_limit > 0 else None,
+                    'cost': max(cost_limit - self._cost(usage), 0.0) if cost_limit and cost_limit > 0 else None,
+                    'used_tokens': usage['prompt_tokens'] + usage['output_tokens'],
+                    'used_cost': self._cost(usage)
+                }
+            return result
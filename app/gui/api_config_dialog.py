@@ -4,8 +4,30 @@ Gemini APIの設定を管理
 """
 import customtkinter as ctk
 from tkinter import messagebox
-from typing import Callable, Optional
-
+from typing import Callable, Optional, Dict, Any
+from app.utils.config import GENERATION_STAGES, GENERATION_STAGE_LABELS
+
+
+# 選択可能なモデル
+MODEL_CHOICES = [
+    "gemini-2.5-pro",
+    "gemini-2.5-flash",
+    "gemini-2.5-flash-lite",
+    "gemini-2.0-flash",
+    "gemini-2.0-flash-lite",
+    "gemini-2.0-flash-exp",
+    "gemini-1.5-pro",
+    "gemini-1.5-flash"
+]
+
+# プロファイルで共通のAPI設定を使う場合の表示
+INHERIT_LABEL = "（共通設定）"
+
+# 生成の呼び出し先（表示名 -> 設定値）
+BACKEND_CHOICES = {
+    "Gemini API": "gemini",
+    "偽のバックエンド（オフライン・負荷試験用）": "fake"
+}
 
 class APIConfigDialog(ctk.CTkToplevel):
     """API設定ダイアログ"""
@@ -14,13 +36,25 @@ class APIConfigDialog(ctk.CTkToplevel):
         self,
         parent,
         config,
-        test_connection_callback: Optional[Callable] = None
+        test_connection_callback: Optional[Callable] = None,
+        project_budget: Optional[Dict[str, Any]] = None
     ):
         super().__init__(parent)
 
         self.config = config
         self.test_connection_callback = test_connection_callback
+        # 開いているプロジェクトの予算（Noneの場合はプロジェクトの上限を表示しない）
+        self.project_budget = project_budget
         self.result = None
+        # 保存時に入力されたプロジェクトの予算（呼び出し元でプロジェクトに保存）
+        self.project_budget_result: Optional[Dict[str, Any]] = None
+
+        # 編集中のステージ別プロファイル
+        self.profiles: Dict[str, Dict[str, Any]] = {
+            stage: dict(profile)
+            for stage, profile in config.get_generation_profiles().items()
+        }
+        self.current_stage = GENERATION_STAGES[0]
 
         self.title("API設定")
         self.geometry("750x650")
@@ -42,8 +76,8 @@ class APIConfigDialog(ctk.CTkToplevel):
 
     def _create_widgets(self):
         """ウィジェットの作成"""
-        # メインフレーム
-        main_frame = ctk.CTkFrame(self)
+        # メインフレーム（プロファイル設定を含むためスクロール可能）
+        main_frame = ctk.CTkScrollableFrame(self)
         main_frame.pack(fill="both", expand=True, padx=20, pady=20)
 
         # タイトル
@@ -92,16 +126,7 @@ class APIConfigDialog(ctk.CTkToplevel):
         self.model_menu = ctk.CTkOptionMenu(
             main_frame,
             width=500,
-            values=[
-                "gemini-2.5-pro",
-                "gemini-2.5-flash",
-                "gemini-2.5-flash-lite",
-                "gemini-2.0-flash",
-                "gemini-2.0-flash-lite",
-                "gemini-2.0-flash-exp",
-                "gemini-1.5-pro",
-                "gemini-1.5-flash"
-            ],
+            values=MODEL_CHOICES,
             variable=self.model_var
         )
         self.model_menu.pack(pady=(0, 15))
@@ -178,6 +203,74 @@ class APIConfigDialog(ctk.CTkToplevel):
         self.top_p_label = ctk.CTkLabel(top_p_frame, text="0.9", width=40)
         self.top_p_label.pack(side="right")
 
+        # ステージ別生成プロファイル
+        self._create_profile_widgets(main_frame)
+
+        # プロンプトコンテキスト
+        self.condensed_var = ctk.BooleanVar(value=False)
+        condensed_checkbox = ctk.CTkCheckBox(
+            main_frame,
+            text="要約コンテキストを使用（キャラクター・世界観を短い要約に置き換えて送信）",
+            variable=self.condensed_var
+        )
+        condensed_checkbox.pack(anchor="w", pady=(0, 10))
+
+        self.story_summary_var = ctk.BooleanVar(value=False)
+        story_summary_checkbox = ctk.CTkCheckBox(
+            main_frame,
+            text="これまでのあらすじをプロット生成に添付（シーンの要約にAPIを使用）",
+            variable=self.story_summary_var
+        )
+        story_summary_checkbox.pack(anchor="w", pady=(0, 10))
+
+        self.retrieval_var = ctk.BooleanVar(value=False)
+        retrieval_checkbox = ctk.CTkCheckBox(
+            main_frame,
+            text="関連する過去の場面を検索してプロット・本文の生成に添付（プロンプトが長くなります）",
+            variable=self.retrieval_var
+        )
+        retrieval_checkbox.pack(anchor="w", pady=(0, 10))
+
+        # API呼び出しの信頼性
+        self.hedging_var = ctk.BooleanVar(value=False)
+        hedging_checkbox = ctk.CTkCheckBox(
+            main_frame,
+            text="ヘッジリクエスト（応答の遅いリクエストを重複して送り、先に完了した方を採用）",
+            variable=self.hedging_var
+        )
+        hedging_checkbox.pack(anchor="w", pady=(0, 10))
+
+        fallback_label = ctk.CTkLabel(
+            main_frame,
+            text="フォールバックモデル（過負荷・遅延時に順に使用、カンマ区切り）:",
+            font=ctk.CTkFont(size=14)
+        )
+        fallback_label.pack(anchor="w", pady=(0, 5))
+
+        self.fallback_entry = ctk.CTkEntry(main_frame, width=500)
+        self.fallback_entry.pack(fill="x", pady=(0, 10))
+
+        # 生成の呼び出し先
+        backend_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        backend_frame.pack(fill="x", pady=(0, 20))
+
+        ctk.CTkLabel(
+            backend_frame,
+            text="呼び出し先:",
+            font=ctk.CTkFont(size=14)
+        ).pack(side="left", padx=(0, 10))
+
+        self.backend_var = ctk.StringVar(value="Gemini API")
+        ctk.CTkOptionMenu(
+            backend_frame,
+            values=list(BACKEND_CHOICES.keys()),
+            variable=self.backend_var,
+            width=300
+        ).pack(side="left")
+
+        # 予算
+        self._create_budget_widgets(main_frame)
+
         # ボタン
         button_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
         button_frame.pack(fill="x", pady=(10, 0))
@@ -207,6 +300,232 @@ class APIConfigDialog(ctk.CTkToplevel):
         )
         save_button.pack(side="right")
 
+    def _create_budget_widgets(self, parent):
+        """トークン・料金の予算のウィジェット作成"""
+        budget_frame = ctk.CTkFrame(parent)
+        budget_frame.pack(fill="x", pady=(0, 20))
+
+        ctk.CTkLabel(
+            budget_frame,
+            text="予算（0 = 無制限、料金は米ドル）",
+            font=ctk.CTkFont(size=16, weight="bold")
+        ).pack(anchor="w", padx=10, pady=(10, 0))
+
+        ctk.CTkLabel(
+            budget_frame,
+            text="使い切ると一括拡張などのジョブを一時停止します（画面から操作した生成は止まりません）",
+            font=ctk.CTkFont(size=12),
+            text_color=("gray40", "gray60")
+        ).pack(anchor="w", padx=10, pady=(0, 10))
+
+        fields = [
+            ('daily_token_limit', "1日のトークン数の上限:"),
+            ('daily_cost_limit', "1日の料金の上限:"),
+            ('input_price_per_million', "入力の単価（100万トークンあたり）:"),
+            ('output_price_per_million', "出力の単価（100万トークンあたり）:")
+        ]
+        if self.project_budget is not None:
+            fields += [
+                ('token_limit', "このプロジェクトのトークン数の上限:"),
+                ('cost_limit', "このプロジェクトの料金の上限:")
+            ]
+
+        self.budget_entries: Dict[str, ctk.CTkEntry] = {}
+        for key, label in fields:
+            row = ctk.CTkFrame(budget_frame, fg_color="transparent")
+            row.pack(fill="x", padx=10, pady=(0, 5))
+            ctk.CTkLabel(row, text=label).pack(side="left")
+            entry = ctk.CTkEntry(row, width=150)
+            entry.pack(side="right")
+            self.budget_entries[key] = entry
+
+    def _read_budget_entries(self) -> Dict[str, float]:
+        """
+        予算の入力値を取得
+
+        Returns:
+            項目名をキーとした値（トークン数は整数）
+
+        Raises:
+            ValueError: 0以上の数値でない入力がある場合
+        """
+        values = {}
+        for key, entry in self.budget_entries.items():
+            text = entry.get().strip() or "0"
+            value = int(text) if key.endswith('token_limit') else float(text)
+            if value < 0:
+                raise ValueError(key)
+            values[key] = value
+        return values
+
+    def _create_profile_widgets(self, parent):
+        """ステージ別生成プロファイルのウィジェット作成"""
+        profile_frame = ctk.CTkFrame(parent)
+        profile_frame.pack(fill="x", pady=(0, 20))
+
+        profile_title = ctk.CTkLabel(
+            profile_frame,
+            text="ステージ別生成プロファイル",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        profile_title.pack(anchor="w", padx=10, pady=(10, 0))
+
+        profile_desc = ctk.CTkLabel(
+            profile_frame,
+            text="短いステージには高速なモデルや少ないトークン数を設定できます",
+            font=ctk.CTkFont(size=12),
+            text_color=("gray40", "gray60")
+        )
+        profile_desc.pack(anchor="w", padx=10, pady=(0, 10))
+
+        # ステージ選択
+        self.stage_selector = ctk.CTkSegmentedButton(
+            profile_frame,
+            values=[GENERATION_STAGE_LABELS[stage] for stage in GENERATION_STAGES],
+            command=self._on_stage_selected
+        )
+        self.stage_selector.pack(fill="x", padx=10, pady=(0, 10))
+        self.stage_selector.set(GENERATION_STAGE_LABELS[self.current_stage])
+
+        # モデル
+        ctk.CTkLabel(profile_frame, text="モデル:").pack(anchor="w", padx=10)
+        self.profile_model_var = ctk.StringVar(value=INHERIT_LABEL)
+        ctk.CTkOptionMenu(
+            profile_frame,
+            values=[INHERIT_LABEL] + MODEL_CHOICES,
+            variable=self.profile_model_var
+        ).pack(fill="x", padx=10, pady=(0, 10))
+
+        # Temperature / Max Tokens / Top P（チェックを外すと共通設定を使用）
+        self.profile_temp = self._create_profile_slider(
+            profile_frame, "Temperature", 0.0, 1.0, 10, lambda v: f"{float(v):.1f}"
+        )
+        self.profile_tokens = self._create_profile_slider(
+            profile_frame, "Max Tokens", 1000, 8000, 70, lambda v: str(int(v))
+        )
+        self.profile_top_p = self._create_profile_slider(
+            profile_frame, "Top P", 0.0, 1.0, 10, lambda v: f"{float(v):.1f}"
+        )
+
+        # 入力トークン上限
+        ctk.CTkLabel(profile_frame, text="入力トークン上限 (0 = 無制限):").pack(anchor="w", padx=10)
+        row = ctk.CTkFrame(profile_frame, fg_color="transparent")
+        row.pack(fill="x", padx=10, pady=(0, 10))
+        self.profile_budget_slider = ctk.CTkSlider(
+            row,
+            from_=0,
+            to=16000,
+            number_of_steps=32,
+            command=lambda v: self.profile_budget_label.configure(text=str(int(v)))
+        )
+        self.profile_budget_slider.pack(side="left", fill="x", expand=True, padx=(0, 10))
+        self.profile_budget_label = ctk.CTkLabel(row, text="0", width=50)
+        self.profile_budget_label.pack(side="right")
+
+    def _create_profile_slider(
+        self,
+        parent,
+        label: str,
+        from_: float,
+        to: float,
+        steps: int,
+        format_value: Callable[[float], str]
+    ) -> Dict[str, Any]:
+        """
+        プロファイルの上書き項目（チェックボックスとスライダー）の作成
+
+        Args:
+            parent: 親ウィジェット
+            label: 項目名
+            from_: 最小値
+            to: 最大値
+            steps: スライダーの段階数
+            format_value: 値の表示形式
+
+        Returns:
+            override（BooleanVar）, slider, label, format を含む辞書
+        """
+        widgets: Dict[str, Any] = {'format': format_value}
+        widgets['override'] = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(
+            parent,
+            text=f"{label}を上書き:",
+            variable=widgets['override'],
+            command=lambda: self._update_profile_slider_state(widgets)
+        ).pack(anchor="w", padx=10)
+
+        row = ctk.CTkFrame(parent, fg_color="transparent")
+        row.pack(fill="x", padx=10, pady=(0, 10))
+        widgets['slider'] = ctk.CTkSlider(
+            row,
+            from_=from_,
+            to=to,
+            number_of_steps=steps,
+            command=lambda v: widgets['label'].configure(text=format_value(v))
+        )
+        widgets['slider'].pack(side="left", fill="x", expand=True, padx=(0, 10))
+        widgets['label'] = ctk.CTkLabel(row, text="", width=50)
+        widgets['label'].pack(side="right")
+        return widgets
+
+    def _update_profile_slider_state(self, widgets: Dict[str, Any]):
+        """上書きしない項目のスライダーを無効にする"""
+        if widgets['override'].get():
+            widgets['slider'].configure(state="normal")
+            widgets['label'].configure(text=widgets['format'](widgets['slider'].get()))
+        else:
+            widgets['slider'].configure(state="disabled")
+            widgets['label'].configure(text="共通")
+
+    def _load_profile_slider(self, widgets: Dict[str, Any], value: Optional[float], default: float):
+        """プロファイルの値をスライダーに反映（Noneは共通設定）"""
+        widgets['override'].set(value is not None)
+        widgets['slider'].configure(state="normal")
+        widgets['slider'].set(default if value is None else value)
+        self._update_profile_slider_state(widgets)
+
+    @staticmethod
+    def _profile_slider_value(widgets: Dict[str, Any]) -> Optional[float]:
+        """スライダーの値（上書きしない場合はNone）"""
+        return widgets['slider'].get() if widgets['override'].get() else None
+
+    def _on_stage_selected(self, label: str):
+        """プロファイルのステージ切り替え"""
+        # 表示中のステージの値を退避してから切り替える
+        self._store_profile_widgets()
+
+        for stage, stage_label in GENERATION_STAGE_LABELS.items():
+            if stage_label == label:
+                self.current_stage = stage
+                break
+
+        self._load_profile_widgets()
+
+    def _load_profile_widgets(self):
+        """選択中ステージのプロファイルをウィジェットに反映"""
+        profile = self.profiles.get(self.current_stage, {})
+
+        self.profile_model_var.set(profile.get('model') or INHERIT_LABEL)
+        self._load_profile_slider(self.profile_temp, profile.get('temperature'), self.temp_slider.get())
+        self._load_profile_slider(self.profile_tokens, profile.get('max_tokens'), self.tokens_slider.get())
+        self._load_profile_slider(self.profile_top_p, profile.get('top_p'), self.top_p_slider.get())
+
+        input_budget = profile.get('input_budget', 0)
+        self.profile_budget_slider.set(input_budget)
+        self.profile_budget_label.configure(text=str(int(input_budget)))
+
+    def _store_profile_widgets(self):
+        """ウィジェットの値を選択中ステージのプロファイルに保存"""
+        model = self.profile_model_var.get()
+        max_tokens = self._profile_slider_value(self.profile_tokens)
+        self.profiles[self.current_stage] = {
+            'model': None if model == INHERIT_LABEL else model,
+            'temperature': self._profile_slider_value(self.profile_temp),
+            'max_tokens': None if max_tokens is None else int(max_tokens),
+            'top_p': self._profile_slider_value(self.profile_top_p),
+            'input_budget': int(self.profile_budget_slider.get())
+        }
+
     def _load_current_config(self):
         """現在の設定を読み込み"""
         api_config = self.config.get_api_config()
@@ -231,6 +550,28 @@ class APIConfigDialog(ctk.CTkToplevel):
         self.top_p_slider.set(api_config.get('top_p', 0.9))
         self._update_top_p_label(api_config.get('top_p', 0.9))
 
+        # ステージ別プロファイル
+        self._load_profile_widgets()
+
+        # プロンプトコンテキスト
+        context_settings = self.config.get_context_settings()
+        self.condensed_var.set(context_settings.get('condensed_context', False))
+        self.story_summary_var.set(context_settings.get('story_summary_enabled', False))
+        self.retrieval_var.set(context_settings.get('retrieval_enabled', False))
+        reliability = self.config.get_reliability_settings()
+        self.hedging_var.set(reliability.get('hedging_enabled', False))
+        self.fallback_entry.insert(0, ", ".join(reliability.get('fallback_models', [])))
+        backend_type = self.config.get_backend_settings().get('type', 'gemini')
+        for label, value in BACKEND_CHOICES.items():
+            if value == backend_type:
+                self.backend_var.set(label)
+
+        # 予算
+        budget = dict(self.config.get_budget_settings())
+        budget.update(self.project_budget or {})
+        for key, entry in self.budget_entries.items():
+            entry.insert(0, str(budget.get(key, 0)))
+
     def _toggle_api_key_visibility(self):
         """APIキーの表示/非表示を切り替え"""
         if self.show_key_var.get():
@@ -259,25 +600,39 @@ class APIConfigDialog(ctk.CTkToplevel):
             return
 
         if self.test_connection_callback:
+            # 各ステージで実際に使うモデルを確認
+            self._store_profile_widgets()
             try:
-                if self.test_connection_callback(api_key, self.model_var.get()):
+                failed = self.test_connection_callback(
+                    api_key, self.model_var.get(), self.profiles, BACKEND_CHOICES[self.backend_var.get()]
+                )
+                if not failed:
                     messagebox.showinfo("成功", "API接続に成功しました")
                 else:
-                    messagebox.showerror("エラー", "API接続に失敗しました")
+                    messagebox.showerror("エラー", f"API接続に失敗しました（{', '.join(failed)}）")
             except Exception as e:
                 messagebox.showerror("エラー", f"API接続に失敗しました: {str(e)}")
 
     def _save(self):
         """設定を保存"""
         api_key = self.api_key_entry.get().strip()
+        backend_type = BACKEND_CHOICES[self.backend_var.get()]
 
-        if not api_key:
+        # 偽のバックエンドはAPIキーなしで使用できる
+        if not api_key and backend_type != 'fake':
             messagebox.showerror("エラー", "APIキーを入力してください")
             return
 
+        try:
+            budget = self._read_budget_entries()
+        except ValueError:
+            messagebox.showerror("エラー", "予算には0以上の数値を入力してください（トークン数は整数）")
+            return
+
         try:
             # APIキーの保存
-            self.config.set_api_key(api_key)
+            if api_key:
+                self.config.set_api_key(api_key)
 
             # API設定の保存
             self.config.set_api_config(
@@ -287,6 +642,48 @@ class APIConfigDialog(ctk.CTkToplevel):
                 top_p=self.top_p_slider.get()
             )
 
+            # ステージ別プロファイルの保存
+            self._store_profile_widgets()
+            for stage, profile in self.profiles.items():
+                self.config.set_generation_profile(
+                    stage,
+                    model=profile['model'],
+                    temperature=profile['temperature'],
+                    max_tokens=profile['max_tokens'],
+                    top_p=profile['top_p'],
+                    input_budget=profile.get('input_budget', 0),
+                    save=False
+                )
+            self.config.save_config()
+
+            # プロンプトコンテキスト設定の保存
+            self.config.set_context_settings(
+                condensed_context=self.condensed_var.get(),
+                story_summary_enabled=self.story_summary_var.get(),
+                retrieval_enabled=self.retrieval_var.get()
+            )
+            fallback_models = [
+                name.strip() for name in self.fallback_entry.get().split(",") if name.strip()
+            ]
+            self.config.set_reliability_settings(
+                hedging_enabled=self.hedging_var.get(),
+                fallback_models=fallback_models
+            )
+            self.config.set_backend_settings(type=backend_type)
+
+            # 予算の保存（プロジェクトの上限は呼び出し元でプロジェクトに保存）
+            self.config.set_budget_settings(
+                daily_token_limit=budget['daily_token_limit'],
+                daily_cost_limit=budget['daily_cost_limit'],
+                input_price_per_million=budget['input_price_per_million'],
+                output_price_per_million=budget['output_price_per_million']
+            )
+            if self.project_budget is not None:
+                self.project_budget_result = {
+                    'token_limit': budget['token_limit'],
+                    'cost_limit': budget['cost_limit']
+                }
+
             self.result = True
             self.destroy()
 
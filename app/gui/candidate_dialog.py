@@ -0,0 +1,101 @@
+"""
+候補選択ダイアログ
+複数生成した候補から採用するものを選ぶ
+"""
+import customtkinter as ctk
+from typing import List, Optional
+
+
+class CandidateDialog(ctk.CTkToplevel):
+    """候補選択ダイアログクラス"""
+
+    def __init__(self, parent, candidates: List[str], stage_label: str = ""):
+        super().__init__(parent)
+
+        self.candidates = candidates
+        self.stage_label = stage_label
+        # 採用した候補の番号（キャンセル時はNone）
+        self.result: Optional[int] = None
+
+        self.title("候補の選択")
+        self.geometry("900x700")
+        self.minsize(700, 500)  # 最小サイズを設定
+        self.resizable(True, True)  # リサイズ可能に
+
+        # モーダルにする
+        self.transient(parent)
+        self.grab_set()
+
+        self._create_widgets()
+
+        # ウィンドウを中央に配置
+        self.update_idletasks()
+        x = (self.winfo_screenwidth() // 2) - (900 // 2)
+        y = (self.winfo_screenheight() // 2) - (700 // 2)
+        self.geometry(f"+{x}+{y}")
+
+    def _create_widgets(self):
+        """ウィジェットの作成"""
+        # メインフレーム
+        main_frame = ctk.CTkFrame(self)
+        main_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # タイトル
+        title_label = ctk.CTkLabel(
+            main_frame,
+            text=f"{self.stage_label}の候補を選択",
+            font=ctk.CTkFont(size=20, weight="bold")
+        )
+        title_label.pack(pady=(0, 5))
+
+        ctk.CTkLabel(
+            main_frame,
+            text="採用しなかった候補はシーンの履歴に保存されます",
+            text_color="gray"
+        ).pack(pady=(0, 10))
+
+        # 候補ごとのタブ
+        self.tabview = ctk.CTkTabview(main_frame)
+        self.tabview.pack(fill="both", expand=True, pady=(0, 15))
+
+        self.tab_names = []
+        for i, candidate in enumerate(self.candidates):
+            tab_name = f"候補{i + 1}（{len(candidate)}文字）"
+            tab = self.tabview.add(tab_name)
+            textbox = ctk.CTkTextbox(tab, wrap="word")
+            textbox.pack(fill="both", expand=True, padx=5, pady=5)
+            textbox.insert("1.0", candidate)
+            textbox.configure(state="disabled")
+            self.tab_names.append(tab_name)
+
+        # ボタン
+        button_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        button_frame.pack(fill="x")
+
+        ctk.CTkButton(
+            button_frame,
+            text="キャンセル",
+            command=self._cancel,
+            fg_color="gray",
+            hover_color="darkgray",
+            width=140
+        ).pack(side="left")
+
+        ctk.CTkButton(
+            button_frame,
+            text="この候補を採用",
+            command=self._choose,
+            width=140,
+            fg_color="#2e7d32",
+            hover_color="#1b5e20"
+        ).pack(side="right")
+
+    def _choose(self):
+        """表示中の候補を採用"""
+        self.result = self.tab_names.index(self.tabview.get())
+        self.destroy()
+
+    def _cancel(self):
+        """キャンセル"""
+        self.result = None
+        self.destroy()
@@ -4,8 +4,9 @@
 """
 import customtkinter as ctk
 from tkinter import messagebox
-from typing import Dict, Optional, Callable
+from typing import Dict, List, Optional, Callable
 import threading
+from app.utils.character_names import normalize_name
 
 
 class CharacterDialog(ctk.CTkToplevel):
@@ -89,6 +90,7 @@ class CharacterDialog(ctk.CTkToplevel):
         # フォームフィールド
         fields = [
             ("名前", "name", "キャラクターの名前を入力...", True, 1),
+            ("別名・呼び名", "aliases", "愛称や呼び名をカンマ区切りで入力（自動選択に使用）...", True, 1),
             ("性格", "personality", "性格の特徴を入力...", False, 3),
             ("外見", "appearance", "外見の特徴を入力...", False, 3),
             ("背景・経歴", "background", "生い立ちや経歴を入力...", False, 3),
@@ -115,7 +117,7 @@ class CharacterDialog(ctk.CTkToplevel):
             )
             label.pack(side="left")
 
-            if is_entry:
+            if field_name == 'name':
                 # 必須マーク
                 required_label = ctk.CTkLabel(
                     label_frame,
@@ -378,6 +380,244 @@ class AICharacterDialog(ctk.CTkToplevel):
         self.destroy()
 
 
+class BatchCharacterDialog(ctk.CTkToplevel):
+    """キャラクター一括生成ダイアログ"""
+
+    def __init__(self, parent, batch_generate_callback: Callable):
+        super().__init__(parent)
+
+        self.batch_generate_callback = batch_generate_callback
+        self.generated: List[Dict[str, str]] = []
+        self.selection_vars: List[ctk.BooleanVar] = []
+        self.result = None
+
+        self.title("キャラクター一括生成")
+        self.geometry("750x700")
+        self.minsize(600, 550)  # 最小サイズを設定
+        self.resizable(True, True)  # リサイズ可能に
+
+        # モーダルにする
+        self.transient(parent)
+        self.grab_set()
+
+        self._create_widgets()
+
+        # ウィンドウを中央に配置
+        self.update_idletasks()
+        x = (self.winfo_screenwidth() // 2) - (750 // 2)
+        y = (self.winfo_screenheight() // 2) - (700 // 2)
+        self.geometry(f"+{x}+{y}")
+
+    def _create_widgets(self):
+        """ウィジェットの作成"""
+        # メインフレーム
+        main_frame = ctk.CTkFrame(self)
+        main_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # タイトル
+        title_label = ctk.CTkLabel(
+            main_frame,
+            text="👥 キャラクター一括生成",
+            font=ctk.CTkFont(size=22, weight="bold"),
+            text_color=("#1f538d", "#3a7ebf")
+        )
+        title_label.pack(pady=(0, 10))
+
+        # 説明文
+        desc_label = ctk.CTkLabel(
+            main_frame,
+            text="個別のコンセプトを1行ずつ入力するか、全体コンセプトと人数を指定してください",
+            font=ctk.CTkFont(size=12),
+            text_color=("gray40", "gray60")
+        )
+        desc_label.pack(pady=(0, 15))
+
+        # 個別コンセプト
+        concepts_label = ctk.CTkLabel(
+            main_frame,
+            text="個別コンセプト（1行に1人）",
+            font=ctk.CTkFont(size=13, weight="bold"),
+            anchor="w"
+        )
+        concepts_label.pack(anchor="w", pady=(0, 5))
+
+        self.concepts_text = ctk.CTkTextbox(
+            main_frame,
+            height=90,
+            font=ctk.CTkFont(size=12),
+            corner_radius=6,
+            wrap="word"
+        )
+        self.concepts_text.pack(fill="x", pady=(0, 10))
+
+        # 全体コンセプトと人数
+        ensemble_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        ensemble_frame.pack(fill="x", pady=(0, 10))
+
+        ensemble_label = ctk.CTkLabel(
+            ensemble_frame,
+            text="全体コンセプト",
+            font=ctk.CTkFont(size=13, weight="bold")
+        )
+        ensemble_label.pack(side="left", padx=(0, 10))
+
+        self.ensemble_entry = ctk.CTkEntry(
+            ensemble_frame,
+            height=34,
+            placeholder_text="例: 魔法学園の生徒会メンバー",
+            font=ctk.CTkFont(size=13),
+            corner_radius=6
+        )
+        self.ensemble_entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
+
+        self.count_var = ctk.StringVar(value="5")
+        count_menu = ctk.CTkOptionMenu(
+            ensemble_frame,
+            values=[str(n) for n in range(1, 21)],
+            variable=self.count_var,
+            width=70
+        )
+        count_menu.pack(side="left")
+
+        ctk.CTkLabel(ensemble_frame, text="人").pack(side="left", padx=(5, 0))
+
+        generate_button = ctk.CTkButton(
+            main_frame,
+            text="✨ 生成開始",
+            command=self._generate,
+            height=36,
+            corner_radius=6,
+            fg_color="#1565c0",
+            hover_color="#0d47a1",
+            font=ctk.CTkFont(size=13, weight="bold")
+        )
+        generate_button.pack(fill="x", pady=(0, 10))
+
+        # 生成結果（追加するキャラクターを選択）
+        result_label = ctk.CTkLabel(
+            main_frame,
+            text="生成結果（追加するキャラクターを選択）",
+            font=ctk.CTkFont(size=13, weight="bold"),
+            anchor="w"
+        )
+        result_label.pack(anchor="w", pady=(0, 5))
+
+        self.result_frame = ctk.CTkScrollableFrame(main_frame, height=160)
+        self.result_frame.pack(fill="both", expand=True, pady=(0, 15))
+
+        # ボタン
+        button_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        button_frame.pack(fill="x")
+
+        cancel_button = ctk.CTkButton(
+            button_frame,
+            text="キャンセル",
+            command=self._cancel,
+            fg_color="gray",
+            hover_color="darkgray",
+            width=140,
+            height=38,
+            corner_radius=6,
+            font=ctk.CTkFont(size=13)
+        )
+        cancel_button.pack(side="left")
+
+        add_button = ctk.CTkButton(
+            button_frame,
+            text="💾 まとめて追加",
+            command=self._add,
+            width=140,
+            height=38,
+            corner_radius=6,
+            fg_color="#2e7d32",
+            hover_color="#1b5e20",
+            font=ctk.CTkFont(size=13, weight="bold")
+        )
+        add_button.pack(side="right")
+
+    def _generate(self):
+        """生成"""
+        concepts = [
+            line.strip()
+            for line in self.concepts_text.get("1.0", "end-1c").splitlines()
+            if line.strip()
+        ]
+        ensemble_concept = self.ensemble_entry.get().strip()
+
+        if not concepts and not ensemble_concept:
+            messagebox.showerror("エラー", "コンセプトを入力してください")
+            return
+
+        count = int(self.count_var.get())
+
+        # プログレスダイアログを表示
+        progress_dialog = ProgressDialog(self, "キャラクターを一括生成中...")
+
+        def generate_thread():
+            try:
+                # このダイアログで前に生成した名前も避ける
+                result = self.batch_generate_callback(
+                    concepts=concepts,
+                    ensemble_concept=ensemble_concept,
+                    count=count,
+                    generated_names=[char.get('name', '') for char in self.generated]
+                )
+                progress_dialog.close()
+                self.after(0, lambda: self._show_results(result))
+            except Exception as e:
+                progress_dialog.close()
+                messagebox.showerror("エラー", f"生成に失敗しました: {str(e)}")
+
+        thread = threading.Thread(target=generate_thread, daemon=True)
+        thread.start()
+
+        progress_dialog.show()
+
+    def _show_results(self, characters: List[Dict[str, str]]):
+        """生成結果を選択リストに表示（前の生成と同じ名前は除く）"""
+        seen = {normalize_name(char.get('name', '')) for char in self.generated}
+        for char in characters:
+            key = normalize_name(char.get('name', ''))
+            if key and key in seen:
+                continue
+            seen.add(key)
+            self.generated.append(char)
+
+        for widget in self.result_frame.winfo_children():
+            widget.destroy()
+        self.selection_vars = []
+
+        for char in self.generated:
+            var = ctk.BooleanVar(value=True)
+            personality = char.get('personality', '')
+            checkbox = ctk.CTkCheckBox(
+                self.result_frame,
+                text=f"{char.get('name', '不明')} - {personality[:30]}",
+                variable=var
+            )
+            checkbox.pack(anchor="w", pady=2, padx=5)
+            self.selection_vars.append(var)
+
+    def _add(self):
+        """選択したキャラクターを結果として返す"""
+        selected = [
+            char for char, var in zip(self.generated, self.selection_vars)
+            if var.get()
+        ]
+
+        if not selected:
+            messagebox.showerror("エラー", "追加するキャラクターがありません")
+            return
+
+        self.result = selected
+        self.destroy()
+
+    def _cancel(self):
+        """キャンセル"""
+        self.result = None
+        self.destroy()
+
+
 class ProgressDialog(ctk.CTkToplevel):
     """プログレスダイアログ"""
 
@@ -0,0 +1,168 @@
+"""
+一括拡張ダイアログ
+シーンの中編化・長編化を永続ジョブとして登録し、ジョブの状況を表示する
+"""
+import customtkinter as ctk
+from tkinter import messagebox
+from typing import Any, Callable, Dict, List
+
+
+class BatchExpandDialog(ctk.CTkToplevel):
+    """一括拡張ダイアログクラス"""
+
+    STAGES = {"中編化": "medium", "長編化": "long"}
+
+    def __init__(
+        self,
+        parent,
+        scenes: List[Dict[str, Any]],
+        get_counts: Callable[[], Dict[str, int]],
+        retry_failed: Callable[[], int]
+    ):
+        super().__init__(parent)
+
+        self.scenes = [scene for scene in scenes if scene.get('content')]
+        self.get_counts = get_counts
+        self.retry_failed = retry_failed
+        self.selection_vars: List[ctk.BooleanVar] = []
+        # 登録するジョブ（stage, scene_ids）、キャンセル時はNone
+        self.result = None
+
+        self.title("一括拡張")
+        self.geometry("600x600")
+        self.minsize(500, 450)  # 最小サイズを設定
+        self.resizable(True, True)  # リサイズ可能に
+
+        # モーダルにする
+        self.transient(parent)
+        self.grab_set()
+
+        self._create_widgets()
+        self._refresh_counts()
+
+        # ウィンドウを中央に配置
+        self.update_idletasks()
+        x = (self.winfo_screenwidth() // 2) - (600 // 2)
+        y = (self.winfo_screenheight() // 2) - (600 // 2)
+        self.geometry(f"+{x}+{y}")
+
+    def _create_widgets(self):
+        """ウィジェットの作成"""
+        # メインフレーム
+        main_frame = ctk.CTkFrame(self)
+        main_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # タイトル
+        title_label = ctk.CTkLabel(
+            main_frame,
+            text="⚡ 一括拡張",
+            font=ctk.CTkFont(size=22, weight="bold"),
+            text_color=("#1f538d", "#3a7ebf")
+        )
+        title_label.pack(pady=(0, 5))
+
+        ctk.CTkLabel(
+            main_frame,
+            text="ジョブはバックグラウンドで実行され、アプリを閉じても次回起動時に再開されます。\n"
+                 "拡張前の本文はシーンの履歴に保存されます。",
+            text_color="gray",
+            justify="left"
+        ).pack(pady=(0, 10))
+
+        # 拡張の種類
+        stage_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        stage_frame.pack(fill="x", pady=(0, 10))
+
+        ctk.CTkLabel(stage_frame, text="拡張の種類:").pack(side="left", padx=(0, 10))
+        self.stage_var = ctk.StringVar(value="中編化")
+        ctk.CTkOptionMenu(
+            stage_frame,
+            values=list(self.STAGES.keys()),
+            variable=self.stage_var,
+            width=120
+        ).pack(side="left")
+
+        # 対象シーン
+        ctk.CTkLabel(main_frame, text="対象シーン:").pack(anchor="w")
+        scene_frame = ctk.CTkScrollableFrame(main_frame, height=250)
+        scene_frame.pack(fill="both", expand=True, pady=(5, 10))
+
+        if not self.scenes:
+            ctk.CTkLabel(scene_frame, text="本文のあるシーンがありません", text_color="gray").pack(pady=10)
+        for scene in self.scenes:
+            var = ctk.BooleanVar(value=True)
+            ctk.CTkCheckBox(
+                scene_frame,
+                text=f"{scene.get('title', '無題')}（{len(scene.get('content', ''))}文字）",
+                variable=var
+            ).pack(anchor="w", pady=2, padx=5)
+            self.selection_vars.append(var)
+
+        # ジョブの状況
+        status_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        status_frame.pack(fill="x", pady=(0, 10))
+
+        self.counts_label = ctk.CTkLabel(status_frame, text="")
+        self.counts_label.pack(side="left")
+
+        ctk.CTkButton(
+            status_frame,
+            text="失敗したジョブを再試行",
+            command=self._retry,
+            width=170
+        ).pack(side="right")
+
+        # ボタン
+        button_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        button_frame.pack(fill="x")
+
+        ctk.CTkButton(
+            button_frame,
+            text="閉じる",
+            command=self._cancel,
+            fg_color="gray",
+            hover_color="darkgray",
+            width=140
+        ).pack(side="left")
+
+        ctk.CTkButton(
+            button_frame,
+            text="ジョブを登録",
+            command=self._enqueue,
+            width=140,
+            fg_color="#2e7d32",
+            hover_color="#1b5e20"
+        ).pack(side="right")
+
+    def _refresh_counts(self):
+        """ジョブの状況を更新"""
+        counts = self.get_counts()
+        self.counts_label.configure(
+            text=f"待機: {counts['pending']}  実行中: {counts['running']}  "
+                 f"完了: {counts['done']}  失敗: {counts['failed']}"
+        )
+
+    def _retry(self):
+        """失敗したジョブを再試行"""
+        retried = self.retry_failed()
+        self._refresh_counts()
+        messagebox.showinfo("再試行", f"{retried}件のジョブを再試行します")
+
+    def _enqueue(self):
+        """選択したシーンのジョブを登録"""
+        scene_ids = [
+            scene['id'] for scene, var in zip(self.scenes, self.selection_vars)
+            if var.get()
+        ]
+
+        if not scene_ids:
+            messagebox.showerror("エラー", "対象のシーンを選択してください")
+            return
+
+        self.result = {'stage': self.STAGES[self.stage_var.get()], 'scene_ids': scene_ids}
+        self.destroy()
+
+    def _cancel(self):
+        """キャンセル"""
+        self.result = None
+        self.destroy()
@@ -6,8 +6,11 @@ import customtkinter as ctk
 from tkinter import messagebox, filedialog, simpledialog
 import tkinter as tk
 import threading
+import hashlib
+import copy
 from typing import Optional, List, Dict, Any
 import os
+from datetime import datetime
 
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
@@ -15,15 +18,29 @@ try:
 except ImportError:
     TKDND_AVAILABLE = False
 
-from app.utils.config import Config
+from app.utils.config import Config, GENERATION_STAGE_LABELS
 from app.core.project_manager import ProjectManager
 from app.core.gemini_client import GeminiClient
+from app.core.backends import create_backend
+from app.core.model_pool import ModelPool
+from app.core.condensed_context import ensure_summaries
+from app.core.scene_index import SceneIndex, select_within_budget
+from app.core.story_summary import StorySummary
 from app.core.exporter import Exporter
+from app.core.job_queue import JobQueue, JobRunner, DONE
+from app.core.spool import SpoolDirectory, SpoolFile
+from app.core.telemetry import TelemetryStore
+from app.core.usage_budget import UsageBudget
+from app.core.connectivity import ConnectivityMonitor
+from app.core.concurrency import AdaptiveLimiter
+from app.utils.name_matcher import NameMatcher
 from app.gui.api_config_dialog import APIConfigDialog
 from app.gui.style_dialog import StyleDialog
 from app.gui.theme_dialog import ThemeDialog
 from app.gui.new_project_dialog import NewProjectDialog
-from app.gui.character_dialog import CharacterDialog, ProgressDialog
+from app.gui.character_dialog import CharacterDialog, BatchCharacterDialog, ProgressDialog
+from app.gui.candidate_dialog import CandidateDialog
+from app.gui.job_dialog import BatchExpandDialog
 from app.gui.world_dialog import WorldDialog
 from app.gui.export_dialog import ExportDialog
 from app.gui.stats_dialog import StatsDialog
@@ -42,9 +59,55 @@ class MainWindow(ctk.CTk):
         self.project_manager = ProjectManager()
         self.exporter = Exporter()
         self.gemini_client: Optional[GeminiClient] = None
+        # APIの初期化の回数（古い初期化の結果を破棄するため）
+        self._api_init_count = 0
+        # API設定の保存でクライアントを作り直してもモデルを再利用する
+        self.model_pool = ModelPool()
+        # 一括処理の同時実行数（クライアントを作り直しても引き継ぎ、ジョブのワーカーとも共有）
+        self.limiter = AdaptiveLimiter()
+        # 過去のシーン本文の検索インデックス
+        self.scene_index = SceneIndex()
+        # これまでのあらすじ（階層要約）
+        self.story_summary = StorySummary()
+        # あらすじの更新は生成スレッドとシーン保存後の更新で重ならないようにする
+        self._story_summary_lock = threading.Lock()
+        self._story_summary_after_id = None
+        # キャラクター名の照合（キャラクターの変更時に作り直す）
+        self.name_matcher: Optional[NameMatcher] = None
+        # 一括生成の永続ジョブキュー（前回の未完了ジョブはAPI初期化後に再開）
+        self.job_queue = JobQueue(self.config.config_dir / 'jobs.sqlite3')
+        # API呼び出しごとの計測記録（統計ダイアログで集計を表示）
+        self.telemetry = TelemetryStore(self.config.config_dir / 'telemetry.sqlite3')
+        # トークン・料金の予算（使い切るとジョブの実行を一時停止）
+        self.usage_budget = UsageBudget(
+            self.config.get_budget_settings(),
+            on_warning=lambda message: self.after(0, self._show_budget_warning, message)
+        )
+        self.usage_budget.load(None, self.telemetry)
+        # 接続状態（オフライン中に失敗した生成はジョブとして保留し、接続が戻ったら実行）
+        self.connectivity = ConnectivityMonitor()
+        self.connectivity.add_listener(lambda online: self.after(0, self._on_connectivity_changed, online))
+        self.job_runner = JobRunner(
+            self.job_queue,
+            {'expand_scene': self._run_expand_job},
+            on_finished=self._on_job_finished,
+            paused=self._jobs_paused,
+            limiter=self.limiter
+        )
+        # 生成途中の本文の書き出し先（異常終了・通信切断時に続きから再開する）
+        self.spool_dir = SpoolDirectory(self.config.config_dir / 'spool')
+        self.project_manager.add_change_listener(self._on_project_changed)
 
         # 現在の状態
         self.current_scene_content = ""
+        # 読み込み中のシーンID（新規シーンの場合はNone）
+        self.loaded_scene_id: Optional[str] = None
+        # 未保存のシーンで採用しなかった生成候補（保存時にシーンの履歴へ）
+        self.pending_history: List[Dict[str, Any]] = []
+        # 表示中の生成結果を生成したモデル
+        self.current_result_model: Optional[str] = None
+        # オフライン中は無効にする生成ボタン（ジョブとして保留できない生成）
+        self.online_only_buttons: List[ctk.CTkButton] = []
 
         # ドラッグ&ドロップの状態
         self.drag_data = {
@@ -74,12 +137,18 @@ class MainWindow(ctk.CTk):
         if TKDND_AVAILABLE:
             self._setup_drop_zone()
 
-        # APIキーのチェック
-        self._initialize_api()
+        # APIの初期化（ウィンドウの表示後にバックグラウンドで実行）
+        self.after(100, self._initialize_api)
 
         # 最後のプロジェクトを開く
         self._load_last_project()
 
+        # 一括処理の同時実行数の表示を定期更新
+        self._update_concurrency_status()
+
+        # 前回中断した生成の途中の本文があれば復元
+        self.after(500, self._recover_spooled_results)
+
     def _apply_theme(self, mode: str, color: str):
         """テーマを適用"""
         ctk.set_appearance_mode(mode)
@@ -201,6 +270,7 @@ class MainWindow(ctk.CTk):
             ("🔍 検索", self._show_search, "#f57c00"),
             ("📊 統計", self._show_stats, "#00838f"),
             ("📋 テンプレート", self._show_templates, "#5e35b1"),
+            ("⚡ 一括拡張", self._show_batch_expand, "#2e7d32"),
         ]
         self._create_button_group(toolbar_scroll, "ツール", tool_buttons)
 
@@ -274,6 +344,24 @@ class MainWindow(ctk.CTk):
         )
         self.api_status_label.pack(side="left", padx=10)
 
+        # 一括処理の同時実行数・処理量
+        self.concurrency_label = ctk.CTkLabel(
+            status_frame,
+            text="",
+            font=ctk.CTkFont(size=11),
+            text_color=("gray40", "gray60")
+        )
+        self.concurrency_label.pack(side="left", padx=10)
+
+        # 予算の残り
+        self.budget_label = ctk.CTkLabel(
+            status_frame,
+            text="",
+            font=ctk.CTkFont(size=11),
+            text_color=("gray40", "gray60")
+        )
+        self.budget_label.pack(side="left", padx=10)
+
         # ステータスメッセージ
         self.status_message_label = ctk.CTkLabel(
             status_frame,
@@ -321,7 +409,19 @@ class MainWindow(ctk.CTk):
             fg_color="#1565c0",
             hover_color="#0d47a1"
         )
-        ai_btn.pack(side="left")
+        ai_btn.pack(side="left", padx=(0, 5))
+        self.online_only_buttons.append(ai_btn)
+
+        batch_btn = ctk.CTkButton(
+            button_frame,
+            text="一括生成",
+            command=self._generate_characters_batch,
+            width=80,
+            fg_color="#00838f",
+            hover_color="#006064"
+        )
+        batch_btn.pack(side="left")
+        self.online_only_buttons.append(batch_btn)
 
         # キャラクターリスト
         self.character_listbox = ctk.CTkScrollableFrame(parent)
@@ -379,6 +479,7 @@ class MainWindow(ctk.CTk):
             hover_color="#0d47a1"
         )
         ai_btn.pack(side="left")
+        self.online_only_buttons.append(ai_btn)
 
         # 世界観情報表示
         self.world_text = ctk.CTkTextbox(parent, wrap="word")
@@ -435,9 +536,24 @@ class MainWindow(ctk.CTk):
         self.scene_overview_text = ctk.CTkTextbox(scene_frame, height=60)
         self.scene_overview_text.pack(fill="x", pady=(0, 10))
 
+        # タイトル・概要を入力し終えたら、未選択の場合だけキャラクターを自動選択
+        self.scene_title_entry.bind("<FocusOut>", lambda e: self._auto_select_if_unselected())
+        self.scene_overview_text.bind("<FocusOut>", lambda e: self._auto_select_if_unselected())
+
         # 使用キャラクター（複数選択対応）
-        char_label = ctk.CTkLabel(scene_frame, text="使用キャラクター（複数選択可）:", font=ctk.CTkFont(size=14))
-        char_label.pack(anchor="w", pady=(0, 5))
+        char_header = ctk.CTkFrame(scene_frame, fg_color="transparent")
+        char_header.pack(fill="x", pady=(0, 5))
+
+        char_label = ctk.CTkLabel(char_header, text="使用キャラクター（複数選択可）:", font=ctk.CTkFont(size=14))
+        char_label.pack(side="left")
+
+        ctk.CTkButton(
+            char_header,
+            text="概要から自動選択",
+            command=self._auto_select_characters,
+            width=130,
+            height=26
+        ).pack(side="right")
 
         # キャラクター選択フレーム
         self.char_selection_frame = ctk.CTkScrollableFrame(scene_frame, height=80)
@@ -449,14 +565,16 @@ class MainWindow(ctk.CTk):
         generate_frame = ctk.CTkFrame(scene_frame, fg_color="transparent")
         generate_frame.pack(fill="x", pady=10)
 
-        ctk.CTkButton(
+        plot_btn = ctk.CTkButton(
             generate_frame,
             text="プロット生成",
             command=self._generate_plot,
             width=130,
             fg_color="#1565c0",
             hover_color="#0d47a1"
-        ).pack(side="left", padx=5)
+        )
+        plot_btn.pack(side="left", padx=5)
+        self.online_only_buttons.append(plot_btn)
 
         ctk.CTkButton(
             generate_frame,
@@ -476,6 +594,16 @@ class MainWindow(ctk.CTk):
             hover_color="#b71c1c"
         ).pack(side="left", padx=5)
 
+        # 候補数（2以上で複数の候補から選択）
+        self.candidate_count_var = ctk.StringVar(value="1")
+        ctk.CTkOptionMenu(
+            generate_frame,
+            values=["1", "2", "3", "4"],
+            variable=self.candidate_count_var,
+            width=60
+        ).pack(side="right", padx=5)
+        ctk.CTkLabel(generate_frame, text="候補数:").pack(side="right")
+
     def _create_right_panel(self, parent):
         """右パネルの作成（生成結果・シーン一覧）"""
         # タブビュー：シーン一覧と生成結果
@@ -528,8 +656,14 @@ class MainWindow(ctk.CTk):
         self.selected_scene_id = None
 
     def _initialize_api(self):
-        """APIの初期化"""
+        """APIの初期化（クライアントの作成と通信の事前準備はバックグラウンドで実行）"""
         api_key = self.config.get_api_key()
+        backend_settings = self.config.get_backend_settings()
+        replaying = backend_settings['cassette'].get('mode') == 'replay'
+        offline = backend_settings.get('type') == 'fake' or replaying
+        if offline:
+            # 偽のバックエンド・カセットの再生はAPIキーなしで動作
+            api_key = api_key or 'offline'
         if not api_key:
             self.api_status_label.configure(text="● API: 未接続", text_color="red")
             messagebox.showwarning(
@@ -538,21 +672,408 @@ class MainWindow(ctk.CTk):
             )
             return
 
-        try:
-            api_config = self.config.get_api_config()
-            self.gemini_client = GeminiClient(
-                api_key=api_key,
-                model=api_config.get('model', 'gemini-2.0-flash')
+        # 設定の保存で初期化し直した場合は、古い初期化の結果を使わない
+        self._api_init_count += 1
+        init_id = self._api_init_count
+        self.api_status_label.configure(text="● API: 初期化中...", text_color="orange")
+        settings = {
+            'api_key': api_key,
+            'api': self.config.get_api_config(),
+            'backend': backend_settings,
+            'generation_profiles': self.config.get_generation_profiles(),
+            'context': self.config.get_context_settings(),
+            'reliability': self.config.get_reliability_settings()
+        }
+
+        def initialize():
+            try:
+                client = self._create_gemini_client(settings)
+            except Exception as e:
+                self.after(0, self._on_api_initialized, init_id, None, None, e)
+                return
+            # 最初の生成で接続の確立を待たないように、トークン数の計測で接続しておく
+            warm_up = client.warm_up()
+            self.after(0, self._on_api_initialized, init_id, client, warm_up, None)
+
+        threading.Thread(target=initialize, daemon=True).start()
+
+    def _create_gemini_client(self, settings: Dict[str, Any]) -> GeminiClient:
+        """
+        設定からGeminiクライアントを作成（バックグラウンドスレッドで呼ばれる）
+
+        Args:
+            settings: api_key, api, backend, generation_profiles, context, reliability
+
+        Returns:
+            クライアント
+        """
+        api_config = settings['api']
+        client = GeminiClient(
+            api_key=settings['api_key'],
+            model=api_config.get('model', 'gemini-2.0-flash'),
+            generation_profiles=settings['generation_profiles'],
+            model_pool=self.model_pool,
+            backend=create_backend(settings['backend'])
+        )
+        client.limiter = self.limiter
+        client.update_generation_config(
+            temperature=api_config.get('temperature', 0.7),
+            max_tokens=api_config.get('max_tokens', 4000),
+            top_p=api_config.get('top_p', 0.9)
+        )
+        client.condensed_context = settings['context'].get('condensed_context', False)
+        client.telemetry = self.telemetry
+        client.usage_budget = self.usage_budget
+        reliability = settings['reliability']
+        client.hedger.configure(
+            enabled=reliability.get('hedging_enabled', False),
+            percentile=reliability.get('hedge_percentile', 95),
+            max_extra_ratio=reliability.get('hedge_max_extra_ratio', 0.1),
+            min_samples=reliability.get('hedge_min_samples', 10)
+        )
+        client.limiter.configure(reliability.get('max_concurrency', 8))
+        client.scheduler.configure(reliability.get('max_concurrent_requests', 6))
+        client.set_fallback_chain(
+            reliability.get('fallback_models', []),
+            latency_slo=reliability.get('latency_slo', {}),
+            cooldown=reliability.get('fallback_cooldown', 300)
+        )
+        client.repetition_check = {
+            'enabled': reliability.get('repetition_check', True),
+            'ngram': reliability.get('repetition_ngram', 20),
+            'window': reliability.get('repetition_window', 300),
+            'ratio': reliability.get('repetition_ratio', 0.8)
+        }
+        return client
+
+    def _on_api_initialized(
+        self,
+        init_id: int,
+        client: Optional[GeminiClient],
+        warm_up: Optional[float],
+        error: Optional[Exception]
+    ):
+        """APIの初期化の完了時の処理"""
+        if init_id != self._api_init_count:
+            return
+        if error is not None:
+            self.api_status_label.configure(text="● API: エラー", text_color="red")
+            messagebox.showerror("エラー", f"API初期化に失敗しました: {str(error)}")
+            return
+
+        client.project_key = self.project_manager.current_project_path
+        client.connectivity = self.connectivity
+        # 復帰の確認は共通のモデルのみ（接続できるかどうかの確認のため）
+        self.connectivity.set_probe(lambda: client.test_connection([client.model_name]))
+        self.gemini_client = client
+        backend_settings = self.config.get_backend_settings()
+        if backend_settings['cassette'].get('mode') == 'replay':
+            self.api_status_label.configure(text="● API: カセット再生", text_color="orange")
+        elif backend_settings.get('type') == 'fake':
+            self.api_status_label.configure(text="● API: 偽のバックエンド", text_color="orange")
+        elif warm_up is None:
+            # 事前準備に失敗しても生成時に改めて接続する
+            self.api_status_label.configure(text="● API: 接続未確認", text_color="orange")
+        else:
+            self.api_status_label.configure(text="● API: 接続済み", text_color="green")
+        self.job_runner.start()
+
+    def _show_batch_expand(self):
+        """一括拡張ダイアログを表示し、ジョブを登録"""
+        if not self.project_manager.current_project:
+            messagebox.showwarning("警告", "プロジェクトを開いてください")
+            return
+
+        dialog = BatchExpandDialog(
+            self,
+            self.project_manager.get_scenes(),
+            self.job_queue.counts,
+            self.job_queue.retry_failed
+        )
+        self.wait_window(dialog)
+
+        if not dialog.result:
+            self.job_runner.notify()
+            return
+
+        if self.name_matcher is None:
+            self.name_matcher = NameMatcher(self.project_manager.get_characters())
+        max_characters = self.config.get_context_settings().get('auto_select_max_characters', 6)
+
+        # 実行時にプロジェクトが変わっていても再現できるよう入力ごと保存
+        for scene_id in dialog.result['scene_ids']:
+            scene = self.project_manager.get_scene_by_id(scene_id)
+            if not scene:
+                continue
+            characters = self.name_matcher.select(
+                f"{scene.get('title', '')}\n{scene.get('content', '')}", max_characters
             )
-            self.gemini_client.update_generation_config(
-                temperature=api_config.get('temperature', 0.7),
-                max_tokens=api_config.get('max_tokens', 4000),
-                top_p=api_config.get('top_p', 0.9)
+            self.job_queue.enqueue(
+                'expand_scene',
+                {
+                    'stage': dialog.result['stage'],
+                    'title': scene.get('title', ''),
+                    'source': scene.get('content', ''),
+                    'characters': characters,
+                    'world_setting': self.project_manager.get_world_settings(),
+                    'writing_style': self.project_manager.get_writing_style()
+                },
+                project_path=self.project_manager.current_project_path,
+                target_id=scene_id
             )
-            self.api_status_label.configure(text="● API: 接続済み", text_color="green")
-        except Exception as e:
-            self.api_status_label.configure(text="● API: エラー", text_color="red")
-            messagebox.showerror("エラー", f"API初期化に失敗しました: {str(e)}")
+
+        self.job_runner.notify()
+        self.status_message_label.configure(
+            text=f"{len(dialog.result['scene_ids'])}件の拡張ジョブを登録しました"
+        )
+
+    def _jobs_paused(self) -> bool:
+        """ジョブの実行を一時停止するか（予算切れ・オフライン）"""
+        return self.usage_budget.exhausted() or not self.connectivity.online
+
+    def _on_connectivity_changed(self, online: bool):
+        """
+        接続状態の変化時の処理
+        （オフライン中は保留できない生成のボタンを無効にし、オンラインに戻ったら保留中のジョブを再開）
+        """
+        for button in self.online_only_buttons:
+            button.configure(state="normal" if online else "disabled")
+        if not online:
+            self.api_status_label.configure(text="● API: オフライン", text_color="orange")
+            self.status_message_label.configure(
+                text="接続できません。中編化・長編化は接続が戻るまで保留します"
+                     "（プロット・キャラクター・世界観の生成は接続が戻ると使用できます）"
+            )
+            return
+
+        self.api_status_label.configure(text="● API: 接続済み", text_color="green")
+        pending = self.job_queue.counts()['pending']
+        if pending:
+            self.status_message_label.configure(text=f"接続が戻りました。保留中の生成{pending}件を再開します")
+        else:
+            self.status_message_label.configure(text="接続が戻りました")
+        self.job_runner.notify()
+
+    def _queue_offline_expansion(
+        self,
+        stage: str,
+        spool: SpoolFile,
+        source: str,
+        title: str,
+        characters: List[Dict[str, Any]],
+        world_setting: Dict[str, Any],
+        writing_style: Dict[str, str]
+    ) -> bool:
+        """
+        接続できずに失敗した拡張を、読み込み中のシーンへの拡張ジョブとして保留
+        （生成途中の本文はジョブに引き継ぎ、接続が戻ったら続きから生成）
+
+        Args:
+            stage: 生成ステージ（medium / long）
+            spool: 画面操作の生成のスプール
+            source: 拡張元の本文
+            title: シーンタイトル
+            characters: キャラクター情報
+            world_setting: 世界観設定
+            writing_style: 文体スタイル
+
+        Returns:
+            保留したかどうか（保存済みのシーンを開いていない場合はFalse）
+        """
+        project_path = self.project_manager.current_project_path
+        if self.connectivity.online or not project_path or not self.loaded_scene_id:
+            return False
+
+        payload = {
+            'stage': stage,
+            'title': title,
+            'source': source,
+            'characters': characters,
+            'world_setting': world_setting,
+            'writing_style': writing_style
+        }
+        spool.close()
+        self.spool_dir.rename(spool.path.stem, self._job_spool_name(payload))
+        self.job_queue.enqueue('expand_scene', payload, project_path=project_path, target_id=self.loaded_scene_id)
+        return True
+
+    def _run_expand_job(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        拡張ジョブの実行（ジョブのワーカースレッドから呼ばれる）
+
+        Args:
+            payload: ジョブの入力
+
+        Returns:
+            生成した本文とモデル
+        """
+        client = self.gemini_client
+        if not client:
+            raise Exception("APIが初期化されていません")
+
+        expand = client.expand_to_medium if payload['stage'] == 'medium' else client.expand_to_long
+        # 前回の試行・起動時に途中まで生成していれば続きから再開
+        spool = self._open_spool(self._job_spool_name(payload), payload['stage'], payload['source'], payload['title'])
+        # 同時実行数はジョブのワーカーが確保した実行枠で制限済み
+        # ジョブの入力は登録時点の写しのため、開いているプロジェクトのキャッシュと区別する
+        with client.background(), client.spool_to(spool), client.snapshot_context():
+            result = expand(
+                payload['source'],
+                payload['title'],
+                payload['characters'],
+                payload['world_setting'],
+                payload['writing_style']
+            )
+        return {'text': str(result), 'model': getattr(result, 'model', None)}
+
+    def _on_job_finished(self, job: Dict[str, Any]):
+        """
+        ジョブの完了・失敗時の処理（ジョブのワーカースレッドから呼ばれる）
+
+        Args:
+            job: 実行したジョブ
+        """
+        # 結果がデータベースに保存されてから途中の本文を削除（失敗時は再試行で続きから再開）
+        finished = self.job_queue.get_job(job['id'])
+        if finished and finished['status'] == DONE:
+            self.spool_dir.discard(self._job_spool_name(job['payload']))
+        self.after(0, self._apply_job_results)
+
+    @staticmethod
+    def _job_spool_name(payload: Dict[str, Any]) -> str:
+        """拡張ジョブの途中の本文のスプール名（同じ入力のジョブは同じ名前）"""
+        digest = hashlib.sha256(
+            f"{payload['stage']}\n{payload['title']}\n{payload['source']}".encode('utf-8')
+        ).hexdigest()
+        return f"job-{digest[:32]}"
+
+    def _open_spool(self, name: str, stage: str, source: str, title: str) -> SpoolFile:
+        """
+        生成途中の本文のスプールを開く（元の本文とタイトルが同じ場合のみ途中の本文を再利用）
+
+        Args:
+            name: スプール名
+            stage: 生成ステージ
+            source: 拡張元の本文
+            title: シーンタイトル
+
+        Returns:
+            SpoolFile
+        """
+        key = hashlib.sha256(f"{stage}\n{title}\n{source}".encode('utf-8')).hexdigest()
+        return self.spool_dir.open(name, key, {'stage': stage, 'title': title})
+
+    def _recover_spooled_results(self):
+        """前回中断した画面操作の生成の途中の本文を表示するか確認"""
+        for spool in self.spool_dir.recoverable('interactive-'):
+            header = spool['header']
+            label = GENERATION_STAGE_LABELS.get(header.get('stage'), header.get('stage', ''))
+            if not messagebox.askyesno(
+                "途中の本文の復元",
+                f"前回中断した{label}（{header.get('title') or '無題'}）の途中の本文が"
+                f"{len(spool['text'])}文字あります。\n表示しますか？\n\n"
+                "同じ本文からもう一度実行すると、表示しなくても続きから生成されます。"
+            ):
+                continue
+            self.result_text.delete("1.0", "end")
+            self.result_text.insert("1.0", spool['text'].strip())
+            self.current_scene_content = spool['text'].strip()
+            self.status_message_label.configure(text=f"中断した{label}の途中の本文を復元しました")
+            break
+
+    def _apply_job_results(self):
+        """完了したジョブの結果を開いているプロジェクトに反映（反映済みのものは除く）"""
+        project_path = self.project_manager.current_project_path
+        if not project_path or not self.project_manager.current_project:
+            return
+
+        applied = 0
+        for job in self.job_queue.unapplied_results(project_path):
+            result = job['result'] or {}
+            try:
+                if self.project_manager.apply_generated_content(
+                    job['target_id'],
+                    result.get('text', ''),
+                    job['id'],
+                    job['payload'].get('stage', ''),
+                    result.get('model')
+                ):
+                    applied += 1
+            except Exception:
+                continue
+            self.job_queue.mark_applied(job['id'])
+
+        if applied:
+            self._refresh_scene_list()
+            self.status_message_label.configure(text=f"拡張ジョブの結果を{applied}件のシーンに反映しました")
+
+    def _update_concurrency_status(self):
+        """一括処理の同時実行数と直近1分の処理量をステータスバーに表示"""
+        if self.gemini_client:
+            stats = self.gemini_client.limiter.get_stats()
+            text = f"並列: {stats['in_flight']}/{stats['limit']}  処理量: {stats['throughput_per_min']}件/分"
+            counts = self.job_queue.counts()
+            if counts['pending'] or counts['running']:
+                text += f"  ジョブ: 待機{counts['pending']} 実行中{counts['running']}"
+            self.concurrency_label.configure(text=text)
+        self._update_budget_status()
+        self.after(2000, self._update_concurrency_status)
+
+    def _update_budget_status(self):
+        """予算の残りをステータスバーに表示（上限が未設定の場合は表示しない）"""
+        labels = {'daily': "本日", 'project': "プロジェクト"}
+        parts = []
+        for scope, remaining in self.usage_budget.remaining().items():
+            if remaining['tokens'] is not None:
+                parts.append(f"{labels[scope]}残り {remaining['tokens']:,}トークン")
+            if remaining['cost'] is not None:
+                parts.append(f"{labels[scope]}残り ${remaining['cost']:.2f}")
+        if not parts:
+            self.budget_label.configure(text="")
+            return
+        exhausted = self.usage_budget.exhausted()
+        text = "予算: " + " / ".join(parts) + ("（一括処理を停止中）" if exhausted else "")
+        self.budget_label.configure(text=text, text_color="red" if exhausted else ("gray40", "gray60"))
+
+    def _show_budget_warning(self, message: str):
+        """予算のしきい値を超えた時の警告"""
+        self.status_message_label.configure(text=message)
+        self._update_budget_status()
+
+    def _on_project_changed(self, kind: str, item_id: Optional[str] = None):
+        """プロジェクト変更時の処理（検索インデックスの更新、生成用キャッシュの破棄）"""
+        if kind in ('project', 'character'):
+            self.name_matcher = None
+        if kind == 'project':
+            # 閉じている間に完了したジョブの結果を反映
+            self.after(0, self._apply_job_results)
+            # プロジェクトの予算をこれまでの使用量から計算し直す
+            project_path = self.project_manager.current_project_path
+            self.usage_budget.load(project_path, self.telemetry, self.project_manager.get_budget())
+            if self.gemini_client:
+                self.gemini_client.project_key = project_path
+        elif kind == 'budget':
+            self.usage_budget.set_project_limits(self.project_manager.get_budget())
+
+        if kind == 'project':
+            self.scene_index.rebuild(self.project_manager.get_scenes())
+        elif kind == 'scene' and item_id:
+            scene = self.project_manager.get_scene_by_id(item_id)
+            if scene:
+                self.scene_index.update_scene(scene)
+            else:
+                self.scene_index.remove_scene(item_id)
+
+        if not self.gemini_client:
+            return
+
+        if kind == 'scene':
+            self._schedule_story_summary_refresh()
+
+        if kind == 'project':
+            self.gemini_client.context_cache.invalidate()
+        elif kind in ('character', 'world', 'style'):
+            self.gemini_client.context_cache.invalidate(kind)
 
     def _load_last_project(self):
         """最後のプロジェクトを読み込み"""
@@ -678,7 +1199,7 @@ class MainWindow(ctk.CTk):
             messagebox.showwarning("警告", "プロジェクトを開いてください")
             return
 
-        dialog = StatsDialog(self, self.project_manager.current_project)
+        dialog = StatsDialog(self, self.project_manager.current_project, self.telemetry, self.gemini_client)
         self.wait_window(dialog)
 
     def _show_templates(self):
@@ -703,11 +1224,21 @@ class MainWindow(ctk.CTk):
         dialog = APIConfigDialog(
             self,
             self.config,
-            test_connection_callback=self._test_api_connection
+            test_connection_callback=self._test_api_connection,
+            project_budget=self.project_manager.get_budget() if self.project_manager.current_project else None
         )
         self.wait_window(dialog)
 
         if dialog.result:
+            self.usage_budget.configure(self.config.get_budget_settings())
+            if dialog.project_budget_result is not None:
+                try:
+                    self.project_manager.set_budget(**dialog.project_budget_result)
+                except Exception as e:
+                    messagebox.showerror("エラー", f"プロジェクトの予算の保存に失敗しました: {str(e)}")
+            self._update_budget_status()
+            # ジョブの再開・停止を予算に合わせる
+            self.job_runner.notify()
             self._initialize_api()
 
     def _show_theme_config(self):
@@ -732,13 +1263,39 @@ class MainWindow(ctk.CTk):
             except Exception as e:
                 messagebox.showerror("エラー", f"設定に失敗しました: {str(e)}")
 
-    def _test_api_connection(self, api_key: str, model: str) -> bool:
-        """API接続テスト"""
+    def _test_api_connection(
+        self,
+        api_key: str,
+        model: str,
+        profiles: Dict[str, Dict[str, Any]],
+        backend_type: Optional[str] = None
+    ) -> List[str]:
+        """
+        API接続テスト（各ステージで使用するモデルを確認）
+
+        Args:
+            api_key: APIキー
+            model: 共通のモデル
+            profiles: ステージ別生成プロファイル
+            backend_type: 設定画面で選択中のバックエンド（Noneの場合は保存済みの設定）
+
+        Returns:
+            接続できなかったモデル
+        """
         try:
-            client = GeminiClient(api_key=api_key, model=model)
-            return client.test_connection()
+            # 接続先・記録再生などは本番のクライアントと同じ設定で作成
+            backend_settings = copy.deepcopy(self.config.get_backend_settings())
+            if backend_type:
+                backend_settings['type'] = backend_type
+            client = GeminiClient(
+                api_key=api_key,
+                model=model,
+                generation_profiles=profiles,
+                backend=create_backend(backend_settings)
+            )
+            return client.unreachable_models()
         except Exception:
-            return False
+            return [model]
 
     def _update_ui_from_project(self):
         """プロジェクトからUIを更新"""
@@ -929,6 +1486,8 @@ class MainWindow(ctk.CTk):
         self.result_text.insert("1.0", scene.get('content', ''))
 
         self.current_scene_content = scene.get('content', '')
+        self.loaded_scene_id = scene.get('id')
+        self.pending_history = []
 
         messagebox.showinfo("成功", "シーンを読み込みました")
 
@@ -960,6 +1519,8 @@ class MainWindow(ctk.CTk):
         self.result_text.insert("1.0", scene.get('content', ''))
 
         self.current_scene_content = scene.get('content', '')
+        self.loaded_scene_id = scene.get('id')
+        self.pending_history = []
 
         messagebox.showinfo("成功", f"シーン「{scene.get('title', '無題')}」を読み込みました")
 
@@ -1010,6 +1571,40 @@ class MainWindow(ctk.CTk):
             except Exception as e:
                 messagebox.showerror("エラー", f"追加に失敗しました: {str(e)}")
 
+    def _generate_characters_batch(self):
+        """AIでキャラクターを一括生成"""
+        if not self.project_manager.current_project:
+            messagebox.showwarning("警告", "プロジェクトを開いてください")
+            return
+
+        if not self.gemini_client:
+            messagebox.showwarning("警告", "APIが初期化されていません")
+            return
+
+        existing_names = [char.get('name', '') for char in self.project_manager.get_characters()]
+
+        def batch_generate(concepts, ensemble_concept, count, generated_names=()):
+            # 一括生成は低優先度（実行中もプロット生成などを先に処理）
+            with self.gemini_client.background():
+                return self.gemini_client.generate_characters(
+                    concepts=concepts,
+                    ensemble_concept=ensemble_concept,
+                    count=count,
+                    existing_names=existing_names + list(generated_names)
+                )
+
+        dialog = BatchCharacterDialog(self, batch_generate)
+        self.wait_window(dialog)
+
+        if dialog.result:
+            try:
+                added = self.project_manager.add_characters(dialog.result)
+                self._refresh_character_list()
+                self._refresh_character_checkboxes()
+                messagebox.showinfo("成功", f"{len(added)}人のキャラクターを追加しました")
+            except Exception as e:
+                messagebox.showerror("エラー", f"追加に失敗しました: {str(e)}")
+
     def _edit_character(self):
         """キャラクターを編集"""
         if not self.selected_character_id:
@@ -1097,6 +1692,8 @@ class MainWindow(ctk.CTk):
         self.scene_overview_text.delete("1.0", "end")
         self.result_text.delete("1.0", "end")
         self.current_scene_content = ""
+        self.loaded_scene_id = None
+        self.pending_history = []
 
     def _save_scene(self):
         """シーンを保存"""
@@ -1116,9 +1713,14 @@ class MainWindow(ctk.CTk):
             'overview': self.scene_overview_text.get("1.0", "end-1c").strip(),
             'content': content
         }
+        if self.current_result_model:
+            scene_data['model'] = self.current_result_model
+        if self.pending_history:
+            scene_data['history'] = list(self.pending_history)
 
         try:
             self.project_manager.add_scene(scene_data)
+            self.pending_history = []
             messagebox.showinfo("成功", "シーンを保存しました")
         except Exception as e:
             messagebox.showerror("エラー", f"保存に失敗しました: {str(e)}")
@@ -1141,21 +1743,24 @@ class MainWindow(ctk.CTk):
         world_settings = self.project_manager.get_world_settings()
         writing_style = self.project_manager.get_writing_style()
 
+        candidate_count = int(self.candidate_count_var.get())
         progress_dialog = ProgressDialog(self, "プロットを生成中...")
 
         def generate_thread():
             try:
+                self._prepare_condensed_context(characters)
                 result = self.gemini_client.generate_plot(
                     title=title,
                     overview=overview,
                     characters=characters,
                     world_setting=world_settings,
-                    writing_style=writing_style
+                    writing_style=writing_style,
+                    related_passages=self._get_related_passages(f"{title}\n{overview}"),
+                    story_so_far=self._get_story_so_far(),
+                    candidate_count=candidate_count
                 )
-                self.current_scene_content = result
-                self.result_text.delete("1.0", "end")
-                self.result_text.insert("1.0", result)
                 progress_dialog.close()
+                self._show_generation_result('plot', result)
             except Exception as e:
                 progress_dialog.close()
                 messagebox.showerror("エラー", f"生成に失敗しました: {str(e)}")
@@ -1180,24 +1785,42 @@ class MainWindow(ctk.CTk):
         world_settings = self.project_manager.get_world_settings()
         writing_style = self.project_manager.get_writing_style()
 
+        candidate_count = int(self.candidate_count_var.get())
         progress_dialog = ProgressDialog(self, "中編化中...")
 
+        # ストリーミングした本文を書き出し、失敗しても同じ本文から再実行すれば続きから生成
+        spool = self._open_spool('interactive-medium', 'medium', content, title)
+
         def expand_thread():
             try:
-                result = self.gemini_client.expand_to_medium(
-                    plot=content,
-                    title=title,
-                    characters=characters,
-                    world_setting=world_settings,
-                    writing_style=writing_style
-                )
-                self.current_scene_content = result
-                self.result_text.delete("1.0", "end")
-                self.result_text.insert("1.0", result)
+                self._prepare_condensed_context(characters)
+                with self.gemini_client.spool_to(spool):
+                    result = self.gemini_client.expand_to_medium(
+                        plot=content,
+                        title=title,
+                        characters=characters,
+                        world_setting=world_settings,
+                        writing_style=writing_style,
+                        related_passages=self._get_related_passages(f"{title}\n{content}"),
+                        candidate_count=candidate_count
+                    )
+                spool.discard()
                 progress_dialog.close()
+                self._show_generation_result('medium', result)
             except Exception as e:
                 progress_dialog.close()
-                messagebox.showerror("エラー", f"中編化に失敗しました: {str(e)}")
+                if self._queue_offline_expansion(
+                    'medium', spool, content, title, characters, world_settings, writing_style
+                ):
+                    messagebox.showinfo(
+                        "オフライン",
+                        f"接続できないため中編化を保留しました。\n"
+                        f"接続が戻ると自動で実行し、結果をシーン「{title or '無題'}」に反映します。"
+                    )
+                    return
+                partial = spool.size()
+                note = f"\n\n途中までの本文（{partial}文字）を保存しました。同じ本文からもう一度実行すると続きから生成します。" if partial else ""
+                messagebox.showerror("エラー", f"中編化に失敗しました: {str(e)}{note}")
 
         thread = threading.Thread(target=expand_thread, daemon=True)
         thread.start()
@@ -1219,29 +1842,259 @@ class MainWindow(ctk.CTk):
         world_settings = self.project_manager.get_world_settings()
         writing_style = self.project_manager.get_writing_style()
 
+        candidate_count = int(self.candidate_count_var.get())
         progress_dialog = ProgressDialog(self, "長編化中...")
 
+        # ストリーミングした本文を書き出し、失敗しても同じ本文から再実行すれば続きから生成
+        spool = self._open_spool('interactive-long', 'long', content, title)
+
         def expand_thread():
             try:
-                result = self.gemini_client.expand_to_long(
-                    medium_story=content,
-                    title=title,
-                    characters=characters,
-                    world_setting=world_settings,
-                    writing_style=writing_style
-                )
-                self.current_scene_content = result
-                self.result_text.delete("1.0", "end")
-                self.result_text.insert("1.0", result)
+                self._prepare_condensed_context(characters)
+                with self.gemini_client.spool_to(spool):
+                    result = self.gemini_client.expand_to_long(
+                        medium_story=content,
+                        title=title,
+                        characters=characters,
+                        world_setting=world_settings,
+                        writing_style=writing_style,
+                        related_passages=self._get_related_passages(f"{title}\n{content}"),
+                        candidate_count=candidate_count
+                    )
+                spool.discard()
                 progress_dialog.close()
+                self._show_generation_result('long', result)
             except Exception as e:
                 progress_dialog.close()
-                messagebox.showerror("エラー", f"長編化に失敗しました: {str(e)}")
+                if self._queue_offline_expansion(
+                    'long', spool, content, title, characters, world_settings, writing_style
+                ):
+                    messagebox.showinfo(
+                        "オフライン",
+                        f"接続できないため長編化を保留しました。\n"
+                        f"接続が戻ると自動で実行し、結果をシーン「{title or '無題'}」に反映します。"
+                    )
+                    return
+                partial = spool.size()
+                note = f"\n\n途中までの本文（{partial}文字）を保存しました。同じ本文からもう一度実行すると続きから生成します。" if partial else ""
+                messagebox.showerror("エラー", f"長編化に失敗しました: {str(e)}{note}")
 
         thread = threading.Thread(target=expand_thread, daemon=True)
         thread.start()
         progress_dialog.show()
 
+    def _show_generation_result(self, stage: str, result):
+        """
+        生成結果を表示（複数候補の場合は選択ダイアログを表示）
+
+        Args:
+            stage: 生成ステージ
+            result: 生成結果（文字列または候補のリスト）
+        """
+        if isinstance(result, list):
+            if len(result) > 1:
+                self.after(0, lambda: self._choose_candidate(stage, result))
+                return
+            result = result[0]
+
+        self.current_scene_content = result
+        self.result_text.delete("1.0", "end")
+        self.result_text.insert("1.0", result)
+
+        self.current_result_model = getattr(result, 'model', None)
+        if self.current_result_model:
+            self.status_message_label.configure(text=f"生成モデル: {self.current_result_model}")
+
+    def _choose_candidate(self, stage: str, candidates: List[str]):
+        """候補を選択し、採用しなかった候補をシーンの履歴に残す"""
+        dialog = CandidateDialog(self, candidates, GENERATION_STAGE_LABELS.get(stage, stage))
+        self.wait_window(dialog)
+
+        if dialog.result is not None:
+            self._show_generation_result(stage, candidates[dialog.result])
+
+        unchosen = [text for i, text in enumerate(candidates) if i != dialog.result]
+        self._keep_in_history(stage, unchosen)
+
+    def _keep_in_history(self, stage: str, texts: List[str]):
+        """
+        生成結果をシーンの履歴に残す（未保存のシーンは保存時に追加）
+
+        Args:
+            stage: 生成ステージ
+            texts: 残すテキスト
+        """
+        if not texts:
+            return
+
+        created_at = datetime.now().isoformat()
+        entries = [
+            {'stage': stage, 'text': text, 'model': getattr(text, 'model', None), 'created_at': created_at}
+            for text in texts
+        ]
+
+        if self.loaded_scene_id and self.project_manager.get_scene_by_id(self.loaded_scene_id):
+            try:
+                self.project_manager.add_scene_history(self.loaded_scene_id, entries)
+                return
+            except Exception:
+                pass
+        self.pending_history.extend(entries)
+
+    def _prepare_condensed_context(self, characters: List[Dict[str, Any]]):
+        """要約コンテキスト使用時、未作成・古い要約を作成（生成スレッドから呼ぶ）"""
+        if not self.gemini_client.condensed_context:
+            return
+
+        ensure_summaries(
+            self.project_manager,
+            characters,
+            self.gemini_client.summarize_profile,
+            run_batch=self.gemini_client.run_batch
+        )
+
+    def _get_related_passages(self, query: str) -> List[str]:
+        """
+        現在のシーンより前のシーンから関連するパッセージを取得
+
+        Args:
+            query: 検索クエリ（タイトル・概要・本文など）
+
+        Returns:
+            トークン予算内に収めた関連パッセージ
+        """
+        context_settings = self.config.get_context_settings()
+        if not context_settings.get('retrieval_enabled', False):
+            return []
+
+        # 読み込み中のシーンがあれば、それより前のシーンだけを対象にする
+        earlier_ids = set()
+        for scene in self.project_manager.get_scenes():
+            if scene.get('id') == self.loaded_scene_id:
+                break
+            earlier_ids.add(scene.get('id'))
+
+        if not earlier_ids:
+            return []
+
+        results = self.scene_index.search(
+            query,
+            top_k=context_settings.get('retrieval_top_k', 3),
+            scene_ids=earlier_ids
+        )
+        return select_within_budget(
+            results,
+            self.gemini_client.token_estimator,
+            context_settings.get('retrieval_token_budget', 800)
+        )
+
+    def _get_story_so_far(self) -> str:
+        """
+        これまでのあらすじを取得（変更のあったシーンの要約だけを作り直す）
+        生成スレッドから呼ぶ
+
+        Returns:
+            読み込み中のシーンより前のあらすじ
+        """
+        if not self.config.get_context_settings().get('story_summary_enabled', False):
+            return ""
+
+        try:
+            scenes = self.project_manager.get_scenes()
+            summary_data = self._update_story_summary(scenes, before_scene_id=self.loaded_scene_id)
+            return self.story_summary.compose(summary_data, scenes, before_scene_id=self.loaded_scene_id)
+        except Exception:
+            return ""  # あらすじなしで生成を続ける
+
+    def _update_story_summary(self, scenes: List[Dict[str, Any]], before_scene_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        あらすじの要約を更新して保存（生成スレッド・バックグラウンドのスレッドから呼ぶ）
+
+        Args:
+            scenes: シーン（物語順）
+            before_scene_id: このシーンより前だけを作り直す（Noneの場合はすべて）
+
+        Returns:
+            更新後の要約データ
+        """
+        client = self.gemini_client
+        project_path = self.project_manager.current_project_path
+        with self._story_summary_lock:
+            stored = self.project_manager.get_story_summary()
+            summary_data = self.story_summary.update(
+                copy.deepcopy(stored),
+                scenes,
+                client.summarize_scene,
+                client.summarize_story_group,
+                run_batch=client.run_batch,
+                before_scene_id=before_scene_id
+            )
+            # 要約中に別のプロジェクトを開いた場合は保存しない
+            if (self.story_summary.last_recomputed or stored is None) and \
+                    self.project_manager.current_project_path == project_path:
+                self.project_manager.set_story_summary(summary_data)
+        return summary_data
+
+    def _schedule_story_summary_refresh(self):
+        """シーンの保存後、少し待ってからあらすじをバックグラウンドで更新（連続した保存はまとめる）"""
+        if self._story_summary_after_id is not None:
+            self.after_cancel(self._story_summary_after_id)
+        self._story_summary_after_id = self.after(3000, self._refresh_story_summary)
+
+    def _refresh_story_summary(self):
+        """あらすじをバックグラウンドで更新（次の生成で要約を待たないようにする）"""
+        self._story_summary_after_id = None
+        if not self.gemini_client or not self.project_manager.current_project_path:
+            return
+        if not self.config.get_context_settings().get('story_summary_enabled', False):
+            return
+        if not self.connectivity.online:
+            return
+
+        scenes = [dict(scene) for scene in self.project_manager.get_scenes()]
+        client = self.gemini_client
+
+        def refresh():
+            try:
+                with client.background():
+                    self._update_story_summary(scenes)
+            except Exception:
+                pass  # 次の生成時に改めて更新する
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _auto_select_characters(self):
+        """シーンのタイトル・概要で言及されたキャラクターだけを選択"""
+        if not self.character_checkboxes:
+            return
+
+        if self.name_matcher is None:
+            self.name_matcher = NameMatcher(self.project_manager.get_characters())
+
+        title = self.scene_title_entry.get().strip()
+        overview = self.scene_overview_text.get("1.0", "end-1c").strip()
+        max_characters = self.config.get_context_settings().get('auto_select_max_characters', 6)
+        mentioned = self.name_matcher.select(f"{title}\n{overview}", max_characters)
+        if not mentioned:
+            # 見つからない場合は手動の選択を残す
+            self.status_message_label.configure(text="概要に登場するキャラクターが見つかりませんでした")
+            return
+
+        mentioned_ids = {char['id'] for char in mentioned}
+        for char, var in self.character_checkboxes:
+            var.set(char.get('id') in mentioned_ids)
+
+        names = "、".join(char.get('name', '不明') for char in mentioned)
+        self.status_message_label.configure(text=f"キャラクターを自動選択しました: {names}")
+
+    def _auto_select_if_unselected(self):
+        """キャラクターが1人も選択されていない場合だけ自動選択"""
+        if any(var.get() for _, var in self.character_checkboxes):
+            return
+        if not self.scene_title_entry.get().strip() and not self.scene_overview_text.get("1.0", "end-1c").strip():
+            return
+        self._auto_select_characters()
+
     def _get_selected_characters(self) -> List[Dict[str, Any]]:
         """選択されたキャラクターを取得（複数選択対応）"""
         selected_characters = []
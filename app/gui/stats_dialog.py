@@ -3,13 +3,14 @@
 プロジェクトの統計情報を表示
 """
 import customtkinter as ctk
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from app.utils.config import GENERATION_STAGE_LABELS
 
 
 class StatsDialog(ctk.CTkToplevel):
     """統計情報ダイアログクラス"""
 
-    def __init__(self, parent, project_data: Dict[str, Any]):
+    def __init__(self, parent, project_data: Dict[str, Any], telemetry=None, client=None):
         super().__init__(parent)
 
         self.title("統計情報")
@@ -22,6 +23,10 @@ class StatsDialog(ctk.CTkToplevel):
         self.grab_set()
 
         self.project_data = project_data
+        # 生成の計測記録（TelemetryStore、Noneの場合は表示しない）
+        self.telemetry = telemetry
+        # 起動中のAPIクライアント（この起動中の呼び出しの統計を表示、Noneの場合は表示しない）
+        self.client = client
         self._create_widgets()
         self._calculate_stats()
 
@@ -141,6 +146,134 @@ class StatsDialog(ctk.CTkToplevel):
         stats_text.append(f"作成日時: {created}")
         stats_text.append(f"最終更新: {modified}")
 
+        # 生成の計測
+        if self.telemetry:
+            stats_text.append("")
+            stats_text.extend(self._telemetry_lines())
+
+        # この起動中のAPI呼び出しの統計
+        if self.client:
+            stats_text.append("")
+            stats_text.extend(self._client_lines())
+
         # テキストボックスに表示
         self.stats_text.insert("1.0", "\n".join(stats_text))
         self.stats_text.configure(state="disabled")
+
+    def _telemetry_lines(self) -> List[str]:
+        """生成の計測記録の集計（全プロジェクト共通）"""
+        lines = ["【生成の所要時間（直近7日間）】"]
+        summary = self.telemetry.stage_summary(days=7)
+        if not summary:
+            lines.append("記録なし")
+        for stage, stats in sorted(summary.items()):
+            label = GENERATION_STAGE_LABELS.get(stage, stage or '不明')
+            line = (
+                f"  {label}: {stats['count']}回  "
+                f"p50 {self._format_ms(stats['p50_ms'])} / p95 {self._format_ms(stats['p95_ms'])}"
+            )
+            if stats['ttft_p50_ms'] is not None:
+                line += (
+                    f"  最初の文字まで p50 {self._format_ms(stats['ttft_p50_ms'])}"
+                    f" / p95 {self._format_ms(stats['ttft_p95_ms'])}"
+                )
+            if stats['errors'] or stats['retries']:
+                line += f"  失敗 {stats['errors']}回・再試行 {stats['retries']}回"
+            lines.append(line)
+
+        lines.append("")
+        lines.append("【日別のトークン使用量（直近14日間）】")
+        daily = self.telemetry.daily_tokens(days=14)
+        if not daily:
+            lines.append("記録なし")
+        for day in daily:
+            lines.append(
+                f"  {day['day']}: 入力 {day['prompt_tokens']:,} / 出力 {day['output_tokens']:,}トークン"
+                f"（{day['calls']}回）"
+            )
+        return lines
+
+    def _client_lines(self) -> List[str]:
+        """この起動中のAPI呼び出しの統計"""
+        lines = ["【モデル別の呼び出し（この起動中）】"]
+        model_stats = self.client.get_model_stats()
+        if not model_stats:
+            lines.append("記録なし")
+        for model_name, stats in sorted(model_stats.items()):
+            line = (
+                f"  {model_name}: {stats['calls']}回  エラー率 {stats['error_rate'] * 100:.0f}%  "
+                f"平均 {self._format_ms(stats['avg_ms'])} / 最大 {self._format_ms(stats['max_ms'])}"
+            )
+            if stats['slo_violations']:
+                line += f"  遅延目標の超過 {stats['slo_violations']}回"
+            if stats['demoted']:
+                line += "（後回し中）"
+            lines.append(line)
+
+        lines.append("")
+        lines.extend(self._timing_lines())
+        lines.append("")
+        lines.extend(self._token_lines())
+        lines.append("")
+        lines.extend(self._json_lines())
+        return lines
+
+    def _token_lines(self) -> List[str]:
+        """入力トークン数の見積もりと実際の比較、入力の予算で短縮・省略した回数"""
+        lines = ["【入力トークン数の見積もり（直近の呼び出し）】"]
+        by_stage: Dict[str, Dict[str, Any]] = {}
+        for report in self.client.get_token_reports():
+            stats = by_stage.setdefault(report['stage'], {'count': 0, 'errors': [], 'trimmed': 0})
+            stats['count'] += 1
+            if report['actual']:
+                stats['errors'].append(abs(report['estimated'] - report['actual']) / report['actual'])
+            if report.get('abbreviated') or report.get('dropped'):
+                stats['trimmed'] += 1
+        if not by_stage:
+            lines.append("記録なし")
+        for stage, stats in sorted(by_stage.items()):
+            label = GENERATION_STAGE_LABELS.get(stage, stage)
+            line = f"  {label}: {stats['count']}回"
+            if stats['errors']:
+                line += f"  見積もりの誤差 平均 {sum(stats['errors']) / len(stats['errors']) * 100:.0f}%"
+            if stats['trimmed']:
+                line += f"  予算で短縮・省略 {stats['trimmed']}回"
+            lines.append(line)
+        return lines
+
+    def _timing_lines(self) -> List[str]:
+        """プロンプトの組み立て時間と通信時間（どちらが待ち時間の原因かを分けて表示）"""
+        lines = ["【組み立て時間と通信時間（この起動中）】"]
+        timing = self.client.get_timing_stats()
+        context = timing['context']
+        lines.append(
+            f"  コンテキストの組み立て: 平均 {context['assembly_ms_avg']:.1f}ms  "
+            f"キャッシュ ヒット {context['hits']}回 / ミス {context['misses']}回"
+        )
+        if not timing['network']:
+            lines.append("  通信: 記録なし")
+        for stage, stats in sorted(timing['network'].items()):
+            label = GENERATION_STAGE_LABELS.get(stage, stage)
+            lines.append(f"  通信（{label}）: {stats['count']}回  平均 {self._format_ms(stats['avg_ms'])}")
+        return lines
+
+    def _json_lines(self) -> List[str]:
+        """JSON形式の生成（キャラクター・世界観など）の解析結果"""
+        lines = ["【JSONの生成（この起動中）】"]
+        stats = self.client.get_json_stats()
+        if not stats['calls']:
+            lines.append("記録なし")
+            return lines
+        lines.append(
+            f"  {stats['calls']}回  スキーマ指定 {stats['structured']}回  "
+            f"スキーマなしで解析 {stats['tolerant_parsed']}回  修復の再リクエスト {stats['repair_requests']}回"
+        )
+        lines.append(f"  解析できず無駄になった呼び出し: {stats['wasted']}回（{stats['wasted_rate'] * 100:.1f}%）")
+        return lines
+
+    @staticmethod
+    def _format_ms(value: Optional[float]) -> str:
+        """ミリ秒を秒の表示に変換"""
+        if value is None:
+            return "-"
+        return f"{value / 1000:.1f}秒"
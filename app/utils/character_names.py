@@ -0,0 +1,40 @@
+"""
+キャラクター名ユーティリティ
+名前の正規化（重複判定用）を管理
+"""
+import re
+import unicodedata
+
+
+# 「山田太郎（やまだたろう）」「山田太郎(Yamada)」のふりがな・読み部分
+_READING_PATTERN = re.compile(r'[（(【\[].*?[）)】\]]')
+
+
+def strip_reading(name: str) -> str:
+    """
+    名前からふりがな・読みの括弧書きを除去
+
+    Args:
+        name: キャラクター名
+
+    Returns:
+        括弧書きを除いた名前
+    """
+    return _READING_PATTERN.sub('', name or '').strip()
+
+
+def normalize_name(name: str) -> str:
+    """
+    重複判定用に名前を正規化
+    （全角半角の統一、括弧書き・空白の除去、小文字化）
+
+    Args:
+        name: キャラクター名
+
+    Returns:
+        正規化された名前
+    """
+    normalized = unicodedata.normalize('NFKC', name or '')
+    normalized = strip_reading(normalized)
+    normalized = re.sub(r'[\s・･]', '', normalized)
+    return normalized.lower()
@@ -9,6 +9,18 @@ from typing import Optional, Dict, Any
 from cryptography.fernet import Fernet
 
 
+# 生成ステージ（操作）の一覧と表示名
+GENERATION_STAGES = ['character', 'world', 'plot', 'medium', 'long', 'summary']
+GENERATION_STAGE_LABELS = {
+    'character': 'キャラクター',
+    'world': '世界観',
+    'plot': 'プロット',
+    'medium': '中編',
+    'long': '長編',
+    'summary': '要約'
+}
+
+
 class Config:
     """アプリケーション設定管理クラス"""
 
@@ -59,6 +71,11 @@ class Config:
                 'max_tokens': 4000,
                 'top_p': 0.9
             },
+            'generation_profiles': self._default_generation_profiles(),
+            'context': self._default_context_settings(),
+            'reliability': self._default_reliability_settings(),
+            'backend': self._default_backend_settings(),
+            'budget': self._default_budget_settings(),
             'ui': {
                 'theme_mode': 'dark',
                 'color_theme': 'blue'
@@ -66,6 +83,106 @@ class Config:
             'last_project': None
         }
 
+    def _default_generation_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """
+        ステージ別生成プロファイルのデフォルト設定
+        （model, temperature, max_tokens, top_p はNoneなら共通のAPI設定を使用）
+        """
+        return {
+            # JSON出力は低めの温度で安定させる
+            'character': {'model': None, 'temperature': 0.5, 'max_tokens': 2000, 'top_p': None,
+                          'input_budget': 0},
+            'world': {'model': None, 'temperature': 0.5, 'max_tokens': 2500, 'top_p': None,
+                      'input_budget': 0},
+            # 500〜1000文字のプロットに長編用のトークン枠は不要
+            # input_budget: 入力トークン上限（0は無制限、プロットは設定を省略しないよう無制限）
+            'plot': {'model': None, 'temperature': None, 'max_tokens': 2000, 'top_p': None,
+                     'input_budget': 0},
+            'medium': {'model': None, 'temperature': None, 'max_tokens': 5000, 'top_p': None,
+                       'input_budget': 6000},
+            'long': {'model': None, 'temperature': None, 'max_tokens': 8000, 'top_p': None,
+                     'input_budget': 10000},
+            # 要約は短く事実に忠実に（軽量モデルで十分）
+            'summary': {'model': 'gemini-2.0-flash-lite', 'temperature': 0.3, 'max_tokens': 1000, 'top_p': None,
+                        'input_budget': 0}
+        }
+
+    def _default_context_settings(self) -> Dict[str, Any]:
+        """プロンプトコンテキストのデフォルト設定"""
+        return {
+            # キャラクター・世界観を要約に置き換えて送る
+            'condensed_context': False,
+            # 関連する過去の場面を検索して添付する（既定では無効、プロンプトが長くなるため）
+            'retrieval_enabled': False,
+            'retrieval_top_k': 3,
+            'retrieval_token_budget': 800,
+            # これまでのあらすじをプロット生成に添付する（要約の作成にAPIを使用）
+            'story_summary_enabled': False,
+            # 概要からのキャラクター自動選択で選ぶ最大人数
+            'auto_select_max_characters': 6
+        }
+
+    def _default_reliability_settings(self) -> Dict[str, Any]:
+        """API呼び出しの信頼性（遅延・障害対策）のデフォルト設定"""
+        return {
+            # 最初のトークンが遅いリクエストを重複して送る
+            'hedging_enabled': False,
+            'hedge_percentile': 95,
+            # 全リクエストに対する重複リクエストの割合の上限
+            'hedge_max_extra_ratio': 0.1,
+            'hedge_min_samples': 10,
+            # ステージのモデルが過負荷・遅延の時に順に試すモデル（既定は使わない）
+            'fallback_models': [],
+            # ステージ別の遅延目標（秒、超えたモデルはfallback_cooldownの間後回し）
+            # ストリーミングは最初のトークンまで、それ以外は出力1000文字あたりの時間と比べる
+            'latency_slo': {
+                'character': 20, 'world': 20, 'plot': 20,
+                'medium': 20, 'long': 20, 'summary': 10
+            },
+            'fallback_cooldown': 300,
+            # 一括処理の同時実行数の上限（実際の値は応答状況に応じて自動調整）
+            'max_concurrency': 8,
+            # 同時に実行するAPI呼び出しの上限（画面操作の呼び出しが優先）
+            'max_concurrent_requests': 6,
+            # ストリーミング中に同じ本文の繰り返しを検出したら打ち切り、繰り返しの前から続きを生成
+            # （直近repetition_window文字のうち、repetition_ngram文字のn-gramが既出の割合がrepetition_ratio以上）
+            'repetition_check': True,
+            'repetition_ngram': 20,
+            'repetition_window': 300,
+            'repetition_ratio': 0.8
+        }
+
+    def _default_backend_settings(self) -> Dict[str, Any]:
+        """生成の呼び出し先のデフォルト設定"""
+        return {
+            # gemini: Gemini API / fake: ネットワークを使わない偽のバックエンド（負荷試験・計測用）
+            'type': 'gemini',
+            # Gemini APIの接続先の上書き（ローカルの代替サーバーで負荷試験する場合など、空は本番）
+            'endpoint': '',
+            # 生成の記録・再生（mode: off / record / replay、speed: 再生速度の倍率、0は待たない）
+            'cassette': {'mode': 'off', 'path': '', 'speed': 1.0},
+            'fake': {
+                'first_token_latency': 0.5,
+                'chars_per_second': 400.0,
+                'output_chars': 800,
+                'error_rate': 0.0,
+                'throttle_rate': 0.0,
+                'seed': 0
+            }
+        }
+
+    def _default_budget_settings(self) -> Dict[str, Any]:
+        """トークン・料金の予算のデフォルト設定（0は無制限、プロジェクトの上限はプロジェクトごとに保存）"""
+        return {
+            'daily_token_limit': 0,
+            # 料金（米ドル）、単価は100万トークンあたり
+            'daily_cost_limit': 0.0,
+            'input_price_per_million': 0.10,
+            'output_price_per_million': 0.40,
+            # 使用率がこの割合を超えたらステータスバーで警告
+            'warn_ratios': [0.8, 0.95]
+        }
+
     def save_config(self):
         """設定ファイルの保存"""
         try:
@@ -136,6 +253,173 @@ class Config:
 
         return self.settings['api']
 
+    def set_generation_profile(
+        self,
+        stage: str,
+        model: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        top_p: Optional[float],
+        input_budget: int = 0,
+        save: bool = True
+    ):
+        """
+        ステージ別生成プロファイルの更新（Noneの項目は共通のAPI設定を使用）
+
+        Args:
+            stage: 生成ステージ（character, world, plot, medium, long）
+            model: 使用するモデル名
+            temperature: 温度パラメータ
+            max_tokens: 最大トークン数
+            top_p: Top-pサンプリング
+            input_budget: 入力トークン上限（0は無制限）
+            save: 設定ファイルに保存するかどうか
+        """
+        if stage not in GENERATION_STAGES:
+            raise Exception(f"不明な生成ステージです: {stage}")
+
+        profiles = self.get_generation_profiles()
+        profiles[stage] = {
+            'model': model,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'top_p': top_p,
+            'input_budget': input_budget
+        }
+        self.settings['generation_profiles'] = profiles
+        if save:
+            self.save_config()
+
+    def get_generation_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """ステージ別生成プロファイルの取得"""
+        defaults = self._default_generation_profiles()
+
+        # 旧バージョンの設定ファイルにはプロファイルが存在しない（モデルは共通設定を引き継ぐ）
+        if 'generation_profiles' not in self.settings:
+            self.settings['generation_profiles'] = defaults
+            self.save_config()
+            return self.settings['generation_profiles']
+
+        # 欠けているステージ・キーを補完
+        profiles = self.settings['generation_profiles']
+        for stage in GENERATION_STAGES:
+            profile = profiles.setdefault(stage, defaults[stage])
+            for key, value in defaults[stage].items():
+                profile.setdefault(key, value)
+
+        return profiles
+
+    def get_generation_profile(self, stage: str) -> Dict[str, Any]:
+        """
+        ステージ別生成プロファイルの取得
+
+        Args:
+            stage: 生成ステージ
+
+        Returns:
+            プロファイル（model, temperature, max_tokens, top_p, input_budget）
+        """
+        return self.get_generation_profiles().get(stage, self._default_generation_profiles()['plot'])
+
+    def get_context_settings(self) -> Dict[str, Any]:
+        """プロンプトコンテキスト設定の取得"""
+        if 'context' not in self.settings:
+            self.settings['context'] = self._default_context_settings()
+            self.save_config()
+
+        # 欠けているキーを補完
+        context = self.settings['context']
+        for key, value in self._default_context_settings().items():
+            context.setdefault(key, value)
+
+        return context
+
+    def set_context_settings(self, **settings):
+        """
+        プロンプトコンテキスト設定の更新
+
+        Args:
+            settings: 更新する設定（condensed_context など）
+        """
+        context = self.get_context_settings()
+        context.update(settings)
+        self.save_config()
+
+    def get_reliability_settings(self) -> Dict[str, Any]:
+        """API呼び出しの信頼性設定の取得"""
+        if 'reliability' not in self.settings:
+            self.settings['reliability'] = self._default_reliability_settings()
+            self.save_config()
+
+        # 欠けているキーを補完
+        reliability = self.settings['reliability']
+        for key, value in self._default_reliability_settings().items():
+            reliability.setdefault(key, value)
+
+        return reliability
+
+    def set_reliability_settings(self, **settings):
+        """
+        API呼び出しの信頼性設定の更新
+
+        Args:
+            settings: 更新する設定（hedging_enabled など）
+        """
+        reliability = self.get_reliability_settings()
+        reliability.update(settings)
+        self.save_config()
+
+    def get_backend_settings(self) -> Dict[str, Any]:
+        """生成の呼び出し先の設定の取得"""
+        if 'backend' not in self.settings:
+            self.settings['backend'] = self._default_backend_settings()
+            self.save_config()
+
+        # 欠けているキーを補完
+        backend = self.settings['backend']
+        for key, value in self._default_backend_settings().items():
+            backend.setdefault(key, value)
+        for section in ('cassette', 'fake'):
+            for key, value in self._default_backend_settings()[section].items():
+                backend[section].setdefault(key, value)
+
+        return backend
+
+    def set_backend_settings(self, **settings):
+        """
+        生成の呼び出し先の設定の更新
+
+        Args:
+            settings: 更新する設定（type, endpoint, cassette, fake）
+        """
+        backend = self.get_backend_settings()
+        backend.update(settings)
+        self.save_config()
+
+    def get_budget_settings(self) -> Dict[str, Any]:
+        """トークン・料金の予算の取得"""
+        if 'budget' not in self.settings:
+            self.settings['budget'] = self._default_budget_settings()
+            self.save_config()
+
+        # 欠けているキーを補完
+        budget = self.settings['budget']
+        for key, value in self._default_budget_settings().items():
+            budget.setdefault(key, value)
+
+        return budget
+
+    def set_budget_settings(self, **settings):
+        """
+        トークン・料金の予算の更新
+
+        Args:
+            settings: 更新する設定（daily_token_limit など）
+        """
+        budget = self.get_budget_settings()
+        budget.update(settings)
+        self.save_config()
+
     def set_ui_theme(self, mode: str, color: str):
         """UIテーマの設定"""
         # 'ui'キーが存在しない場合、デフォルト値で初期化
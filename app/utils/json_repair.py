@@ -0,0 +1,204 @@
+"""
+JSON抽出・修復ユーティリティ
+AIの出力から余計な文章を含むJSONを寛容に読み取る
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 全角・装飾引用符の置換表
+_QUOTE_TABLE = str.maketrans({
+    '“': '"',
+    '”': '"',
+    '„': '"',
+    '＂': '"',
+})
+
+
+def _find_object_span(text: str, pos: int = 0) -> Optional[Tuple[str, int]]:
+    """
+    pos以降で最初に現れる釣り合いの取れた {...} を取り出す
+
+    Args:
+        text: 対象テキスト
+        pos: 探索開始位置
+
+    Returns:
+        (JSONオブジェクト部分, 終端の次の位置)、見つからなければNone
+    """
+    start = text.find('{', pos)
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1], i + 1
+        # 閉じていない場合は末尾までを候補とする（途中で切れた出力）
+        if depth > 0:
+            return text[start:] + ('"' if in_string else '') + '}' * depth, len(text)
+        start = text.find('{', start + 1)
+    return None
+
+
+def _repair(candidate: str) -> str:
+    """よくある崩れ（末尾カンマ、装飾引用符、改行）を修正"""
+    fixed = candidate.translate(_QUOTE_TABLE)
+    # 末尾カンマ
+    fixed = re.sub(r',\s*([}\]])', r'\1', fixed)
+    # 文字列中の生の改行をエスケープ
+    result = []
+    in_string = False
+    escaped = False
+    for ch in fixed:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch == '\n':
+                result.append('\\n')
+                continue
+            elif ch == '\r':
+                continue
+        elif ch == '"':
+            in_string = True
+        result.append(ch)
+    return ''.join(result)
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    ```json などのコードフェンスを除去
+
+    Args:
+        text: 対象テキスト
+
+    Returns:
+        フェンスを除いたテキスト
+    """
+    text = text.strip()
+    match = re.search(r'```(?:json|JSON)?\s*(.*?)```', text, re.DOTALL)
+    if match:
+        return match.group(1).strip()
+    return text
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """
+    テキストからJSONオブジェクトを寛容に抽出
+
+    Args:
+        text: AIの出力テキスト
+
+    Returns:
+        抽出したオブジェクト
+
+    Raises:
+        ValueError: JSONオブジェクトが見つからない場合
+    """
+    body = strip_code_fence(text)
+
+    # そのまま読めればそれが一番安い
+    try:
+        data = json.loads(body)
+        if isinstance(data, dict):
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    span = _find_object_span(body)
+    if span is None:
+        raise ValueError("JSONオブジェクトが見つかりません")
+    candidate = span[0]
+
+    for attempt in (candidate, _repair(candidate)):
+        try:
+            data = json.loads(attempt)
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            continue
+
+    raise ValueError("JSONの解析に失敗しました")
+
+
+def extract_json_array(text: str) -> List[Any]:
+    """
+    テキストからJSON配列を寛容に抽出
+    （配列が壊れている場合は含まれるオブジェクトを個別に拾う）
+
+    Args:
+        text: AIの出力テキスト
+
+    Returns:
+        抽出した要素のリスト
+
+    Raises:
+        ValueError: 要素が1つも見つからない場合
+    """
+    body = strip_code_fence(text)
+
+    try:
+        data = json.loads(body)
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            # {"characters": [...]} のような包み方にも対応
+            for value in data.values():
+                if isinstance(value, list):
+                    return value
+            return [data]
+    except json.JSONDecodeError:
+        pass
+
+    items = []
+    pos = 0
+    while True:
+        span = _find_object_span(body, pos)
+        if span is None:
+            break
+        candidate, pos = span
+        try:
+            items.append(json.loads(_repair(candidate)))
+        except json.JSONDecodeError:
+            pass
+
+    if not items:
+        raise ValueError("JSON配列の解析に失敗しました")
+    return items
+
+
+def missing_fields(data: Dict[str, Any], fields: List[str]) -> List[str]:
+    """
+    欠けている（または空の）項目を列挙
+
+    Args:
+        data: 対象データ
+        fields: 必須項目
+
+    Returns:
+        欠けている項目名のリスト
+    """
+    return [
+        field for field in fields
+        if not isinstance(data.get(field), str) or not data.get(field).strip()
+    ]
@@ -0,0 +1,167 @@
+"""
+キャラクター名の照合
+シーンのタイトル・概要に登場するキャラクターを、名前と別名の同時照合（Aho–Corasick法）で検出する
+"""
+import re
+import unicodedata
+from collections import deque
+from typing import Any, Dict, List, Set
+
+from app.utils.character_names import strip_reading
+
+
+# 名前・別名の区切り（別名欄はカンマ・読点・改行区切り）
+_ALIAS_SEPARATOR = re.compile(r'[,、，\n]')
+_NAME_PART_SEPARATOR = re.compile(r'[\s・･]+')
+
+
+def _normalize_text(text: str) -> str:
+    """照合用にテキストを正規化（全角半角の統一、空白・中黒の除去、小文字化）"""
+    return _NAME_PART_SEPARATOR.sub('', unicodedata.normalize('NFKC', text or '')).lower()
+
+
+def character_patterns(char: Dict[str, Any]) -> Set[str]:
+    """
+    キャラクターの照合パターンを列挙
+    （名前、ふりがなを除いた名前、姓・名、別名）
+
+    Args:
+        char: キャラクター情報
+
+    Returns:
+        正規化済みのパターン
+    """
+    name = char.get('name', '') or ''
+    candidates = [name, strip_reading(name)]
+
+    # 「山田 太郎」「ジョン・スミス」は姓・名でも照合する
+    candidates.extend(_NAME_PART_SEPARATOR.split(strip_reading(name)))
+
+    aliases = char.get('aliases', '') or ''
+    if isinstance(aliases, list):
+        candidates.extend(aliases)
+    else:
+        candidates.extend(_ALIAS_SEPARATOR.split(aliases))
+
+    patterns = set()
+    for candidate in candidates:
+        pattern = _normalize_text(candidate)
+        # 英数字1文字は誤検出が多いため除外
+        if not pattern or (len(pattern) == 1 and pattern.isascii()):
+            continue
+        patterns.add(pattern)
+    return patterns
+
+
+class NameMatcher:
+    """キャラクター名・別名の同時照合オートマトン"""
+
+    def __init__(self, characters: List[Dict[str, Any]]):
+        """
+        初期化（オートマトンの構築）
+
+        Args:
+            characters: キャラクターのリスト
+        """
+        # 状態ごとの遷移、失敗遷移、出力（キャラクターIDとパターン長）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[tuple]] = [[]]
+        self._characters: Dict[str, Dict[str, Any]] = {}
+        self.pattern_count = 0
+
+        for char in characters:
+            char_id = char.get('id')
+            if not char_id:
+                continue
+            self._characters[char_id] = char
+            for pattern in character_patterns(char):
+                self._add_pattern(pattern, char_id)
+                self.pattern_count += 1
+
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern: str, char_id: str):
+        """パターンをトライに追加"""
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((char_id, len(pattern)))
+
+    def _build_failure_links(self):
+        """幅優先で失敗遷移を設定し、出力を失敗先から引き継ぐ"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Dict[str, Dict[str, int]]:
+        """
+        テキスト中のキャラクターの言及を検出
+
+        Args:
+            text: 対象テキスト
+
+        Returns:
+            キャラクターID -> count（言及回数）, first（最初の出現位置）
+        """
+        spans: List[tuple] = []
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+
+        for position, ch in enumerate(_normalize_text(text)):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for char_id, length in output[state]:
+                spans.append((position - length + 1, position, char_id))
+
+        # より長い一致に含まれる一致（「山田花子」の中の「花子」など）は数えない
+        spans.sort(key=lambda span: (span[0], -span[1]))
+        mentions: Dict[str, Dict[str, int]] = {}
+        cover_start, cover_end = 0, -1
+        for start, end, char_id in spans:
+            if end <= cover_end and end - start < cover_end - cover_start:
+                continue
+            if end > cover_end:
+                cover_start, cover_end = start, end
+            mention = mentions.get(char_id)
+            if mention is None:
+                mentions[char_id] = {'count': 1, 'first': start}
+            else:
+                mention['count'] += 1
+
+        return mentions
+
+    def select(self, text: str, max_characters: int = 0) -> List[Dict[str, Any]]:
+        """
+        テキストで言及されたキャラクターを選ぶ（言及回数の多い順、同数なら先に出た順）
+
+        Args:
+            text: 対象テキスト（シーンのタイトル・概要など）
+            max_characters: 最大人数（0以下は無制限）
+
+        Returns:
+            キャラクターのリスト
+        """
+        mentions = self.find(text)
+        ranked = sorted(mentions, key=lambda char_id: (-mentions[char_id]['count'], mentions[char_id]['first']))
+        if max_characters > 0:
+            ranked = ranked[:max_characters]
+        return [self._characters[char_id] for char_id in ranked]
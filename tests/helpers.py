@@ -0,0 +1,54 @@
+"""
+テスト用のバックエンド
+FakeBackendを元に、ストリーミングの途中で失敗する・最初のトークンが届かないなどの状況を再現する
+"""
+import threading
+from typing import List, Optional
+
+from app.core.backends import FakeBackend, FakeBackendError, FakeStream
+from app.core.gemini_client import GeminiClient
+
+
+class ScriptedStream(FakeStream):
+    """指定したチャンクを返し、必要なら途中で失敗するストリーム"""
+
+    def __init__(self, chunks: List[str], fail_after: Optional[int] = None, first_token_latency: float = 0.0):
+        super().__init__([''.join(chunks)], 10, 1, 0.0, first_token_latency)
+        self.chunks = chunks
+        self.fail_after = fail_after
+
+    def __iter__(self):
+        for index, text in enumerate(self.chunks):
+            if self.fail_after is not None and index >= self.fail_after:
+                raise FakeBackendError("503 Service unavailable (scripted stream)")
+            if self._closed.wait(self.first_token_latency if index == 0 else 0):
+                raise FakeBackendError("Stream closed (scripted stream)")
+            yield type('Chunk', (), {'text': text})()
+
+
+class ScriptedBackend(FakeBackend):
+    """呼び出しごとに用意したストリームを返すバックエンド（受け取ったプロンプトを記録）"""
+
+    def __init__(self, streams: List[ScriptedStream]):
+        super().__init__(first_token_latency=0, chars_per_second=0)
+        self.streams = list(streams)
+        self.prompts: List[str] = []
+        self._streams_lock = threading.Lock()
+
+    def stream(self, model, prompt: str):
+        with self._streams_lock:
+            self.prompts.append(prompt)
+            return self.streams.pop(0) if len(self.streams) > 1 else self.streams[0]
+
+
+def make_client(backend: Optional[FakeBackend] = None) -> GeminiClient:
+    """
+    偽のバックエンドを使うクライアント
+
+    Args:
+        backend: バックエンド（Noneの場合は待ち時間なしのFakeBackend）
+
+    Returns:
+        クライアント
+    """
+    return GeminiClient('test-key', backend=backend or FakeBackend(first_token_latency=0, chars_per_second=0))
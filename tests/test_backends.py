@@ -0,0 +1,40 @@
+from app.core.backends import FakeBackend, create_backend
+from app.core.gemini_client import GeminiClient
+
+
+class UnreachableBackend(FakeBackend):
+    """指定したモデルに接続できないバックエンド"""
+
+    def __init__(self, unreachable):
+        super().__init__(first_token_latency=0, chars_per_second=0)
+        self.unreachable = set(unreachable)
+
+    def ping(self, model_name: str):
+        if model_name in self.unreachable:
+            raise Exception(f"404 model not found: {model_name}")
+
+    def count_tokens(self, model, text: str) -> int:
+        if model.model_name in self.unreachable:
+            raise Exception("connection refused")
+        return super().count_tokens(model, text)
+
+
+def test_create_backend_uses_settings():
+    backend = create_backend({'type': 'fake', 'fake': {'chars_per_second': 0, 'seed': 3}})
+    assert isinstance(backend, FakeBackend)
+    assert backend.seed == 3
+
+
+def test_unreachable_models_checks_each_stage_model():
+    profiles = {'long': {'model': 'long-model'}}
+    client = GeminiClient('test-key', model='base', generation_profiles=profiles, backend=UnreachableBackend(['long-model']))
+
+    assert client.stage_model_names() == ['base', 'long-model']
+    assert client.unreachable_models() == ['long-model']
+    assert not client.test_connection()
+    assert client.test_connection(['base'])
+
+
+def test_warm_up_reports_elapsed_time_or_none():
+    assert GeminiClient('test-key', model='base', backend=UnreachableBackend([])).warm_up() >= 0
+    assert GeminiClient('test-key', model='base', backend=UnreachableBackend(['base'])).warm_up() is None
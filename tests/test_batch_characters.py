@@ -0,0 +1,67 @@
+"""
+キャラクター一括生成のテスト
+"""
+import json
+
+from app.core.project_manager import ProjectManager
+from app.utils.character_names import normalize_name
+from app.core.backends import FakeBackend
+from tests.helpers import make_client
+
+
+class FixedJSONBackend(FakeBackend):
+    """常に同じテキストを返すバックエンド"""
+
+    def __init__(self, text):
+        super().__init__(first_token_latency=0, chars_per_second=0)
+        self.text = text
+
+    def _respond(self, model, prompt):
+        return [self.text]
+
+
+def _character(name):
+    return {
+        'name': name, 'personality': '明るい', 'appearance': '', 'background': '',
+        'skills': '', 'speech': '', 'relationships': '', 'goals': ''
+    }
+
+
+def test_normalize_name_ignores_reading_width_and_spaces():
+    assert normalize_name('山田 太郎（やまだたろう）') == normalize_name('山田太郎')
+    assert normalize_name('ＡＬＩＣＥ・Ｍ') == normalize_name('alice m')
+
+
+def test_generated_characters_are_deduplicated_by_name():
+    text = json.dumps([
+        _character('山田太郎（やまだたろう）'),
+        _character('山田 太郎'),
+        _character('佐藤花子'),
+        _character('鈴木一郎')
+    ], ensure_ascii=False)
+    client = make_client(FixedJSONBackend(text))
+
+    characters = client.generate_characters(concepts=['a', 'b', 'c', 'd'], existing_names=['佐藤 花子'])
+
+    assert [character['name'] for character in characters] == ['山田太郎（やまだたろう）', '鈴木一郎']
+
+
+def test_parallel_batches_return_the_requested_count():
+    client = make_client()
+
+    characters = client.generate_characters(ensemble_concept='学園もの', count=8, batch_size=3)
+
+    assert len(characters) == 8
+    assert len({normalize_name(character['name']) for character in characters}) == 8
+
+
+def test_add_characters_skips_existing_names(tmp_path):
+    manager = ProjectManager()
+    manager.create_new_project('作品', str(tmp_path / 'project.json'))
+    manager.add_character(_character('山田太郎'))
+
+    added = manager.add_characters([_character('山田 太郎'), _character('佐藤花子'), _character('佐藤花子')])
+
+    assert [character['name'] for character in added] == ['佐藤花子']
+    assert all(character.get('id') for character in added)
+    assert len(ProjectManager().load_project(str(tmp_path / 'project.json'))['characters']) == 2
@@ -0,0 +1,60 @@
+"""
+複数候補の生成のテスト
+"""
+import threading
+
+from app.core.backends import FakeBackend
+from tests.helpers import make_client
+
+
+class CountingBackend(FakeBackend):
+    """呼び出しの設定を記録し、必要ならcandidate_countを無視するバックエンド"""
+
+    def __init__(self, ignore_candidate_count=False):
+        super().__init__(first_token_latency=0, chars_per_second=0, output_chars=200)
+        self.ignore_candidate_count = ignore_candidate_count
+        self.configs = []
+        self._configs_lock = threading.Lock()
+
+    def _respond(self, model, prompt):
+        with self._configs_lock:
+            self.configs.append(dict(model.generation_config or {}))
+        texts = super()._respond(model, prompt)
+        return texts[:1] if self.ignore_candidate_count else texts
+
+
+def _plot(client, count):
+    return client.generate_plot('港町', '少女が灯台守と出会う', [], {}, {}, candidate_count=count)
+
+
+def test_candidates_come_from_one_request_when_supported():
+    backend = CountingBackend()
+    client = make_client(backend)
+
+    candidates = _plot(client, 3)
+
+    assert len(candidates) == 3
+    assert len(set(candidates)) == 3
+    assert len(backend.configs) == 1
+    assert backend.configs[0]['candidate_count'] == 3
+
+
+def test_falls_back_to_parallel_requests_with_varied_temperature():
+    backend = CountingBackend(ignore_candidate_count=True)
+    client = make_client(backend)
+
+    candidates = _plot(client, 3)
+
+    assert len(candidates) == 3
+    assert len(set(candidates)) == 3
+    assert client._get_stage_model_name('plot') in client.candidate_count_unsupported
+    assert len({config.get('temperature') for config in backend.configs[1:]}) == 2
+
+    # 未対応と分かったモデルには、以後candidate_countを送らない
+    backend.configs.clear()
+    assert len(_plot(client, 2)) == 2
+    assert all('candidate_count' not in config for config in backend.configs)
+
+
+def test_single_candidate_returns_text():
+    assert isinstance(_plot(make_client(), 1), str)
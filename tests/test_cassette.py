@@ -0,0 +1,58 @@
+"""
+カセットの記録・再生のテスト
+"""
+import pytest
+
+from app.core.backends import FakeBackend, FakeBackendError
+from app.core.cassette import CassetteMissError, RecordingBackend, ReplayBackend
+from tests.helpers import make_client
+
+
+def _fake(**kwargs):
+    return FakeBackend(first_token_latency=0, chars_per_second=0, output_chars=300, **kwargs)
+
+
+def test_replay_returns_recorded_generations(tmp_path):
+    path = tmp_path / 'session.jsonl'
+    recorder = make_client(RecordingBackend(_fake(), path))
+    plot = recorder.generate_plot('港町', '少女が灯台守と出会う', [], {}, {})
+    model = recorder.backend.create_model('gemini-2.0-flash', None)
+    chunks = [chunk.text for chunk in recorder.backend.stream(model, '続きを書いてください')]
+
+    replay = ReplayBackend(path, speed=0)
+    player = make_client(replay)
+    assert player.generate_plot('港町', '少女が灯台守と出会う', [], {}, {}) == plot
+    replayed_model = replay.create_model('gemini-2.0-flash', None)
+    assert [chunk.text for chunk in replay.stream(replayed_model, '続きを書いてください')] == chunks
+    assert replay.stats['misses'] == 0
+
+
+def test_unrecorded_request_is_a_miss(tmp_path):
+    path = tmp_path / 'session.jsonl'
+    recorder = RecordingBackend(_fake(), path)
+    recorder.generate(recorder.create_model('m', None), '記録したプロンプト')
+
+    replay = ReplayBackend(path, speed=0)
+    with pytest.raises(CassetteMissError):
+        replay.generate(replay.create_model('m', None), '別のプロンプト')
+    with pytest.raises(CassetteMissError):
+        replay.generate(replay.create_model('m', {'temperature': 0.1}), '記録したプロンプト')
+    assert replay.stats['misses'] == 2
+
+
+def test_recorded_errors_replay_in_order_with_the_same_class_name(tmp_path):
+    path = tmp_path / 'session.jsonl'
+    recorder = RecordingBackend(_fake(error_rate=1.0), path)
+    model = recorder.create_model('m', None)
+    with pytest.raises(FakeBackendError):
+        recorder.generate(model, 'プロンプト')
+    recorder.inner.error_rate = 0.0
+    text = recorder.generate(model, 'プロンプト').text
+
+    replay = ReplayBackend(path, speed=0)
+    replayed_model = replay.create_model('m', None)
+    with pytest.raises(Exception) as error:
+        replay.generate(replayed_model, 'プロンプト')
+    assert type(error.value).__name__ == 'FakeBackendError'
+    assert '503' in str(error.value)
+    assert replay.generate(replayed_model, 'プロンプト').text == text
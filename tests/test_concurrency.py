@@ -0,0 +1,53 @@
+import threading
+import time
+
+from app.core.concurrency import AdaptiveLimiter
+from tests.helpers import make_client
+
+
+def complete(limiter, seconds, stage, count=1):
+    for _ in range(count):
+        limiter.acquire()
+        limiter.release(seconds, stage=stage)
+
+
+def test_latency_spikes_are_compared_within_stage():
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=8)
+    complete(limiter, 1.0, 'summary', 5)
+    complete(limiter, 30.0, 'long', 5)
+
+    # 長編の遅い完了は要約の平均遅延と比べない
+    complete(limiter, 30.0, 'long')
+    assert limiter.latency_spikes == 0
+
+    complete(limiter, 5.0, 'summary')
+    assert limiter.latency_spikes == 1
+
+
+def test_map_runs_up_to_limit_concurrently():
+    limiter = AdaptiveLimiter(initial_limit=3, max_limit=3)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def work(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return item * 2
+
+    assert limiter.map(work, range(6), stage='summary') == [0, 2, 4, 6, 8, 10]
+    assert peak[0] == 3
+    assert limiter.in_flight == 0
+
+
+def test_character_batches_run_in_parallel_without_name_clashes():
+    client = make_client()
+    characters = client.generate_characters(ensemble_concept='学園もの', count=8, batch_size=3)
+
+    # 同じ内容の組でも組ごとに異なる人物を生成
+    assert len(characters) == 8
+    assert client.limiter.successes == 3
@@ -0,0 +1,55 @@
+"""
+キャラクター・世界観の要約コンテキストのテスト
+"""
+from app.core.condensed_context import ensure_summaries, get_fresh_summary
+from app.core.project_manager import ProjectManager
+
+
+def _project(tmp_path):
+    manager = ProjectManager()
+    manager.create_new_project('作品', str(tmp_path / 'project.json'))
+    manager.add_characters([
+        {'name': '山田太郎', 'personality': '明るい'},
+        {'name': '佐藤花子', 'personality': '慎重'}
+    ])
+    manager.set_world_settings({'genre': 'ファンタジー', 'setting': '浮遊する島々'})
+    return manager
+
+
+def _summarize(calls):
+    def summarize(kind, data):
+        calls.append((kind, data.get('name', data.get('genre'))))
+        return f"{kind}の要約"
+    return summarize
+
+
+def test_only_missing_or_stale_summaries_are_created(tmp_path):
+    manager = _project(tmp_path)
+    calls = []
+
+    assert ensure_summaries(manager, manager.get_characters(), _summarize(calls)) == 3
+    assert all(get_fresh_summary(char) == 'characterの要約' for char in manager.get_characters())
+    assert get_fresh_summary(manager.get_world_settings()) == 'worldの要約'
+
+    calls.clear()
+    assert ensure_summaries(manager, manager.get_characters(), _summarize(calls)) == 0
+    assert calls == []
+
+    first = manager.get_characters()[0]
+    manager.update_character(first['id'], dict(first, personality='短気'))
+    assert get_fresh_summary(manager.get_character_by_id(first['id'])) is None
+    assert ensure_summaries(manager, manager.get_characters(), _summarize(calls), include_world=False) == 1
+    assert calls == [('character', '山田太郎')]
+
+
+def test_unchanged_save_keeps_the_summary(tmp_path):
+    manager = _project(tmp_path)
+    ensure_summaries(manager, manager.get_characters(), _summarize([]))
+
+    world = {key: value for key, value in manager.get_world_settings().items() if key != 'condensed'}
+    manager.set_world_settings(world)
+    second = manager.get_characters()[1]
+    manager.update_character(second['id'], {'name': '佐藤花子', 'personality': '慎重'})
+
+    assert get_fresh_summary(manager.get_world_settings()) == 'worldの要約'
+    assert get_fresh_summary(manager.get_character_by_id(second['id'])) == 'characterの要約'
@@ -0,0 +1,57 @@
+"""
+ConnectivityMonitorのテスト
+"""
+import time
+
+import pytest
+
+from app.core.backends import FakeBackend
+from app.core.connectivity import ConnectivityMonitor, OfflineError
+from tests.helpers import make_client
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_only_connectivity_errors_go_offline():
+    monitor = ConnectivityMonitor(min_interval=60)
+    changes = []
+    monitor.add_listener(changes.append)
+
+    assert not monitor.report_failure(Exception("503 Service unavailable"))
+    assert monitor.online
+    assert monitor.report_failure(ConnectionError("Connection refused"))
+    assert not monitor.online
+    monitor.report_success()
+    assert changes == [False, True]
+
+
+def test_offline_calls_are_refused_until_the_probe_succeeds():
+    reachable = [False]
+    monitor = ConnectivityMonitor(min_interval=0.02, max_interval=0.05, recheck_interval=60)
+    monitor.set_probe(lambda: reachable[0])
+
+    monitor.report_failure(ConnectionError("Connection refused"))
+    with pytest.raises(OfflineError):
+        monitor.check()
+
+    reachable[0] = True
+    assert _wait_until(lambda: monitor.online)
+    monitor.check()
+
+
+def test_client_does_not_send_while_offline():
+    backend = FakeBackend(first_token_latency=0, chars_per_second=0)
+    client = make_client(backend)
+    client.connectivity = ConnectivityMonitor(min_interval=60, recheck_interval=60)
+    client.connectivity.set_probe(lambda: False)
+    client.connectivity.report_failure(ConnectionError("Connection refused"))
+
+    with pytest.raises(Exception) as error:
+        client.generate_plot('港町', '少女が灯台守と出会う', [], {}, {})
+    assert 'オフライン' in str(error.value)
+    assert backend._attempts == {}
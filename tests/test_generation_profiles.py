@@ -0,0 +1,33 @@
+"""
+ステージ別生成プロファイルのテスト
+"""
+from app.utils.config import Config
+from tests.helpers import make_client
+
+
+def test_unset_profile_fields_follow_global_settings():
+    client = make_client()
+    client.update_generation_config(0.9, 4000, 0.95)
+    client.set_generation_profiles({
+        'plot': {'model': None, 'temperature': None, 'max_tokens': 2000, 'top_p': None},
+        'summary': {'model': 'lite-model', 'temperature': 0.3, 'max_tokens': None, 'top_p': None}
+    })
+
+    assert client._get_stage_model_name('plot') == client.model_name
+    assert client._get_stage_generation_config('plot') == {
+        'temperature': 0.9, 'max_output_tokens': 2000, 'top_p': 0.95
+    }
+    assert client._get_stage_model_name('summary') == 'lite-model'
+    assert client._get_stage_generation_config('summary') == {
+        'temperature': 0.3, 'max_output_tokens': 4000, 'top_p': 0.95
+    }
+    # プロファイルのないステージは共通の設定のモデルをそのまま使う
+    assert client._get_model('world') is client.model
+
+
+def test_default_profiles_do_not_pin_story_models(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    profiles = Config().get_generation_profiles()
+
+    for stage in ('character', 'world', 'plot', 'medium', 'long'):
+        assert profiles[stage]['model'] is None
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from app.core.backends import FakeBackend
+from app.core.hedging import RequestHedger
+from app.core.usage_budget import UsageBudget
+
+from tests.helpers import ScriptedBackend, ScriptedStream, make_client
+
+
+def make_hedger() -> RequestHedger:
+    hedger = RequestHedger(enabled=True, max_extra_ratio=1.0, min_samples=1, min_delay=0.05)
+    hedger.latency.record('plot', 0.01)
+    return hedger
+
+
+def test_stuck_attempt_is_cancelled_before_first_token():
+    hedger = make_hedger()
+    closed = threading.Event()
+    discarded = []
+
+    def call(attempt):
+        if attempt.index == 0:
+            # 最初のトークンが届かないまま止まっている呼び出し（中止でストリームを閉じる）
+            attempt.on_cancel(closed.set)
+            closed.wait(5)
+            return None
+        attempt.first_token()
+        return 'duplicate'
+
+    started = time.monotonic()
+    result = hedger.run('plot', call, discard=lambda attempt, response: discarded.append(attempt.index))
+    assert result == 'duplicate'
+    assert time.monotonic() - started < 1
+    assert closed.wait(1)
+    stats = hedger.get_stats()
+    assert stats['hedged'] == 1 and stats['hedge_wins'] == 1
+
+    deadline = time.monotonic() + 1
+    while not discarded and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert discarded == [0]
+
+
+def test_no_duplicate_without_free_slot():
+    hedger = make_hedger()
+    calls = []
+
+    def call(attempt):
+        calls.append(attempt.index)
+        time.sleep(0.2)
+        return 'original'
+
+    assert hedger.run('plot', call, acquire_extra=lambda: None) == 'original'
+    assert calls == [0]
+    assert hedger.get_stats()['capacity_denied'] == 1
+
+
+def test_claim_cancels_other_attempt():
+    hedger = make_hedger()
+    cancelled = []
+
+    def call(attempt):
+        if attempt.index == 0:
+            time.sleep(0.1)
+            attempt.first_token()
+            if not attempt.claim():
+                cancelled.append(0)
+                return None
+            return 'original'
+        attempt.first_token()
+        assert attempt.claim()
+        time.sleep(0.3)
+        return 'duplicate'
+
+    assert hedger.run('plot', call) == 'duplicate'
+    assert cancelled == [0]
+
+
+def test_client_records_usage_of_cancelled_attempt():
+    backend = ScriptedBackend([
+        ScriptedStream(["届かない本文。"], first_token_latency=30),
+        ScriptedStream(["重複リクエストの本文。"])
+    ])
+    client = make_client(backend)
+    client.hedger = make_hedger()
+    client.usage_budget = UsageBudget({})
+    rows = []
+    client.telemetry = type('Telemetry', (), {'record': lambda self, **fields: rows.append(fields)})()
+
+    started = time.monotonic()
+    response = client._generate('plot', "プロットを作って")
+    assert response.text == "重複リクエストの本文。"
+    assert time.monotonic() - started < 5
+
+    deadline = time.monotonic() + 2
+    while len(rows) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(row.get('status') or 'ok' for row in rows) == ['cancelled', 'ok']
+    # 中止した呼び出しのプロンプトも、採用した呼び出しと同じトークン数で予算に数える
+    used = client.usage_budget.remaining()['daily']['used_tokens']
+    assert used == 10 + 10 + FakeBackend.estimate_tokens("重複リクエストの本文。")
+    # 重複リクエストの実行枠は返却済み
+    assert client.scheduler.get_stats()['running'] == {'interactive': 0, 'background': 0}
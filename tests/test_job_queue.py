@@ -0,0 +1,101 @@
+import threading
+import time
+
+from app.core.concurrency import AdaptiveLimiter
+from app.core.job_queue import JobQueue, JobRunner, DONE, FAILED, PENDING, RUNNING
+
+
+def test_attempts_are_counted_until_failed(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.sqlite3', max_attempts=2)
+    job_id = queue.enqueue('expand_scene', {'scene': 1}, project_path='p', target_id='s1')
+
+    job = queue.claim()
+    assert job['id'] == job_id and job['attempts'] == 1 and job['status'] == RUNNING
+    queue.fail(job_id, 'error 1')
+    assert queue.get_job(job_id)['status'] == PENDING
+
+    assert queue.claim()['attempts'] == 2
+    queue.fail(job_id, 'error 2')
+    job = queue.get_job(job_id)
+    assert job['status'] == FAILED and job['error'] == 'error 2'
+    assert queue.claim() is None
+
+
+def test_release_does_not_count_attempt(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.sqlite3')
+    job_id = queue.enqueue('expand_scene', {})
+    queue.claim()
+    queue.release(job_id)
+    job = queue.get_job(job_id)
+    assert job['status'] == PENDING and job['attempts'] == 0
+
+
+def test_requeue_running_on_restart(tmp_path):
+    path = tmp_path / 'jobs.sqlite3'
+    queue = JobQueue(path)
+    first = queue.enqueue('expand_scene', {'n': 1})
+    second = queue.enqueue('expand_scene', {'n': 2})
+    queue.claim()
+    assert queue.get_job(first)['status'] == RUNNING
+
+    # 実行中のまま終了したジョブは次の起動で待機に戻る（試行回数は保持）
+    restarted = JobQueue(path)
+    job = restarted.get_job(first)
+    assert job['status'] == PENDING and job['attempts'] == 1
+    assert restarted.get_job(second)['status'] == PENDING
+    assert restarted.requeue_running() == 0
+
+
+def test_complete_and_apply_results(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.sqlite3')
+    job_id = queue.enqueue('expand_scene', {}, project_path='p', target_id='s1')
+    queue.claim()
+    queue.complete(job_id, {'content': '本文'})
+
+    assert queue.get_job(job_id)['status'] == DONE
+    assert [job['result'] for job in queue.unapplied_results('p')] == [{'content': '本文'}]
+    queue.mark_applied(job_id)
+    assert queue.unapplied_results('p') == []
+
+
+def test_runner_sizes_workers_from_limiter(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.sqlite3')
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=4)
+    for n in range(8):
+        queue.enqueue('expand_scene', {'n': n})
+
+    lock = threading.Lock()
+    running = []
+    peak = []
+    done = threading.Event()
+
+    def handler(payload):
+        with lock:
+            running.append(payload['n'])
+            peak.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.remove(payload['n'])
+        return {}
+
+    finished = []
+
+    def on_finished(job):
+        with lock:
+            finished.append(job['id'])
+            if len(finished) == 8:
+                done.set()
+
+    runner = JobRunner(queue, {'expand_scene': handler}, on_finished=on_finished, poll_interval=0.05, limiter=limiter)
+    runner.start()
+    try:
+        assert done.wait(5)
+    finally:
+        runner.stop()
+        for thread in runner._threads:
+            thread.join(1)
+
+    # ワーカー数は同時実行数の上限に合わせ、実行枠の数だけ同時に処理する
+    assert len(runner._threads) == 4
+    assert max(peak) == 4
+    assert limiter.in_flight == 0
@@ -0,0 +1,42 @@
+import pytest
+
+from app.utils.json_repair import extract_json_array, extract_json_object, missing_fields, strip_code_fence
+
+
+def test_fenced_object_with_surrounding_text():
+    text = '以下が結果です。\n```json\n{"name": "アリス", "age": 17,}\n```\nご確認ください。'
+    assert extract_json_object(text) == {'name': 'アリス', 'age': 17}
+
+
+def test_truncated_object_is_closed():
+    data = extract_json_object('{"name": "アリス", "profile": "途中で切れた')
+    assert data == {'name': 'アリス', 'profile': '途中で切れた'}
+
+
+def test_raw_newline_and_smart_quotes():
+    data = extract_json_object('{“name”: "アリス", "memo": "一行目\n二行目"}')
+    assert data == {'name': 'アリス', 'memo': '一行目\n二行目'}
+
+
+def test_truncated_array_keeps_complete_items():
+    items = extract_json_array('```json\n[{"name": "A"}, {"name": "B"}, {"name": "C')
+    assert [item['name'] for item in items] == ['A', 'B', 'C']
+
+
+def test_wrapped_array():
+    assert extract_json_array('{"characters": [{"name": "A"}]}') == [{'name': 'A'}]
+
+
+def test_no_json_raises():
+    with pytest.raises(ValueError):
+        extract_json_object('JSONはありません')
+    with pytest.raises(ValueError):
+        extract_json_array('JSONはありません')
+
+
+def test_strip_code_fence_without_fence():
+    assert strip_code_fence('  {"a": 1}  ') == '{"a": 1}'
+
+
+def test_missing_fields_treats_blank_as_missing():
+    assert missing_fields({'name': '', 'role': '主人公'}, ['name', 'role', 'age']) == ['name', 'age']
@@ -0,0 +1,60 @@
+from app.core.backends import FakeBackend, FakeBackendError
+from app.core.gemini_client import GeminiClient
+from app.core.model_fallback import ModelHealth, is_retryable_error, is_throttling_error
+
+from tests.helpers import make_client
+
+
+class StatusError(Exception):
+    def __init__(self, message: str, code: int):
+        super().__init__(message)
+        self.code = code
+
+
+def test_status_codes_match_only_as_whole_numbers():
+    assert is_retryable_error(Exception("503 Service Unavailable"))
+    assert is_throttling_error(Exception("429 Resource exhausted"))
+    assert not is_retryable_error(Exception("invalid id 45003"))
+    assert not is_retryable_error(Exception("took 1500ms"))
+    assert not is_retryable_error(Exception("invalid timeout value"))
+    assert is_retryable_error(Exception("read timeout"))
+
+
+def test_status_code_attribute_wins_over_message():
+    assert not is_retryable_error(StatusError("500 characters is too long", 400))
+    assert is_retryable_error(StatusError("service", 503))
+    assert is_throttling_error(StatusError("slow down", 429))
+
+
+def test_slo_is_checked_against_given_latency():
+    health = ModelHealth(cooldown=60)
+    health.record_success('primary', 100.0, slo=20, slo_seconds=2.0)
+    assert health.order(['primary', 'backup']) == ['primary', 'backup']
+    health.record_success('primary', 5.0, slo=20, slo_seconds=25.0)
+    assert health.order(['primary', 'backup']) == ['backup', 'primary']
+    assert health.get_stats()['primary']['slo_violations'] == 1
+
+
+def test_long_output_does_not_demote_model():
+    # 出力3000文字に1.2秒（1000文字あたり0.4秒）は遅延目標1秒を超えない
+    client = make_client(FakeBackend(first_token_latency=0, chars_per_second=2500, output_chars=3000))
+    client.set_fallback_chain(['backup'], latency_slo={'plot': 1})
+    client._generate('plot', "プロットを作って")
+    assert client.get_model_stats()[client.model_name]['slo_violations'] == 0
+    assert client._model_chain('plot')[0] == client.model_name
+
+
+class FailingPrimary(FakeBackend):
+    def generate(self, model, prompt: str):
+        if model.model_name == 'primary':
+            raise FakeBackendError("503 Service unavailable (fake backend)")
+        return super().generate(model, prompt)
+
+
+def test_retryable_error_falls_back_to_next_model():
+    client = GeminiClient('test-key', model='primary', backend=FailingPrimary(first_token_latency=0, chars_per_second=0))
+    client.set_fallback_chain(['backup'])
+    response = client._generate('plot', "プロットを作って")
+    assert response.text
+    assert client._last_call.model == 'backup'
+    assert client.get_model_stats()['primary']['errors'] == 1
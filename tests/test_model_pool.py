@@ -0,0 +1,54 @@
+"""
+ModelPoolのテスト
+"""
+from app.core.model_pool import ModelPool
+from tests.helpers import make_client
+
+
+def _factory(created):
+    def factory(model_name, generation_config):
+        created.append((model_name, generation_config))
+        return object()
+    return factory
+
+
+def test_same_key_reuses_instance():
+    pool = ModelPool()
+    created = []
+    first = pool.get('model-a', {'temperature': 0.5, 'top_p': 0.9}, _factory(created))
+    second = pool.get('model-a', {'top_p': 0.9, 'temperature': 0.5}, _factory(created))
+    other = pool.get('model-a', {'temperature': 0.7, 'top_p': 0.9}, _factory(created))
+
+    assert first is second
+    assert other is not first
+    assert len(created) == 2
+    assert (pool.hits, pool.misses) == (1, 2)
+
+
+def test_evicts_least_recently_used_and_clears_on_new_credentials():
+    pool = ModelPool(max_size=2)
+    created = []
+    pool.get('a', None, _factory(created))
+    pool.get('b', None, _factory(created))
+    pool.get('a', None, _factory(created))
+    pool.get('c', None, _factory(created))
+    assert len(pool) == 2
+    pool.get('a', None, _factory(created))
+    assert len(created) == 3
+
+    pool.bind_credentials('key-1')
+    assert len(pool) == 0
+    pool.get('a', None, _factory(created))
+    pool.bind_credentials('key-1')
+    assert len(pool) == 1
+
+
+def test_client_reuses_stage_models_across_calls():
+    client = make_client()
+    client.set_generation_profiles({'plot': {'model': 'plot-model', 'temperature': 0.4}})
+    misses = client.model_pool.misses
+
+    first = client._get_model('plot')
+    assert client._get_model('plot') is first
+    assert client._get_model('plot', overrides={'response_mime_type': 'application/json'}) is not first
+    assert client.model_pool.misses == misses + 2
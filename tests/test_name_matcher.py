@@ -0,0 +1,42 @@
+"""
+NameMatcherのテスト
+"""
+from app.utils.name_matcher import NameMatcher, character_patterns
+
+
+def _characters():
+    return [
+        {'id': 'taro', 'name': '山田 太郎（やまだたろう）', 'aliases': 'タロ、若'},
+        {'id': 'hanako', 'name': '山田花子'},
+        {'id': 'john', 'name': 'ジョン・スミス', 'aliases': ['J', 'Johnny']},
+        {'name': 'IDなし'}
+    ]
+
+
+def test_patterns_include_name_parts_and_aliases():
+    patterns = character_patterns(_characters()[0])
+    assert {'山田太郎', '山田', '太郎', 'タロ', '若'} <= patterns
+    assert 'j' not in character_patterns(_characters()[2])
+
+
+def test_select_ranks_by_mentions_then_first_appearance():
+    matcher = NameMatcher(_characters())
+
+    text = 'ＪＯＨＮＮＹが来た。タロと太郎、そしてスミスは港へ向かった。タロは笑った。'
+    assert [char['id'] for char in matcher.select(text)] == ['taro', 'john']
+    assert [char['id'] for char in matcher.select(text, max_characters=1)] == ['taro']
+
+
+def test_longer_match_hides_contained_names():
+    matcher = NameMatcher(_characters())
+
+    # 「山田花子」の「山田」は太郎の姓としては数えない
+    assert set(matcher.find('山田花子が笑った')) == {'hanako'}
+    assert matcher.find('山田が笑った')['taro'] == {'count': 1, 'first': 0}
+    assert matcher.select('誰も登場しない') == []
+
+
+def test_ties_are_broken_by_first_appearance():
+    matcher = NameMatcher(_characters())
+    assert [char['id'] for char in matcher.select('スミスと太郎')] == ['john', 'taro']
+    assert [char['id'] for char in matcher.select('太郎とスミス')] == ['taro', 'john']
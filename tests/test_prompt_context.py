@@ -0,0 +1,72 @@
+from app.core.prompt_context import PromptContextCache
+
+from tests.helpers import make_client
+
+
+def counting_builder(calls):
+    def build(data):
+        calls.append(data)
+        return f"block:{data['name']}"
+    return build
+
+
+def test_blocks_are_reused_until_kind_is_invalidated():
+    cache = PromptContextCache()
+    calls = []
+    build = counting_builder(calls)
+    char = {'id': 'c1', 'name': '春'}
+
+    assert cache.get('character', char, build, 'c1') == "block:春"
+    assert cache.get('character', char, build, 'c1') == "block:春"
+    assert len(calls) == 1 and cache.hits == 1
+
+    # 変更は通知で反映する（取得のたびに内容を比べない）
+    char['name'] = '夏'
+    assert cache.get('character', char, build, 'c1') == "block:春"
+    cache.invalidate('character')
+    assert cache.get('character', char, build, 'c1') == "block:夏"
+    assert len(calls) == 2
+
+
+def test_invalidating_kind_covers_subkinds_and_keeps_other_kinds():
+    cache = PromptContextCache()
+    calls = []
+    build = counting_builder(calls)
+    cache.get('character:condensed', {'name': '秋'}, build, 'c1')
+    cache.get('world', {'name': '王国'}, build)
+
+    cache.invalidate('character')
+    cache.get('character:condensed', {'name': '秋'}, build, 'c1')
+    cache.get('world', {'name': '王国'}, build)
+    assert [data['name'] for data in calls] == ['秋', '王国', '秋']
+
+    cache.invalidate()
+    cache.get('world', {'name': '王国'}, build)
+    assert len(calls) == 4
+
+
+def test_block_built_during_invalidation_is_rebuilt():
+    cache = PromptContextCache()
+    calls = []
+
+    def build(data):
+        calls.append(data)
+        if len(calls) == 1:
+            # 作成中に元データが変わった
+            cache.invalidate('style')
+        return f"block{len(calls)}"
+
+    assert cache.get('style', {}, build) == "block1"
+    assert cache.get('style', {}, build) == "block2"
+    assert cache.get('style', {}, build) == "block2"
+
+
+def test_snapshot_data_is_not_mixed_with_project_blocks():
+    client = make_client()
+    world = {'name': '王国', 'era': '中世'}
+    assert '王国' in client._format_world(world)
+
+    # ジョブの入力（別プロジェクトの写しなど）は内容で識別する
+    with client.snapshot_context():
+        assert '帝国' in client._format_world({'name': '帝国', 'era': '近未来'})
+    assert '王国' in client._format_world(world)
@@ -0,0 +1,71 @@
+from app.core.backends import FakeBackend
+from app.core.repetition import RepetitionDetector
+from app.core.spool import SpoolDirectory
+
+from tests.helpers import ScriptedBackend, ScriptedStream, make_client
+
+
+LOOP = "同じ段落が何度も繰り返されてしまう現象の例文です。"
+
+
+def test_detects_paragraph_loop_and_cuts_at_sentence():
+    intro = "序章の文です。" * 3
+    detector = RepetitionDetector(ngram=20, window=300, ratio=0.8)
+    detected = False
+    text = intro + LOOP * 30
+    for start in range(0, len(text), 40):
+        detected = detector.feed(text[start:start + 40])
+        if detected:
+            break
+    assert detected
+    # 繰り返しの2回目より前（最初の1回は残す）で、文の区切りで切る
+    clean = text[:detector.clean_length()]
+    assert clean == intro + LOOP
+
+
+def test_varied_text_is_not_detected():
+    sentences = [f"{i}番目の出来事について、登場人物はそれぞれ違うことを考えていた。" for i in range(40)]
+    detector = RepetitionDetector()
+    assert not detector.feed(''.join(sentences))
+
+
+def test_short_repeated_phrases_are_allowed():
+    detector = RepetitionDetector()
+    text = ''.join(f"「はい」と{i}人目が答えた。" for i in range(60))
+    assert not detector.feed(text)
+
+
+def test_repetition_is_truncated_and_regenerated(tmp_path):
+    backend = ScriptedBackend([
+        ScriptedStream(["序章の文です。"] + [LOOP] * 40),
+        ScriptedStream(["新しい展開の文。"])
+    ])
+    client = make_client(backend)
+    with client.spool_to(SpoolDirectory(tmp_path).open('scene', key='k')):
+        result = client._generate_text('long', "長編のプロンプト")
+
+    # 繰り返しの前までを残し、そこから続きを生成し直す
+    assert result == "序章の文です。" + LOOP + "新しい展開の文。"
+    assert "【途中まで書かれた本文】\n序章の文です。" + LOOP in backend.prompts[1]
+
+
+def test_repetition_is_regenerated_without_spool_when_hedging():
+    backend = ScriptedBackend([
+        ScriptedStream(["序章の文です。"] + [LOOP] * 40),
+        ScriptedStream(["新しい展開の文。"])
+    ])
+    client = make_client(backend)
+    client.hedger.configure(enabled=True)
+    result = client._generate_text('long', "長編のプロンプト")
+
+    # スプールなしのストリーミングでも繰り返しの前までから続きを生成し直す
+    assert result == "序章の文です。" + LOOP + "新しい展開の文。"
+    assert "【途中まで書かれた本文】\n序章の文です。" + LOOP in backend.prompts[1]
+
+
+def test_fake_long_expansion_is_not_detected_as_repetition(tmp_path):
+    backend = FakeBackend(first_token_latency=0, chars_per_second=0, output_chars=6000)
+    client = make_client(backend)
+    with client.spool_to(SpoolDirectory(tmp_path).open('scene', key='k')):
+        result = client.expand_to_long("中編の本文", "題名", [], {}, {})
+    assert len(result) >= 6000
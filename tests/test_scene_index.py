@@ -0,0 +1,48 @@
+"""
+SceneIndexのテスト
+"""
+from app.core.scene_index import SceneIndex, select_within_budget
+from app.core.token_budget import TokenEstimator
+
+
+def _scenes():
+    return [
+        {'id': 'a', 'title': '港町', 'content': '潮風の吹く港町で、少女は古い灯台守の老人と出会った。'},
+        {'id': 'b', 'title': '森', 'content': '深い森の奥で、騎士は銀色の狼に導かれて泉を見つけた。'},
+        {'id': 'c', 'title': '城', 'content': '王城の大広間では、宰相が密かに反乱の計画を練っていた。'}
+    ]
+
+
+def test_search_finds_related_scene_first():
+    index = SceneIndex(dim=2 ** 12)
+    index.rebuild(_scenes())
+
+    results = index.search('灯台守の老人と港町', top_k=2)
+
+    assert results[0]['scene_id'] == 'a'
+    assert results[0]['title'] == '港町'
+    assert [result['score'] for result in results] == sorted((result['score'] for result in results), reverse=True)
+
+
+def test_update_remove_and_scene_filter():
+    index = SceneIndex(dim=2 ** 12)
+    index.rebuild(_scenes())
+
+    index.update_scene({'id': 'b', 'title': '森', 'content': '騎士は港町の灯台へ向かった。'})
+    assert {result['scene_id'] for result in index.search('灯台', top_k=3)} == {'a', 'b'}
+    assert [result['scene_id'] for result in index.search('灯台', top_k=3, scene_ids={'b'})] == ['b']
+
+    index.remove_scene('a')
+    assert [result['scene_id'] for result in index.search('灯台守の老人', top_k=3)] == ['b']
+    assert index.search('') == []
+
+
+def test_select_within_budget_skips_passages_that_do_not_fit():
+    results = [
+        {'title': '長い', 'text': 'あ' * 200},
+        {'title': '短い', 'text': 'い' * 20}
+    ]
+
+    passages = select_within_budget(results, TokenEstimator(), budget=100)
+
+    assert passages == ["「短い」より\n" + 'い' * 20]
@@ -0,0 +1,64 @@
+"""
+PrioritySchedulerのテスト
+"""
+import threading
+import time
+
+from app.core.scheduler import BACKGROUND, INTERACTIVE, PriorityScheduler
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def test_background_cannot_use_reserved_slots():
+    scheduler = PriorityScheduler(max_concurrent=3, reserved_interactive=1)
+
+    assert scheduler.try_acquire(BACKGROUND) == BACKGROUND
+    assert scheduler.try_acquire(BACKGROUND) == BACKGROUND
+    assert scheduler.try_acquire(BACKGROUND) is None
+    assert scheduler.try_acquire(INTERACTIVE) == INTERACTIVE
+    assert scheduler.try_acquire(INTERACTIVE) is None
+
+    scheduler.release(BACKGROUND)
+    assert scheduler.get_stats()['running'] == {'interactive': 1, 'background': 1}
+
+
+def test_interactive_waiter_runs_before_earlier_background_waiter():
+    scheduler = PriorityScheduler(max_concurrent=1, reserved_interactive=0, aging_seconds=60)
+    held = scheduler.acquire(INTERACTIVE)
+    order = []
+
+    def wait(priority, name):
+        level = scheduler.acquire(priority)
+        order.append(name)
+        scheduler.release(level)
+
+    background = threading.Thread(target=wait, args=(BACKGROUND, 'background'))
+    background.start()
+    _wait_until(lambda: scheduler.get_stats()['waiting'] == 1)
+    interactive = threading.Thread(target=wait, args=(INTERACTIVE, 'interactive'))
+    interactive.start()
+    _wait_until(lambda: scheduler.get_stats()['waiting'] == 2)
+
+    scheduler.release(held)
+    background.join(2)
+    interactive.join(2)
+    assert order == ['interactive', 'background']
+
+
+def test_long_waiting_background_call_is_aged_into_reserved_slot():
+    scheduler = PriorityScheduler(max_concurrent=2, reserved_interactive=1, aging_seconds=0.02)
+    held = scheduler.acquire(BACKGROUND)
+
+    with scheduler.priority(BACKGROUND):
+        assert scheduler.current_priority() == BACKGROUND
+        with scheduler.slot():
+            assert scheduler.get_stats()['running']['background'] == 2
+    assert scheduler.current_priority() == INTERACTIVE
+
+    scheduler.release(held)
+    assert scheduler.get_stats()['aged_grants'] == 1
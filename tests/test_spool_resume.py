@@ -0,0 +1,50 @@
+from app.core.spool import SpoolDirectory
+
+from tests.helpers import ScriptedBackend, ScriptedStream, make_client
+
+
+def test_failed_stream_resumes_from_spooled_text(tmp_path):
+    backend = ScriptedBackend([
+        ScriptedStream(["一つ目の文。", "二つ目の文。", "三つ目の"], fail_after=2),
+        ScriptedStream(["三つ目の文。", "最後の文。"])
+    ])
+    client = make_client(backend)
+    spool = SpoolDirectory(tmp_path).open('scene', key='k')
+
+    with client.spool_to(spool):
+        result = client._generate_text('long', "長編のプロンプト")
+
+    assert result == "一つ目の文。二つ目の文。三つ目の文。最後の文。"
+    # 2回目は途中までの本文の続きを頼む
+    assert "【途中まで書かれた本文】\n一つ目の文。二つ目の文。" in backend.prompts[1]
+
+
+def test_spool_from_previous_run_is_continued(tmp_path):
+    directory = SpoolDirectory(tmp_path)
+    previous = directory.open('scene', key='k')
+    previous.write("前回の本文。")
+    previous.close()
+
+    backend = ScriptedBackend([ScriptedStream(["続きの本文。"])])
+    client = make_client(backend)
+    with client.spool_to(directory.open('scene', key='k')):
+        result = client._generate_text('long', "長編のプロンプト")
+
+    assert result == "前回の本文。続きの本文。"
+    assert len(backend.prompts) == 1 and "前回の本文。" in backend.prompts[0]
+
+
+def test_spool_with_other_key_is_ignored(tmp_path):
+    directory = SpoolDirectory(tmp_path)
+    previous = directory.open('scene', key='old')
+    previous.write("別の入力の本文。")
+    previous.close()
+
+    backend = ScriptedBackend([ScriptedStream(["新しい本文。"])])
+    client = make_client(backend)
+    with client.spool_to(directory.open('scene', key='new')):
+        result = client._generate_text('long', "長編のプロンプト")
+
+    assert result == "新しい本文。"
+    assert "【途中まで書かれた本文】" not in backend.prompts[0]
+
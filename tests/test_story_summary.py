@@ -0,0 +1,59 @@
+"""
+StorySummaryの差分更新のテスト
+"""
+from app.core.story_summary import StorySummary
+
+
+def _scenes(ids):
+    return [{'id': scene_id, 'title': scene_id, 'content': f"{scene_id}の本文"} for scene_id in ids]
+
+
+def _update(summary, data, scenes):
+    calls = []
+
+    def summarize_scene(scene):
+        calls.append(scene['id'])
+        return scene['id']
+
+    def summarize_group(texts):
+        calls.append(texts)
+        return "[" + " ".join(texts) + "]"
+
+    data = summary.update(data, scenes, summarize_scene, summarize_group)
+    return data, calls
+
+
+def _flatten(text):
+    return text.replace("[", " ").replace("]", " ").split()
+
+
+def test_compose_covers_every_scene_once_in_order():
+    summary = StorySummary(fan_out=3)
+    ids = [f"s{i}" for i in range(40)]
+    data, _ = _update(summary, None, _scenes(ids))
+
+    assert _flatten(summary.compose(data, _scenes(ids))) == ids
+    assert _flatten(summary.compose(data, _scenes(ids), before_scene_id="s17")) == ids[:17]
+    # 上位の要約が使われるため、要約の数はシーン数より少ない
+    assert summary.compose(data, _scenes(ids)).count("\n") + 1 < len(ids)
+
+
+def test_insert_and_delete_early_scene_only_recompute_its_path():
+    summary = StorySummary(fan_out=3)
+    ids = [f"s{i}" for i in range(60)]
+    data, first_calls = _update(summary, None, _scenes(ids))
+    levels = sum(1 for call in first_calls if isinstance(call, list))
+    assert levels > 0
+
+    inserted = ids[:2] + ["new"] + ids[2:]
+    data, calls = _update(summary, data, _scenes(inserted))
+    assert "new" in calls
+    # 挿入したシーンとその祖先（区切りで分かれた場合の隣のブロックを含む）だけを作り直す
+    assert summary.last_recomputed <= 8
+    assert _flatten(summary.compose(data, _scenes(inserted))) == inserted
+
+    deleted = ids[:1] + ids[2:]
+    data, calls = _update(summary, data, _scenes(deleted))
+    assert not [call for call in calls if isinstance(call, str)]
+    assert summary.last_recomputed <= 8
+    assert _flatten(summary.compose(data, _scenes(deleted))) == deleted
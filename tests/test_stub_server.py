@@ -0,0 +1,60 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from app.core.gemini_stub_server import GeminiStubServer, LatencyDistribution, StubBehavior
+
+
+@pytest.fixture
+def stub():
+    def start(**settings):
+        settings.setdefault('latency', LatencyDistribution('fixed:0'))
+        server = GeminiStubServer(StubBehavior(chars_per_second=0, **settings), port=0)
+        server.start_background()
+        servers.append(server)
+        return server
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(server, path: str, body):
+    request = urllib.request.Request(
+        server.endpoint + path,
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_generate_is_deterministic(stub):
+    server = stub()
+    body = {'contents': [{'parts': [{'text': "物語を書いて"}]}]}
+    first = post(server, '/v1beta/models/gemini-2.0-flash:generateContent', body)
+    second = post(server, '/v1beta/models/gemini-2.0-flash:generateContent', body)
+    text = first['candidates'][0]['content']['parts'][0]['text']
+    assert text and first == second
+    assert first['usageMetadata']['promptTokenCount'] > 0
+
+
+def test_echo_and_count_tokens(stub):
+    server = stub(mode='echo')
+    body = {'contents': [{'parts': [{'text': "そのまま返して"}]}]}
+    response = post(server, '/v1beta/models/gemini-2.0-flash:generateContent', body)
+    assert response['candidates'][0]['content']['parts'][0]['text'] == "そのまま返して"
+    tokens = post(server, '/v1beta/models/gemini-2.0-flash:countTokens', body)
+    assert tokens['totalTokens'] == 7
+
+
+def test_injected_throttling_returns_429(stub):
+    server = stub(throttle_rate=1.0)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(server, '/v1beta/models/gemini-2.0-flash:generateContent', {'contents': []})
+    assert error.value.code == 429
+    assert server.behavior.get_stats()['throttled'] == 1
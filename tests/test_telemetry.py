@@ -0,0 +1,50 @@
+"""
+TelemetryStoreのテスト
+"""
+from datetime import datetime
+
+from app.core.telemetry import TelemetryStore, percentile
+from tests.helpers import make_client
+
+
+def test_percentile_uses_nearest_rank():
+    assert percentile([], 50) is None
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile(list(range(1, 101)), 95) == 95
+
+
+def test_stage_summary_and_usage(tmp_path):
+    store = TelemetryStore(tmp_path / 'telemetry.db')
+    for latency in (100, 200, 300):
+        store.record(project='a', stage='plot', latency_ms=latency, ttft_ms=latency / 10,
+                     prompt_tokens=10, output_tokens=20, cache_hits=1, cache_misses=1)
+    store.record(project='b', stage='plot', status='error', error='503', retries=2, latency_ms=5000)
+    store.record(project='b', stage='summary', latency_ms=50, prompt_tokens=5, output_tokens=1)
+
+    summary = store.stage_summary()
+    assert summary['plot']['count'] == 4
+    assert summary['plot']['errors'] == 1
+    assert summary['plot']['retries'] == 2
+    assert summary['plot']['p50_ms'] == 200
+    assert summary['plot']['cache_hit_rate'] == 0.5
+    assert summary['summary']['p95_ms'] == 50
+
+    assert store.usage() == {'prompt_tokens': 35, 'output_tokens': 61}
+    assert store.usage(project='a') == {'prompt_tokens': 30, 'output_tokens': 60}
+    assert store.daily_tokens() == [{
+        'day': datetime.now().strftime('%Y-%m-%d'), 'calls': 5, 'errors': 1,
+        'prompt_tokens': 35, 'output_tokens': 61
+    }]
+
+
+def test_client_records_each_call(tmp_path):
+    client = make_client()
+    client.telemetry = TelemetryStore(tmp_path / 'telemetry.db')
+    client.project_key = 'project.json'
+
+    client.generate_plot('港町', '少女が灯台守と出会う', [], {}, {})
+
+    summary = client.telemetry.stage_summary()
+    assert summary['plot']['count'] == 1
+    assert summary['plot']['errors'] == 0
+    assert client.telemetry.usage(project='project.json')['output_tokens'] > 0
@@ -0,0 +1,56 @@
+"""
+TokenBudgeterのテスト
+"""
+from app.core.token_budget import ContextSection, TokenBudgeter, TokenEstimator
+
+
+def _sections():
+    return [
+        ContextSection('style', 'あ' * 100, priority=0, required=True),
+        ContextSection('world', 'い' * 300, priority=1, abbreviated='い' * 50),
+        ContextSection('characters', 'う' * 300, priority=2, abbreviated='う' * 100),
+        ContextSection('previous', 'え' * 200, priority=3)
+    ]
+
+
+def test_estimator_counts_japanese_per_char_and_ascii_per_four_chars():
+    estimator = TokenEstimator()
+    assert estimator.estimate('あいう') == 3
+    assert estimator.estimate('abcdefgh') == 2
+
+
+def test_within_budget_keeps_everything():
+    sections = _sections()
+    result = TokenBudgeter(TokenEstimator()).fit(sections, budget=1000)
+
+    assert result == {'estimated': 900, 'abbreviated': [], 'dropped': []}
+    assert all(section.state == 'full' for section in sections)
+
+
+def test_low_priority_sections_are_abbreviated_before_dropped():
+    sections = _sections()
+    result = TokenBudgeter(TokenEstimator()).fit(sections, budget=700, fixed_tokens=50)
+
+    assert result['abbreviated'] == ['world']
+    assert result['dropped'] == []
+    assert result['estimated'] == 700
+
+
+def test_sections_without_abbreviation_are_dropped_and_required_kept():
+    sections = _sections()
+    result = TokenBudgeter(TokenEstimator()).fit(sections, budget=320)
+
+    assert result['abbreviated'] == []
+    assert result['dropped'] == ['world', 'characters']
+    assert [section.state for section in sections] == ['full', 'dropped', 'dropped', 'full']
+    assert result['estimated'] == 300
+
+    sections = _sections()
+    result = TokenBudgeter(TokenEstimator()).fit(sections, budget=10)
+    assert sections[0].state == 'full'
+    assert result['estimated'] == 100
+
+
+def test_zero_budget_is_unlimited():
+    sections = _sections()
+    assert TokenBudgeter(TokenEstimator()).fit(sections, budget=0)['dropped'] == []
@@ -0,0 +1,72 @@
+import pytest
+
+from app.core.backends import FakeBackend
+from app.core.project_manager import ProjectManager
+from app.core.usage_budget import BudgetExceededError, UsageBudget
+
+from tests.helpers import make_client
+
+
+class CountingBackend(FakeBackend):
+    """生成の呼び出し回数を数えるバックエンド"""
+
+    def __init__(self):
+        super().__init__(first_token_latency=0, chars_per_second=0, output_chars=20)
+        self.calls = 0
+
+    def generate(self, model, prompt: str):
+        self.calls += 1
+        return super().generate(model, prompt)
+
+
+def test_background_calls_are_refused_after_budget_is_used():
+    warnings = []
+    budget = UsageBudget({'daily_token_limit': 100, 'warn_ratios': [0.8]}, on_warning=warnings.append)
+    backend = CountingBackend()
+    client = make_client(backend)
+    client.usage_budget = budget
+
+    budget.record(60, 30)
+    assert len(warnings) == 1 and not budget.exhausted()
+    with client.background():
+        client._generate('summary', "要約して")
+    assert budget.exhausted()
+
+    with client.background():
+        with pytest.raises(BudgetExceededError):
+            client._generate('summary', "要約して")
+    assert backend.calls == 1
+
+    # 画面操作の呼び出しは止めない
+    client._generate('plot', "プロットを作って")
+    assert backend.calls == 2
+
+
+def test_unlimited_budget_never_refuses():
+    budget = UsageBudget({'daily_token_limit': 0})
+    budget.record(10 ** 9, 10 ** 9)
+    assert not budget.exhausted()
+    budget.check_background()
+
+
+def test_project_limit_follows_the_open_project(tmp_path):
+    manager = ProjectManager()
+    manager.create_new_project('作品A', str(tmp_path / 'a.json'))
+    manager.set_budget(100, 0.0)
+    assert ProjectManager().load_project(str(tmp_path / 'a.json'))['budget'] == {'token_limit': 100, 'cost_limit': 0.0}
+
+    budget = UsageBudget({})
+    budget.load(str(tmp_path / 'a.json'), limits=manager.get_budget())
+    budget.record(80, 30)
+    assert budget.exhausted()
+    assert budget.remaining()['project']['tokens'] == 0
+
+    # 別のプロジェクトは自分の上限（未設定は無制限）で数える
+    manager.create_new_project('作品B', str(tmp_path / 'b.json'))
+    budget.load(str(tmp_path / 'b.json'), limits=manager.get_budget())
+    assert not budget.exhausted()
+    assert budget.remaining()['project']['tokens'] is None
+
+    budget.set_project_limits({'token_limit': 50, 'cost_limit': 0.0})
+    budget.record(40, 20)
+    assert budget.exhausted()